@@ -148,6 +148,24 @@ CREATE TABLE conversation_analytics (
 
 CREATE UNIQUE INDEX idx_analytics_agent_date ON conversation_analytics(agent_id, date);
 
+-- ============================================
+-- USAGE LEDGER (hourly cost rollup per model)
+-- ============================================
+-- Maintained at write time by the record_message_usage trigger below so
+-- cost dashboards never have to scan raw messages.
+CREATE TABLE usage_ledger (
+    agent_id UUID NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+    model_used VARCHAR(100) NOT NULL,
+    bucket_hour TIMESTAMP NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+    cost_usd DECIMAL(14, 6) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (agent_id, model_used, bucket_hour)
+);
+
+CREATE INDEX idx_usage_ledger_agent_hour ON usage_ledger(agent_id, bucket_hour);
+
 -- ============================================
 -- EMAIL PROCESSING
 -- ============================================
@@ -164,6 +182,8 @@ CREATE TABLE email_accounts (
     password_encrypted VARCHAR(500) NOT NULL,
     is_active BOOLEAN DEFAULT true,
     last_sync TIMESTAMP,
+    uid_validity BIGINT, -- IMAP UIDVALIDITY of INBOX at last sync
+    last_seen_uid BIGINT DEFAULT 0, -- highest INBOX UID already processed
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -184,6 +204,8 @@ CREATE TABLE email_messages (
     body_html TEXT,
     attachments JSONB,
     status VARCHAR(50) DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'replied', 'ignored', 'failed')),
+    category VARCHAR(50), -- classification result
+    classification_source VARCHAR(20), -- llm, default, headers, reputation, model, thread; only llm rows train the pre-classifier
     ai_response TEXT,
     ai_confidence FLOAT,
     requires_human BOOLEAN DEFAULT false,
@@ -195,6 +217,7 @@ CREATE TABLE email_messages (
 CREATE INDEX idx_email_messages_account ON email_messages(email_account_id);
 CREATE INDEX idx_email_messages_status ON email_messages(status);
 CREATE INDEX idx_email_messages_received ON email_messages(received_at);
+CREATE UNIQUE INDEX idx_email_messages_account_message ON email_messages(email_account_id, message_id);
 
 -- ============================================
 -- DIGITAL HUMANS (Avatars)
@@ -281,6 +304,52 @@ CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
 CREATE TRIGGER update_agents_updated_at BEFORE UPDATE ON agents
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Roll every costed message into its hourly usage_ledger bucket
+CREATE OR REPLACE FUNCTION record_message_usage()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.model_used IS NULL THEN
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO usage_ledger (agent_id, model_used, bucket_hour, requests, tokens_used, cost_usd)
+    SELECT c.agent_id, NEW.model_used, date_trunc('hour', NEW.created_at), 1,
+           COALESCE(NEW.tokens_used, 0), COALESCE(NEW.cost_usd, 0)
+    FROM conversations c
+    WHERE c.id = NEW.conversation_id
+    ON CONFLICT (agent_id, model_used, bucket_hour) DO UPDATE SET
+        requests = usage_ledger.requests + EXCLUDED.requests,
+        tokens_used = usage_ledger.tokens_used + EXCLUDED.tokens_used,
+        cost_usd = usage_ledger.cost_usd + EXCLUDED.cost_usd,
+        updated_at = CURRENT_TIMESTAMP;
+
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER record_messages_usage AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION record_message_usage();
+
+-- Tell orchestrator agent config caches what changed: an agent id, or
+-- user:<id> when an owner's tier changes
+CREATE OR REPLACE FUNCTION notify_agent_config()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        PERFORM pg_notify('agent_config', 'user:' || NEW.id::text);
+    ELSE
+        PERFORM pg_notify('agent_config', COALESCE(NEW.id, OLD.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER notify_agents_config AFTER INSERT OR UPDATE OR DELETE ON agents
+    FOR EACH ROW EXECUTE FUNCTION notify_agent_config();
+
+CREATE TRIGGER notify_users_config AFTER UPDATE OF tier ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_agent_config();
+
 -- Sample data for development
 INSERT INTO users (email, password_hash, full_name, tier) VALUES
     ('demo@aiagent.dev', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5nyvQc9Uj8L8i', 'Demo User', 'pro');
@@ -0,0 +1,278 @@
+"""
+Orchestrator Client
+
+Shared by the digital-human and email-processor services for every call
+to the orchestrator:
+
+- one pooled httpx client per process; keep-alive connections are reused
+  and concurrent calls beyond max_connections wait their turn here
+- chat(), stream_chat() (NDJSON tokens as they are generated) and
+  classify_batch()
+- connection failures and 502/503/504 answers are retried with
+  exponential backoff; a deadline bounds a call across all its attempts
+- in-process mode: when co-deployed with the orchestrator (its "app"
+  package importable), calls go straight to the routing and model-client
+  stack, skipping the HTTP hop
+
+Service images copy this file next to their own modules. To run a
+service from a checkout, put services/common on PYTHONPATH (plus
+services/orchestrator for in-process mode).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+
+# Failures where the orchestrator never started on the request
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+
+
+class OrchestratorError(Exception):
+    """A call failed after its retries, or ran out of deadline"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OrchestratorClient:
+    """Pooled, retrying orchestrator client with an optional in-process path"""
+
+    def __init__(
+        self,
+        base_url: str = "http://orchestrator:8080",
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        retries: int = 2,
+        retry_backoff: float = 0.25,
+        in_process: bool = False
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.in_process = in_process
+        self._connections = asyncio.Semaphore(max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls) -> "OrchestratorClient":
+        return cls(
+            base_url=os.getenv("ORCHESTRATOR_URL", "http://orchestrator:8080"),
+            timeout=float(os.getenv("ORCHESTRATOR_TIMEOUT", "60")),
+            max_connections=int(os.getenv("ORCHESTRATOR_MAX_CONNECTIONS", "100")),
+            retries=int(os.getenv("ORCHESTRATOR_RETRIES", "2")),
+            in_process=os.getenv("ORCHESTRATOR_IN_PROCESS", "false").lower() == "true"
+        )
+
+    async def chat(
+        self,
+        agent_id: str,
+        message: str,
+        visitor_id: str,
+        channel: str = "web",
+        conversation_id: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        deadline: Optional[float] = None
+    ) -> Dict:
+        """Complete reply: response, conversation_id, model_used, confidence, ..."""
+        expires = self._expires(deadline)
+
+        if self.in_process:
+            from app.services.chat_service import generate_reply
+            return await self._local(
+                generate_reply(agent_id, message, conversation_id, channel=channel, visitor_id=visitor_id),
+                expires
+            )
+
+        response = await self._post("/api/v1/chat", {
+            "agent_id": agent_id,
+            "message": message,
+            "visitor_id": visitor_id,
+            "channel": channel,
+            "conversation_id": conversation_id,
+            "metadata": metadata
+        }, expires)
+        return response.json()
+
+    async def stream_chat(
+        self,
+        agent_id: str,
+        message: str,
+        visitor_id: str,
+        channel: str = "web",
+        conversation_id: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Reply tokens as they are generated; only the connect phase is retried"""
+        expires = self._expires(deadline)
+
+        if self.in_process:
+            from app.services.chat_service import stream_reply
+            events = stream_reply(agent_id, message, conversation_id, channel=channel, visitor_id=visitor_id)
+        else:
+            events = self._stream("/api/v1/chat/stream", {
+                "agent_id": agent_id,
+                "message": message,
+                "visitor_id": visitor_id,
+                "channel": channel,
+                "conversation_id": conversation_id,
+                "metadata": metadata
+            }, expires)
+
+        try:
+            while True:
+                try:
+                    event = await self._bounded(events.__anext__(), expires)
+                except StopAsyncIteration:
+                    return
+                except OrchestratorError:
+                    raise
+                except Exception as e:
+                    raise OrchestratorError(f"Orchestrator error: {str(e)}") from e
+                if event.get("error"):
+                    raise OrchestratorError(f"Orchestrator error: {event['error']}")
+                if event.get("token"):
+                    yield event["token"]
+        finally:
+            await events.aclose()
+
+    async def classify_batch(self, emails: List[Dict], deadline: Optional[float] = None) -> List[Dict]:
+        """One result per email (same "id"), each a classification or an "error" """
+        expires = self._expires(deadline)
+
+        if self.in_process:
+            from app.services.email_classifier import get_email_classifier
+            return await self._local(get_email_classifier().classify_many(emails), expires)
+
+        response = await self._post("/api/v1/internal/classify/batch", {"emails": emails}, expires)
+        return response.json()["results"]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def _post(self, path: str, payload: Dict, expires: Optional[float]) -> httpx.Response:
+        async with self._slot(expires):
+            response = await self._send(path, payload, expires, stream=False)
+        return response
+
+    async def _stream(self, path: str, payload: Dict, expires: Optional[float]) -> AsyncIterator[Dict]:
+        async with self._slot(expires):
+            response = await self._send(path, payload, expires, stream=True)
+            try:
+                async for line in response.aiter_lines():
+                    if line:
+                        yield json.loads(line)
+            except httpx.HTTPError as e:
+                raise OrchestratorError(f"Orchestrator stream failed: {str(e)}") from e
+            finally:
+                await response.aclose()
+
+    async def _send(self, path: str, payload: Dict, expires: Optional[float], stream: bool) -> httpx.Response:
+        """POST with retries; returns a 200 response or raises OrchestratorError"""
+        client = self._http()
+        attempt = 0
+
+        while True:
+            request = client.build_request(
+                "POST", f"{self.base_url}{path}", json=payload, timeout=self._timeout(expires)
+            )
+            try:
+                response = await client.send(request, stream=stream)
+                if response.status_code == 200:
+                    return response
+                if stream:
+                    await response.aclose()
+                error = OrchestratorError(f"Orchestrator error: {response.status_code}", response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+            except _RETRY_ERRORS as e:
+                error = OrchestratorError(f"Orchestrator unavailable: {str(e) or type(e).__name__}")
+            except httpx.TimeoutException as e:
+                expired = expires is not None and time.monotonic() >= expires
+                raise OrchestratorError(
+                    "Orchestrator deadline exceeded" if expired else "Orchestrator request timed out"
+                ) from e
+            except httpx.HTTPError as e:
+                # Timed out or failed mid-request: the orchestrator may be generating, don't repeat it
+                raise OrchestratorError(f"Orchestrator request failed: {str(e)}") from e
+
+            attempt += 1
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+            if attempt > self.retries or (expires is not None and time.monotonic() + delay >= expires):
+                raise error
+            logger.warning(f"{error}; retrying {path} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _slot(self, expires: Optional[float]):
+        await self._bounded(self._connections.acquire(), expires)
+        try:
+            yield
+        finally:
+            self._connections.release()
+
+    def _expires(self, deadline: Optional[float]) -> Optional[float]:
+        return time.monotonic() + deadline if deadline is not None else None
+
+    def _remaining(self, expires: Optional[float]) -> Optional[float]:
+        if expires is None:
+            return None
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise OrchestratorError("Orchestrator deadline exceeded")
+        return remaining
+
+    def _timeout(self, expires: Optional[float]) -> float:
+        remaining = self._remaining(expires)
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    async def _bounded(self, awaitable, expires: Optional[float]):
+        """Await within the remaining deadline (in this task, no wrapper task)"""
+        if expires is None:
+            return await awaitable
+        try:
+            remaining = self._remaining(expires)
+        except OrchestratorError:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            async with asyncio.timeout(remaining):
+                return await awaitable
+        except TimeoutError:
+            raise OrchestratorError("Orchestrator deadline exceeded") from None
+
+    async def _local(self, coro, expires: Optional[float]):
+        try:
+            return await self._bounded(coro, expires)
+        except OrchestratorError:
+            raise
+        except Exception as e:
+            raise OrchestratorError(f"Orchestrator error: {str(e)}") from e
+
@@ -0,0 +1,51 @@
+"""
+Audio Codecs
+
+Output formats a client can negotiate for digital-human audio. Each maps
+to an ElevenLabs output_format, so the synthesized bytes are forwarded to
+the client as-is, with no transcoding.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class AudioCodec:
+    name: str
+    output_format: str  # ElevenLabs output_format
+    mime_type: str
+    sample_rate: int
+    bitrate_kbps: int
+
+    def describe(self) -> Dict:
+        return {
+            "codec": self.name,
+            "mime_type": self.mime_type,
+            "sample_rate": self.sample_rate,
+            "bitrate_kbps": self.bitrate_kbps
+        }
+
+
+CODECS: Dict[str, AudioCodec] = {
+    "mp3": AudioCodec("mp3", "mp3_44100_128", "audio/mpeg", 44100, 128),
+    "mp3_low": AudioCodec("mp3_low", "mp3_22050_32", "audio/mpeg", 22050, 32),
+    "opus": AudioCodec("opus", "opus_48000_32", "audio/ogg; codecs=opus", 48000, 32),
+    "pcm": AudioCodec("pcm", "pcm_16000", "audio/L16; rate=16000", 16000, 256),
+}
+
+DEFAULT_CODEC = CODECS["mp3"]
+
+
+def negotiate(offered: Optional[List[str]]) -> AudioCodec:
+    """First codec the client offered that we support, else MP3"""
+    for name in offered or []:
+        codec = CODECS.get(str(name).lower())
+        if codec:
+            return codec
+    return DEFAULT_CODEC
+
+
+def is_concatenable(output_format: str) -> bool:
+    """Formats whose per-sentence audio can be joined into one playable file"""
+    return output_format.startswith(("mp3", "pcm", "ulaw"))
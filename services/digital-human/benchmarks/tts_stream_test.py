@@ -0,0 +1,154 @@
+"""
+Time-to-first-audio benchmark against local stub servers
+
+Starts one local FastAPI stand-in for both the orchestrator and the
+ElevenLabs API:
+
+- the orchestrator streams a reply at --tokens-per-second, and the legacy
+  chat route answers once the whole reply has been generated
+- TTS takes --tts-first-byte seconds to start, then produces audio at
+  --tts-chars-per-second, either streamed or as one response
+
+and answers the same message twice:
+
+- legacy: DigitalHumanManager.process_message (full reply, full MP3)
+- streaming: stream_ai_response through SpeechStream
+
+    python benchmarks/tts_stream_test.py --tokens-per-second 40 --tts-first-byte 0.3
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+from digital_human_service import DigitalHumanManager  # noqa: E402
+from orchestrator_client import OrchestratorClient  # noqa: E402
+
+REPLY = (
+    "Thanks for reaching out about your order. "
+    "I can see it left our warehouse yesterday afternoon and is now with the courier. "
+    "Delivery is expected on Thursday between nine and five. "
+    "You will get a tracking link by email within the next hour. "
+    "If nobody is home, the courier will leave a card with pickup instructions. "
+    "Is there anything else I can help you with today?"
+)
+CHUNK_CHARS = 20  # audio chunk granularity in characters of text
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stub_app(args) -> FastAPI:
+    app = FastAPI()
+    tokens = [word + " " for word in REPLY.split(" ")]
+
+    @app.post("/api/v1/chat/stream")
+    async def chat_stream():
+        async def events():
+            for token in tokens:
+                await asyncio.sleep(1 / args.tokens_per_second)
+                yield f'{{"token": "{token}"}}\n'
+            yield '{"done": true}\n'
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    @app.post("/api/v1/chat")
+    async def chat():
+        await asyncio.sleep(len(tokens) / args.tokens_per_second)
+        return {"response": REPLY}
+
+    def audio_chunk(chars: int) -> bytes:
+        return b"\xff" * (chars * args.bytes_per_char)
+
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def tts_stream(body: dict):
+        text = body["text"]
+
+        async def audio():
+            await asyncio.sleep(args.tts_first_byte)
+            for start in range(0, len(text), CHUNK_CHARS):
+                chars = len(text[start:start + CHUNK_CHARS])
+                await asyncio.sleep(chars / args.tts_chars_per_second)
+                yield audio_chunk(chars)
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def tts(body: dict):
+        text = body["text"]
+        await asyncio.sleep(args.tts_first_byte + len(text) / args.tts_chars_per_second)
+        return Response(audio_chunk(len(text)), media_type="audio/mpeg")
+
+    return app
+
+
+async def run_legacy(manager: DigitalHumanManager) -> dict:
+    started = time.perf_counter()
+    result = await manager.process_message("Where is my order?", "bench-agent", "audio")
+    elapsed = time.perf_counter() - started
+    return {
+        "time_to_first_audio_ms": int(elapsed * 1000),
+        "total_ms": int(elapsed * 1000),
+        "audio_base64_chars": len(result.get("audio", ""))
+    }
+
+
+async def run_streaming(manager: DigitalHumanManager) -> dict:
+    started = time.perf_counter()
+    speech = manager.speech_stream()
+    order = []
+    async for event in speech.stream(manager.stream_ai_response("Where is my order?", "bench-agent")):
+        if not order or order[-1] != event.sequence:
+            order.append(event.sequence)
+    elapsed = time.perf_counter() - started
+    return {
+        "time_to_first_audio_ms": int(speech.time_to_first_audio * 1000),
+        "total_ms": int(elapsed * 1000),
+        "sentences": speech.sentences,
+        "audio_bytes": speech.audio_bytes,
+        "in_order": order == list(range(speech.sentences))
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--tts-first-byte", type=float, default=0.3)
+    parser.add_argument("--tts-chars-per-second", type=float, default=150)
+    parser.add_argument("--bytes-per-char", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # the service module configures INFO
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(stub_app(args), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    try:
+        manager = DigitalHumanManager(OrchestratorClient(f"http://127.0.0.1:{port}"), tts_concurrency=args.concurrency)
+        manager.initialize("bench-key", None, elevenlabs_url=f"http://127.0.0.1:{port}/v1")
+        print({
+            "legacy": await run_legacy(manager),
+            "streaming": await run_streaming(manager)
+        })
+    finally:
+        server.should_exit = True
+        await serving
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
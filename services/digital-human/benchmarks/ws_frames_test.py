@@ -0,0 +1,178 @@
+"""
+WebSocket framing benchmark: base64 JSON audio vs binary frames
+
+Drives the /ws/digital-human handler in-process over a raw ASGI
+connection with stub orchestrator and TTS backends (no network), and
+compares per response:
+
+- legacy: the old loop, process_message with base64 audio sent via send_json
+- binary: a JSON control frame plus the raw audio as a binary frame
+- streamed: sentence frames plus binary audio chunks
+- streamed with each negotiated codec
+
+Reports bytes on the wire (WebSocket payload plus frame headers) and
+server CPU milliseconds per response.
+
+    python benchmarks/ws_frames_test.py --responses 50 --reply-seconds 60
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+import digital_human_service as service  # noqa: E402
+from audio_codecs import CODECS  # noqa: E402
+
+REPLY = (
+    "Thanks for reaching out about your order. "
+    "I can see it left our warehouse yesterday afternoon and is now with the courier. "
+    "Delivery is expected on Thursday between nine and five. "
+    "You will get a tracking link by email within the next hour. "
+    "If nobody is home, the courier will leave a card with pickup instructions. "
+    "Is there anything else I can help you with today?"
+)
+STREAM_CHUNK = 4096
+NOISE = os.urandom(8 * 1024 * 1024)  # stand-in audio, generated once so it does not count as handler CPU
+
+
+class StubVoice:
+    """Returns audio sized for the requested bitrate and reply duration"""
+
+    def __init__(self, reply_seconds: float):
+        self.reply_seconds = reply_seconds
+
+    def _audio(self, text: str, output_format: str) -> bytes:
+        codec = next(c for c in CODECS.values() if c.output_format == output_format)
+        seconds = self.reply_seconds * len(text) / len(REPLY)
+        return NOISE[:int(codec.bitrate_kbps * 125 * seconds)]
+
+    async def text_to_speech(self, text, output_format=service.DEFAULT_CODEC.output_format, **kwargs):
+        return self._audio(text, output_format)
+
+    async def stream_speech(self, text, output_format=service.DEFAULT_CODEC.output_format, **kwargs):
+        audio = self._audio(text, output_format)
+        for start in range(0, len(audio), STREAM_CHUNK):
+            yield audio[start:start + STREAM_CHUNK]
+
+
+async def stub_ai_response(message, agent_id):
+    return REPLY
+
+
+async def stub_stream_ai_response(message, agent_id, visitor_id="digital-human"):
+    for word in REPLY.split(" "):
+        yield word + " "
+
+
+def frame_overhead(length: int) -> int:
+    """Server-to-client WebSocket frame header size (unmasked)"""
+    return 2 if length < 126 else 4 if length < 65536 else 10
+
+
+async def legacy_handler(websocket: WebSocket, agent_id: str):
+    """The pre-binary loop: base64 audio inside one JSON text frame"""
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            response = await service.digital_human.process_message(
+                text=data.get("message", ""),
+                agent_id=agent_id,
+                output_format=data.get("format", "audio")
+            )
+            await websocket.send_json(response)
+    except WebSocketDisconnect:
+        pass
+
+
+async def run(handler, messages, responses: int) -> dict:
+    """One connection; like a real client, sends the next message once the previous reply is complete"""
+    incoming: asyncio.Queue = asyncio.Queue()
+    incoming.put_nowait({"type": "websocket.connect"})
+    pending = list(messages)
+    wire = {"bytes": 0, "frames": 0}
+
+    def send_next():
+        while pending:
+            message = pending.pop(0)
+            incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+            if message.get("type") != "hello":
+                return
+        incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    async def receive():
+        return await incoming.get()
+
+    async def send(message):
+        if message["type"] == "websocket.accept":
+            send_next()
+        elif message["type"] == "websocket.send":
+            payload = message.get("bytes")
+            if payload is None:
+                payload = message["text"].encode("utf-8")
+            wire["bytes"] += len(payload) + frame_overhead(len(payload))
+            wire["frames"] += 1
+            # A reply ends with "done", with the binary audio after a "response", or
+            # (legacy) with its single untyped JSON frame
+            text = message.get("text")
+            if text is None:
+                if wire.pop("awaiting_audio", False):
+                    send_next()
+            elif text.startswith('{"type": "response"'):
+                wire["awaiting_audio"] = True
+            elif text.startswith('{"type": "done"') or not text.startswith('{"type"'):
+                send_next()
+
+    scope = {"type": "websocket", "path": "/ws/digital-human/bench", "headers": [], "query_string": b""}
+    cpu_started = time.process_time()
+    await handler(WebSocket(scope, receive, send), "bench")
+    cpu = time.process_time() - cpu_started
+
+    return {
+        "bytes_per_response": wire["bytes"] // responses,
+        "frames_per_response": wire["frames"] // responses,
+        "cpu_ms_per_response": round(cpu * 1000 / responses, 2)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--responses", type=int, default=50)
+    parser.add_argument("--reply-seconds", type=float, default=60)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # the service module configures INFO
+
+    manager = service.digital_human
+    manager.voice_engine = StubVoice(args.reply_seconds)
+    manager._get_ai_response = stub_ai_response
+    manager.stream_ai_response = stub_stream_ai_response
+
+    # "video" without an avatar engine takes the buffered, non-streamed path
+    buffered = [{"message": "Where is my order?", "format": "video"}] * args.responses
+    streamed = [{"message": "Where is my order?", "format": "audio"}] * args.responses
+
+    results = {
+        "legacy_base64_json": await run(legacy_handler, buffered, args.responses),
+        "binary": await run(service.websocket_digital_human, buffered, args.responses),
+        "streamed": await run(service.websocket_digital_human, streamed, args.responses)
+    }
+    for name in ("opus", "mp3_low"):
+        results[f"streamed_{name}"] = await run(
+            service.websocket_digital_human,
+            [{"type": "hello", "codecs": [name]}] + streamed,
+            args.responses
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
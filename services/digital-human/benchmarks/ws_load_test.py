@@ -0,0 +1,172 @@
+"""
+WebSocket session load test against stub backends
+
+Runs the digital-human service under uvicorn in one process and the stub
+orchestrator and TTS server from tts_stream_test.py in another, then
+opens --sessions concurrent WebSocket sessions from this process. Each session asks two questions back to back (the
+second is queued behind the first); every --barge-in-every'th session
+interrupts its first reply as soon as audio starts.
+
+Reports time to first audio and per-turn latency percentiles, and checks
+that every session saw strictly increasing seq numbers, got each answer
+in order, and that interrupted sessions received no frames of the
+cancelled reply after the interrupted frame. Service memory is the peak
+RSS of its process.
+
+    pip install websockets
+    python benchmarks/ws_load_test.py --sessions 300 --barge-in-every 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import uvicorn
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+import digital_human_service  # noqa: E402
+from orchestrator_client import OrchestratorClient  # noqa: E402
+from tts_stream_test import free_port, stub_app  # noqa: E402
+
+
+async def session(url: str, barge_in: bool) -> dict:
+    result = {"first_audio": None, "turns": [], "ordered": True, "clean_interrupt": True, "errors": 0}
+    last_seq = 0
+    started = time.perf_counter()
+
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"id": "q1", "message": "Where is my order?"}))
+        await ws.send(json.dumps({"id": "q2", "message": "And my refund?"}))
+        expected = ["q2"] if barge_in else ["q1", "q2"]
+        interrupted = False
+
+        while expected:
+            frame = await ws.recv()
+            if isinstance(frame, bytes):
+                if result["first_audio"] is None:
+                    result["first_audio"] = time.perf_counter() - started
+                    if barge_in:
+                        await ws.send(json.dumps({"type": "interrupt"}))
+                        await ws.send(json.dumps({"id": "q3", "message": "Actually, cancel it.", "interrupt": False}))
+                        expected = ["q3"]
+                continue
+
+            event = json.loads(frame)
+            if event["seq"] <= last_seq:
+                result["ordered"] = False
+            last_seq = event["seq"]
+
+            if event["type"] == "interrupted":
+                interrupted = True
+            elif event["type"] in ("error", "response"):
+                result["errors"] += 1
+                break
+            elif interrupted and event.get("request_id") in ("q1", "q2"):
+                result["clean_interrupt"] = False
+            elif event["type"] == "done":
+                if event["request_id"] != expected[0]:
+                    result["ordered"] = False
+                expected.pop(0)
+                result["turns"].append(time.perf_counter() - started)
+
+    return result
+
+
+def serve_stubs(port: int, args):
+    uvicorn.run(stub_app(args), host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_service(port: int, stub_port: int):
+    logging.getLogger().setLevel(logging.WARNING)  # the service module configures INFO
+    # Point the service's manager at the stubs; no TTS cache, every sentence hits the backend
+    manager = digital_human_service.digital_human
+    manager.orchestrator = OrchestratorClient(f"http://127.0.0.1:{stub_port}")
+    manager.initialize("load-test", None, elevenlabs_url=f"http://127.0.0.1:{stub_port}/v1")
+    uvicorn.run(digital_human_service.app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=1 << 20)
+
+
+def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not open")
+
+
+def peak_rss_mb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        return next(int(line.split()[1]) // 1024 for line in f if line.startswith("VmHWM"))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return int(values[min(len(values) - 1, int(len(values) * p))] * 1000) if values else None
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--barge-in-every", type=int, default=4)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--tts-first-byte", type=float, default=0.3)
+    parser.add_argument("--tts-chars-per-second", type=float, default=300)
+    parser.add_argument("--bytes-per-char", type=int, default=100)
+    args = parser.parse_args()
+
+    stub_port, service_port = free_port(), free_port()
+    processes = [
+        multiprocessing.Process(target=serve_stubs, args=(stub_port, args), daemon=True),
+        multiprocessing.Process(target=serve_service, args=(service_port, stub_port), daemon=True)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        wait_for_port(stub_port)
+        wait_for_port(service_port)
+        url = f"ws://127.0.0.1:{service_port}/ws/digital-human/load-test"
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(session(url, args.barge_in_every and i % args.barge_in_every == 0) for i in range(args.sessions)),
+            return_exceptions=True
+        )
+        elapsed = time.perf_counter() - started
+        service_rss = peak_rss_mb(processes[1].pid)
+    finally:
+        for process in processes:
+            process.terminate()
+
+    failed = [r for r in results if isinstance(r, BaseException)]
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    first_audio = [r["first_audio"] for r in ok if r["first_audio"] is not None]
+    turns = [t for r in ok for t in r["turns"]]
+    print(json.dumps({
+        "sessions": args.sessions,
+        "elapsed_s": round(elapsed, 2),
+        "failed_sessions": len(failed),
+        "turn_errors": sum(r["errors"] for r in ok),
+        "first_audio_ms": {"p50": percentile(first_audio, 0.5), "p95": percentile(first_audio, 0.95)},
+        "turn_done_ms": {"p50": percentile(turns, 0.5), "p95": percentile(turns, 0.95)},
+        "all_ordered": all(r["ordered"] for r in ok),
+        "clean_interrupts": all(r["clean_interrupt"] for r in ok),
+        "service_peak_rss_mb": service_rss
+    }, indent=2))
+    if failed:
+        print(repr(failed[0]))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
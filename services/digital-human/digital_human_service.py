@@ -8,19 +8,45 @@ Provides AI-powered digital avatars with:
 - Gesture control
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import httpx
 import asyncio
 import json
 import logging
-from typing import Optional
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
 import base64
 
+from orchestrator_client import OrchestratorClient, OrchestratorError
+from audio_codecs import DEFAULT_CODEC, AudioCodec, is_concatenable, negotiate
+from speech_stream import SpeechStream, split_sentences
+from tts_cache import TtsCache, cache_key
+from video_jobs import VideoJob, VideoJobManager
+from ws_session import DigitalHumanSession
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Digital Human Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Pre-warm the TTS cache in the background while serving"""
+    prewarm = asyncio.create_task(digital_human.prewarm(
+        load_prewarm_phrases(os.getenv("TTS_PREWARM_FILE")),
+        [negotiate([name]) for name in os.getenv("TTS_PREWARM_CODECS", "mp3").split(",")]
+    ))
+    yield
+    prewarm.cancel()
+    if digital_human.video_jobs:
+        await digital_human.video_jobs.close()
+    await digital_human.orchestrator.close()
+
+
+app = FastAPI(title="Digital Human Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,22 +60,75 @@ app.add_middleware(
 class ElevenLabsVoice:
     """ElevenLabs voice synthesis integration"""
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.elevenlabs.io/v1",
+        cache: Optional[TtsCache] = None,
+        max_concurrent: int = 3,
+        max_connections: int = 32
+    ):
         self.api_key = api_key
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = base_url
+        self.cache = cache
+        self.voice_settings = {
+            "stability": 0.5,
+            "similarity_boost": 0.75
+        }
+        self.max_connections = max_connections
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._connections = asyncio.Semaphore(max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
     
     async def text_to_speech(
         self,
         text: str,
         voice_id: str = "21m00Tcm4TlvDq8ikWAM",  # Default voice
-        model_id: str = "eleven_multilingual_v2"
+        model_id: str = "eleven_multilingual_v2",
+        output_format: str = DEFAULT_CODEC.output_format
     ) -> bytes:
         """Convert text to speech audio"""
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
+        if self.cache is None:
+            return await self._synthesize(text, voice_id, model_id, output_format)
+        
+        # Cache per sentence, so partly repeated answers reuse what they can
+        sentences = split_sentences(text) if is_concatenable(output_format) else [text]
+        parts = await asyncio.gather(*(
+            self._cached_synthesize(sentence, voice_id, model_id, output_format)
+            for sentence in sentences
+        ))
+        return b"".join(parts) if all(parts) else b""
+    
+    async def _cached_synthesize(self, text: str, voice_id: str, model_id: str, output_format: str) -> bytes:
+        key = cache_key(text, voice_id, model_id, output_format, self.voice_settings)
+        audio = await self.cache.get(key)
+        if audio is None:
+            async with self._slots:
+                audio = await self._synthesize(text, voice_id, model_id, output_format)
+            await self.cache.put(key, audio)
+        return audio
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        # One pooled client, so concurrent sentences reuse warm connections.
+        # Past max_connections, sentences wait on our semaphore instead of
+        # the httpx pool queue, whose bookkeeping grows with every waiter.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+    
+    async def _synthesize(self, text: str, voice_id: str, model_id: str, output_format: str) -> bytes:
+        try:
+            async with self._connections:
+                response = await self._get_client().post(
                     f"{self.base_url}/text-to-speech/{voice_id}",
+                    params={"output_format": output_format},
                     headers={
                         "xi-api-key": self.api_key,
                         "Content-Type": "application/json"
@@ -57,23 +136,79 @@ class ElevenLabsVoice:
                     json={
                         "text": text,
                         "model_id": model_id,
-                        "voice_settings": {
-                            "stability": 0.5,
-                            "similarity_boost": 0.75
-                        }
-                    },
-                    timeout=30.0
+                        "voice_settings": self.voice_settings
+                    }
                 )
-                
-                if response.status_code == 200:
-                    return response.content
-                else:
-                    logger.error(f"ElevenLabs error: {response.status_code}")
-                    return b""
-                    
-            except Exception as e:
-                logger.error(f"TTS error: {str(e)}")
+            
+            if response.status_code == 200:
+                return response.content
+            else:
+                logger.error(f"ElevenLabs error: {response.status_code}")
                 return b""
+                
+        except Exception as e:
+            logger.error(f"TTS error: {str(e)}")
+            return b""
+    
+    async def stream_speech(
+        self,
+        text: str,
+        voice_id: str = "21m00Tcm4TlvDq8ikWAM",  # Default voice
+        model_id: str = "eleven_multilingual_v2",
+        output_format: str = DEFAULT_CODEC.output_format
+    ) -> AsyncIterator[bytes]:
+        """Stream MP3 audio for text as ElevenLabs produces it"""
+        
+        key = cache_key(text, voice_id, model_id, output_format, self.voice_settings) if self.cache else None
+        if key:
+            audio = await self.cache.get(key)
+            if audio is not None:
+                yield audio
+                return
+        
+        chunks = []
+        async with self._connections, self._get_client().stream(
+            "POST",
+            f"{self.base_url}/text-to-speech/{voice_id}/stream",
+            params={"optimize_streaming_latency": 3, "output_format": output_format},
+            headers={
+                "xi-api-key": self.api_key,
+                "Content-Type": "application/json"
+            },
+            json={
+                "text": text,
+                "model_id": model_id,
+                "voice_settings": self.voice_settings
+            }
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f"ElevenLabs error: {response.status_code}")
+                return
+            async for chunk in response.aiter_bytes():
+                if key:
+                    chunks.append(chunk)
+                yield chunk
+        
+        # Only complete audio is cached; an interrupted stream never gets here
+        if key:
+            await self.cache.put(key, b"".join(chunks))
+    
+    async def prewarm(
+        self,
+        phrases: List[str],
+        voice_id: str = "21m00Tcm4TlvDq8ikWAM",  # Default voice
+        model_id: str = "eleven_multilingual_v2",
+        output_format: str = DEFAULT_CODEC.output_format
+    ) -> int:
+        """Synthesize phrases into the cache, sentence by sentence; returns sentences cached"""
+        if self.cache is None:
+            return 0
+        sentences = {s for phrase in phrases for s in split_sentences(phrase)}
+        parts = await asyncio.gather(*(
+            self._cached_synthesize(sentence, voice_id, model_id, output_format)
+            for sentence in sentences
+        ))
+        return sum(1 for part in parts if part)
 
 
 class HeyGenAvatar:
@@ -82,106 +217,131 @@ class HeyGenAvatar:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.heygen.com/v1"
+        self._client: Optional[httpx.AsyncClient] = None
     
-    async def generate_avatar_video(
+    def _get_client(self) -> httpx.AsyncClient:
+        # Shared by the job poller, which checks many renders on one pool
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=60.0)
+        return self._client
+    
+    async def create_video(
         self,
         text: str,
         avatar_id: str = "default",
         voice_id: str = "default"
     ) -> Optional[str]:
-        """Generate avatar video with speech"""
+        """Start an avatar video render; returns the HeyGen video id"""
         
-        async with httpx.AsyncClient() as client:
-            try:
-                # Create video generation task
-                response = await client.post(
-                    f"{self.base_url}/video.generate",
-                    headers={
-                        "X-Api-Key": self.api_key,
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "video_inputs": [{
-                            "character": {
-                                "type": "avatar",
-                                "avatar_id": avatar_id
-                            },
-                            "voice": {
-                                "type": "text",
-                                "voice_id": voice_id,
-                                "input_text": text
-                            }
-                        }]
-                    },
-                    timeout=60.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    video_id = result.get("data", {}).get("video_id")
-                    
-                    # Poll for completion
-                    video_url = await self._wait_for_video(video_id)
-                    return video_url
-                else:
-                    logger.error(f"HeyGen error: {response.status_code}")
-                    return None
-                    
-            except Exception as e:
-                logger.error(f"Avatar generation error: {str(e)}")
+        try:
+            response = await self._get_client().post(
+                f"{self.base_url}/video.generate",
+                headers={
+                    "X-Api-Key": self.api_key,
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "video_inputs": [{
+                        "character": {
+                            "type": "avatar",
+                            "avatar_id": avatar_id
+                        },
+                        "voice": {
+                            "type": "text",
+                            "voice_id": voice_id,
+                            "input_text": text
+                        }
+                    }]
+                }
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                return result.get("data", {}).get("video_id")
+            else:
+                logger.error(f"HeyGen error: {response.status_code}")
                 return None
+                
+        except Exception as e:
+            logger.error(f"Avatar generation error: {str(e)}")
+            return None
     
-    async def _wait_for_video(self, video_id: str, max_wait: int = 300) -> Optional[str]:
-        """Wait for video generation to complete"""
+    async def get_video_status(self, video_id: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """One status check: (status, video_url, error); status is None if the check failed"""
         
-        async with httpx.AsyncClient() as client:
-            for _ in range(max_wait // 5):  # Check every 5 seconds
-                try:
-                    response = await client.get(
-                        f"{self.base_url}/video_status.get",
-                        headers={"X-Api-Key": self.api_key},
-                        params={"video_id": video_id}
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        status = result.get("data", {}).get("status")
-                        
-                        if status == "completed":
-                            return result.get("data", {}).get("video_url")
-                        elif status == "failed":
-                            logger.error("Video generation failed")
-                            return None
-                    
-                    await asyncio.sleep(5)
-                    
-                except Exception as e:
-                    logger.error(f"Status check error: {str(e)}")
-                    return None
+        try:
+            response = await self._get_client().get(
+                f"{self.base_url}/video_status.get",
+                headers={"X-Api-Key": self.api_key},
+                params={"video_id": video_id},
+                timeout=15.0
+            )
             
-            return None
+            if response.status_code == 200:
+                data = response.json().get("data", {})
+                error = data.get("error")
+                return data.get("status"), data.get("video_url"), str(error) if error else None
+            else:
+                logger.error(f"HeyGen status error: {response.status_code}")
+                return None, None, None
+                
+        except Exception as e:
+            logger.error(f"Status check error: {str(e)}")
+            return None, None, None
 
 
 class DigitalHumanManager:
     """Manages digital human interactions"""
     
-    def __init__(self, orchestrator_url: str):
-        self.orchestrator_url = orchestrator_url
+    def __init__(self, orchestrator: OrchestratorClient, tts_concurrency: int = 3):
+        self.orchestrator = orchestrator
+        self.tts_concurrency = tts_concurrency
         self.voice_engine = None
         self.avatar_engine = None
+        self.video_jobs: Optional[VideoJobManager] = None
     
-    def initialize(self, elevenlabs_key: Optional[str], heygen_key: Optional[str]):
+    def initialize(
+        self,
+        elevenlabs_key: Optional[str],
+        heygen_key: Optional[str],
+        elevenlabs_url: Optional[str] = None,
+        tts_cache: Optional[TtsCache] = None,
+        tts_max_connections: int = 32
+    ):
         """Initialize voice and avatar engines"""
         if elevenlabs_key:
-            self.voice_engine = ElevenLabsVoice(elevenlabs_key)
+            self.voice_engine = ElevenLabsVoice(
+                elevenlabs_key,
+                elevenlabs_url or "https://api.elevenlabs.io/v1",
+                cache=tts_cache,
+                max_concurrent=self.tts_concurrency,
+                max_connections=tts_max_connections
+            )
         if heygen_key:
             self.avatar_engine = HeyGenAvatar(heygen_key)
+            self.video_jobs = VideoJobManager(self.avatar_engine)
+    
+    async def prewarm(self, phrases_by_agent: Dict[str, List[str]], codecs: List[AudioCodec]):
+        """Fill the TTS cache with every agent's configured phrases"""
+        if not self.voice_engine or not self.voice_engine.cache:
+            return
+        
+        for agent_id, phrases in phrases_by_agent.items():
+            for codec in codecs:
+                try:
+                    cached = await self.voice_engine.prewarm(phrases, output_format=codec.output_format)
+                    logger.info(f"Pre-warmed {cached} sentences for agent {agent_id} ({codec.name})")
+                except Exception as e:
+                    logger.error(f"TTS pre-warm error for agent {agent_id}: {str(e)}")
     
     async def process_message(
         self,
         text: str,
         agent_id: str,
-        output_format: str = "audio"  # audio, video, or text
+        output_format: str = "audio",  # audio, video, or text
+        codec: AudioCodec = DEFAULT_CODEC,
+        encode_audio: bool = True,
+        on_video: Optional[Callable[[VideoJob], Awaitable[None]]] = None
     ) -> dict:
         """
         Process message and generate digital human response
@@ -190,6 +350,10 @@ class DigitalHumanManager:
             text: User's input message
             agent_id: The AI agent to use
             output_format: Desired output (audio, video, text)
+            codec: Audio codec to synthesize
+            encode_audio: Base64-encode the audio for JSON; False returns
+                the raw bytes for callers that send binary
+            on_video: Called when the background avatar video finishes
         
         Returns:
             Dict with response data
@@ -208,50 +372,90 @@ class DigitalHumanManager:
         
         # Generate audio
         if output_format in ["audio", "video"] and self.voice_engine:
-            audio_data = await self.voice_engine.text_to_speech(ai_response)
+            audio_data = await self.voice_engine.text_to_speech(
+                ai_response, output_format=codec.output_format
+            )
             if audio_data:
-                response_data["audio"] = base64.b64encode(audio_data).decode('utf-8')
+                response_data["audio"] = base64.b64encode(audio_data).decode('utf-8') if encode_audio else audio_data
         
-        # Generate video (with avatar)
-        if output_format == "video" and self.avatar_engine:
-            video_url = await self.avatar_engine.generate_avatar_video(ai_response)
-            if video_url:
-                response_data["video_url"] = video_url
+        # Generate video (with avatar) as a background job
+        if output_format == "video" and self.video_jobs:
+            job = self.video_jobs.submit(ai_response, listener=on_video)
+            response_data["video_job"] = job.as_dict()
+            if job.video_url:
+                response_data["video_url"] = job.video_url
         
         return response_data
     
-    async def _get_ai_response(self, message: str, agent_id: str) -> Optional[str]:
+    def speech_stream(self, codec: AudioCodec = DEFAULT_CODEC) -> SpeechStream:
+        """Sentence-pipelined TTS for one streamed reply"""
+        return SpeechStream(
+            partial(self.voice_engine.stream_speech, output_format=codec.output_format),
+            max_concurrent=self.tts_concurrency
+        )
+    
+    async def stream_ai_response(
+        self,
+        message: str,
+        agent_id: str,
+        visitor_id: str = "digital-human"
+    ) -> AsyncIterator[str]:
+        """Yield response tokens from the orchestrator as they are generated"""
+        async for token in self.orchestrator.stream_chat(
+            agent_id=agent_id,
+            message=message,
+            visitor_id=visitor_id,
+            channel="digital_human"
+        ):
+            yield token
+    
+    async def _get_ai_response(
+        self,
+        message: str,
+        agent_id: str,
+        visitor_id: str = "digital-human"
+    ) -> Optional[str]:
         """Get response from AI orchestrator"""
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.orchestrator_url}/api/v1/agents/{agent_id}/chat",
-                    json={"message": message},
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "")
-                else:
-                    logger.error(f"Orchestrator error: {response.status_code}")
-                    return None
-                    
-            except Exception as e:
-                logger.error(f"AI response error: {str(e)}")
-                return None
+        try:
+            result = await self.orchestrator.chat(
+                agent_id=agent_id,
+                message=message,
+                visitor_id=visitor_id,
+                channel="digital_human"
+            )
+            return result.get("response", "")
+            
+        except OrchestratorError as e:
+            logger.error(f"AI response error: {str(e)}")
+            return None
+
+
+def load_prewarm_phrases(path: Optional[str]) -> Dict[str, List[str]]:
+    """Phrases to pre-synthesize per agent: {"agent-id": ["Hello! ...", ...]}"""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return {str(agent): list(phrases) for agent, phrases in json.load(f).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.error(f"Could not load TTS pre-warm phrases from {path}: {str(e)}")
+        return {}
 
 
 # Initialize manager
 import os
 digital_human = DigitalHumanManager(
-    orchestrator_url=os.getenv("ORCHESTRATOR_URL", "http://orchestrator:8080")
+    orchestrator=OrchestratorClient.from_env(),
+    tts_concurrency=int(os.getenv("TTS_STREAM_CONCURRENCY", "3"))
 )
 
 digital_human.initialize(
     elevenlabs_key=os.getenv("ELEVENLABS_API_KEY"),
-    heygen_key=os.getenv("HEYGEN_API_KEY")
+    heygen_key=os.getenv("HEYGEN_API_KEY"),
+    elevenlabs_url=os.getenv("ELEVENLABS_API_URL"),
+    tts_cache=TtsCache.from_env() if os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true" else None,
+    tts_max_connections=int(os.getenv("TTS_MAX_CONNECTIONS", "32"))
 )
 
 
@@ -260,15 +464,34 @@ async def health_check():
     return {
         "status": "healthy",
         "voice_engine": digital_human.voice_engine is not None,
-        "avatar_engine": digital_human.avatar_engine is not None
+        "avatar_engine": digital_human.avatar_engine is not None,
+        "tts_cache": digital_human.voice_engine.cache.stats.as_dict()
+        if digital_human.voice_engine and digital_human.voice_engine.cache else None
     }
 
 
+RESPONSE_TEXT_HEADER_LIMIT = 4096  # well under proxy / uvicorn header size limits
+
+
+def _text_header(text: str, limit: int = RESPONSE_TEXT_HEADER_LIMIT) -> Tuple[str, bool]:
+    """Percent-encoded text for a response header, cut to fit; True when cut"""
+    encoded = quote(text)
+    if len(encoded) <= limit:
+        return encoded, False
+    while len(encoded) > limit:
+        text = text[:len(text) * limit // len(encoded)]
+        encoded = quote(text)
+    return encoded, True
+
+
 @app.post("/api/v1/digital-human/generate")
 async def generate_response(
+    request: Request,
     agent_id: str,
     message: str,
-    output_format: str = "audio"
+    output_format: str = "audio",
+    codec: str = "mp3",
+    wait_for_video: bool = False
 ):
     """
     Generate digital human response
@@ -277,46 +500,91 @@ async def generate_response(
         agent_id: Agent ID to use
         message: User message
         output_format: audio, video, or text
+        codec: mp3, mp3_low, opus or pcm
+        wait_for_video: Hold the request until the avatar video is ready
+            instead of returning its job (see /videos/{job_id})
+    
+    Returns JSON with base64 audio, or the raw audio when the client sends
+    an Accept header asking for audio. The text then comes in
+    X-Response-Text, cut to RESPONSE_TEXT_HEADER_LIMIT characters when long
+    (X-Response-Text-Truncated: true); use the JSON response for the full text.
     """
     
+    wants_binary = "audio/" in request.headers.get("accept", "")
+    audio_codec = negotiate([codec])
     result = await digital_human.process_message(
         text=message,
         agent_id=agent_id,
-        output_format=output_format
+        output_format=output_format,
+        codec=audio_codec,
+        encode_audio=not wants_binary
     )
     
+    video_job = result.get("video_job")
+    if wait_for_video and video_job and video_job["status"] not in ("completed", "failed"):
+        job = await digital_human.video_jobs.get(video_job["job_id"]).wait(timeout=600)
+        result["video_job"] = job.as_dict()
+        if job.video_url:
+            result["video_url"] = job.video_url
+    
+    if wants_binary and result.get("audio"):
+        text, truncated = _text_header(result["text"])
+        headers = {"X-Response-Text": text}
+        if truncated:
+            headers["X-Response-Text-Truncated"] = "true"
+        if result.get("video_url"):
+            headers["X-Video-Url"] = result["video_url"]
+        if result.get("video_job"):
+            headers["X-Video-Job"] = result["video_job"]["job_id"]
+        return Response(content=result["audio"], media_type=audio_codec.mime_type, headers=headers)
+    
     return result
 
 
+@app.get("/api/v1/digital-human/videos/{job_id}")
+async def get_video_job(job_id: str):
+    """Status of a background avatar video job"""
+    job = digital_human.video_jobs.get(job_id) if digital_human.video_jobs else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return job.as_dict()
+
+
 @app.websocket("/ws/digital-human/{agent_id}")
 async def websocket_digital_human(websocket: WebSocket, agent_id: str):
     """
     WebSocket endpoint for real-time digital human interaction
+    
+    Protocol: JSON text frames for control, binary frames for audio.
+    Every JSON frame from the server carries a connection-wide "seq" and
+    the "request_id" of the message it answers ("id" if the client sent
+    one). Messages are answered one at a time, in order.
+    
+    - optional {"type": "hello", "codecs": ["opus", "mp3"]} picks the audio
+      codec for the session (default mp3); the server answers with a hello
+      frame naming the codec
+    - audio replies are streamed: for every sentence a {"type": "sentence"}
+      frame followed by its audio chunks as binary frames, in order, then a
+      {"type": "done"} frame with the full text
+    - other replies are one {"type": "response"} frame; when it carries
+      audio_bytes, the audio follows as one binary frame
+    - video replies carry a video_job; a {"type": "video"} frame is pushed
+      when the render finishes, while the socket keeps serving messages
+    - {"type": "interrupt"}, or a message with "interrupt": true, barges
+      in: the reply in flight and queued messages are cancelled, their
+      unsent frames dropped, and an {"type": "interrupted"} frame lists
+      their request_ids
     """
     await websocket.accept()
     
-    try:
-        while True:
-            # Receive message
-            data = await websocket.receive_json()
-            message = data.get("message", "")
-            output_format = data.get("format", "audio")
-            
-            # Process and generate response
-            response = await digital_human.process_message(
-                text=message,
-                agent_id=agent_id,
-                output_format=output_format
-            )
-            
-            # Send back to client
-            await websocket.send_json(response)
-            
-    except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected for agent {agent_id}")
-    except Exception as e:
-        logger.error(f"WebSocket error: {str(e)}")
-        await websocket.send_json({"error": str(e)})
+    session = DigitalHumanSession(
+        websocket,
+        digital_human,
+        agent_id,
+        max_buffered_bytes=int(os.getenv("WS_MAX_BUFFERED_MB", "4")) * 1024 * 1024,
+        max_pending=int(os.getenv("WS_MAX_PENDING", "8"))
+    )
+    await session.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""
+Streaming Speech
+
+Turns a stream of LLM tokens into a stream of audio:
+
+- SentenceSplitter cuts the token stream into sentences as soon as each
+  one is complete
+- SpeechStream hands every finished sentence to a streaming TTS call
+  (a few sentences synthesize concurrently) and yields the audio chunks
+  strictly in sentence order, so the first sentence is already playing
+  while the rest of the reply is still being generated
+"""
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+_ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "vs.", "etc.", "e.g.", "i.e."}
+
+
+class SentenceSplitter:
+    """Incremental sentence boundary detection over streamed tokens"""
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 300):
+        self.min_chars = min_chars  # shorter sentences are merged with the next
+        self.max_chars = max_chars  # longer run-ons are cut at a comma or space
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[str]:
+        """Add a token; returns the sentences it completed"""
+        self._buffer += token
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            last_word = self._buffer[start:match.start() + 1].rsplit(None, 1)[-1:]
+            if len(sentence) < self.min_chars or (last_word and last_word[0].lower() in _ABBREVIATIONS):
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+
+        while len(self._buffer) > self.max_chars:
+            cut = self._buffer.rfind(", ", 0, self.max_chars)
+            if cut < self.min_chars:
+                cut = self._buffer.rfind(" ", 0, self.max_chars)
+            if cut < self.min_chars:
+                cut = self.max_chars - 1
+            sentences.append(self._buffer[:cut + 1].strip())
+            self._buffer = self._buffer[cut + 1:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left once the token stream has ended"""
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Sentences of a complete text, cut the same way as a token stream"""
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = splitter.feed(text)
+    rest = splitter.flush()
+    return sentences + [rest] if rest else sentences
+
+
+@dataclass
+class SpeechEvent:
+    type: str  # "sentence" (before its audio) or "audio"
+    sequence: int
+    text: str = ""
+    audio: bytes = b""
+
+
+class SpeechStream:
+    """Sentence-pipelined TTS over a token stream, one instance per reply"""
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], AsyncIterator[bytes]],
+        max_concurrent: int = 3,
+        min_sentence_chars: int = 20
+    ):
+        self.synthesize = synthesize
+        self.max_concurrent = max_concurrent
+        self.min_sentence_chars = min_sentence_chars
+        self.text = ""
+        self.sentences = 0
+        self.audio_bytes = 0
+        self.time_to_first_audio: Optional[float] = None
+
+    async def stream(self, tokens: AsyncIterator[str]) -> AsyncIterator[SpeechEvent]:
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(self.max_concurrent)
+        ordered: asyncio.Queue = asyncio.Queue()  # (sequence, text, chunk queue), None at the end
+        tasks = []
+        parts = []
+
+        async def synthesize(text: str, chunks: asyncio.Queue):
+            try:
+                async with slots:
+                    async for chunk in self.synthesize(text):
+                        if chunk:
+                            chunks.put_nowait(chunk)
+            except Exception as e:
+                logger.error(f"TTS error: {str(e)}")
+            finally:
+                chunks.put_nowait(None)
+
+        def start(text: str):
+            chunks: asyncio.Queue = asyncio.Queue()
+            tasks.append(asyncio.create_task(synthesize(text, chunks)))
+            ordered.put_nowait((self.sentences, text, chunks))
+            self.sentences += 1
+
+        async def produce():
+            splitter = SentenceSplitter(min_chars=self.min_sentence_chars)
+            try:
+                async for token in tokens:
+                    parts.append(token)
+                    for sentence in splitter.feed(token):
+                        start(sentence)
+                rest = splitter.flush()
+                if rest:
+                    start(rest)
+            finally:
+                self.text = "".join(parts)
+                ordered.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await ordered.get()
+                if item is None:
+                    break
+                sequence, text, chunks = item
+                yield SpeechEvent("sentence", sequence, text=text)
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    if self.time_to_first_audio is None:
+                        self.time_to_first_audio = time.perf_counter() - started
+                    self.audio_bytes += len(chunk)
+                    yield SpeechEvent("audio", sequence, audio=chunk)
+            await producer  # surfaces token stream errors
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
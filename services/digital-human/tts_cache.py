@@ -0,0 +1,177 @@
+"""
+TTS Audio Cache
+
+Content-addressed cache for synthesized speech, keyed on everything that
+changes the audio: voice, model, output format, voice settings and the
+normalized text. Two tiers:
+
+- memory: LRU bounded by total bytes
+- disk: one file per entry, evicted least-recently-used first once the
+  directory exceeds its size budget; survives restarts
+
+Entries are normally single sentences, so answers that only partly repeat
+(same greeting, same disclaimer) still hit for the repeated sentences.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace- and Unicode-normalized text; case is kept, it changes pronunciation"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text: str, voice_id: str, model_id: str, output_format: str, voice_settings: Dict) -> str:
+    material = json.dumps(
+        [voice_id, model_id, output_format, voice_settings, normalize_text(text)],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions
+        }
+
+
+class TtsCache:
+    """Two-tier (memory LRU + disk) audio cache"""
+
+    def __init__(
+        self,
+        memory_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_bytes: int = 1024 * 1024 * 1024
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest access first
+        self._disk_size = 0
+        if self._disk_dir:
+            self._load_disk_index()
+
+    @classmethod
+    def from_env(cls) -> "TtsCache":
+        return cls(
+            memory_bytes=int(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+            disk_dir=os.getenv("TTS_CACHE_DIR", "/tmp/digital-human-tts") or None,
+            disk_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "1024")) * 1024 * 1024
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.stats.memory_hits += 1
+            return audio
+
+        if key in self._disk:
+            try:
+                audio = await asyncio.to_thread(self._path(key).read_bytes)
+            except OSError:
+                self._forget_disk(key)
+            else:
+                self._disk.move_to_end(key)
+                self._remember(key, audio)
+                self.stats.disk_hits += 1
+                return audio
+
+        self.stats.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        self.stats.stores += 1
+        self._remember(key, audio)
+        if self._disk_dir and key not in self._disk:
+            try:
+                await asyncio.to_thread(self._write, key, audio)
+            except OSError as e:
+                logger.warning(f"TTS cache write failed: {str(e)}")
+                return
+            self._disk[key] = len(audio)
+            self._disk_size += len(audio)
+            await self._evict_disk()
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes // 4:
+            return  # one long reply should not flush the whole tier
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.stats.evictions += 1
+
+    def _path(self, key: str) -> Path:
+        return self._disk_dir / f"{key}.audio"
+
+    def _write(self, key: str, audio: bytes):
+        self._disk_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._disk_dir / f".{key}.tmp"
+        tmp.write_bytes(audio)
+        os.replace(tmp, self._path(key))
+
+    async def _evict_disk(self):
+        victims = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            victims.append(self._path(key))
+            self.stats.evictions += 1
+        if victims:
+            await asyncio.to_thread(lambda: [p.unlink(missing_ok=True) for p in victims])
+
+    def _forget_disk(self, key: str):
+        self._disk_size -= self._disk.pop(key, 0)
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU from the files left by a previous run"""
+        try:
+            files = sorted(self._disk_dir.glob("*.audio"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return
+        for path in files:
+            size = path.stat().st_size
+            self._disk[path.stem] = size
+            self._disk_size += size
+        if self._disk:
+            logger.info(f"TTS cache: {len(self._disk)} entries ({self._disk_size} bytes) on disk")
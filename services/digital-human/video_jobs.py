@@ -0,0 +1,227 @@
+"""
+Avatar Video Jobs
+
+HeyGen renders take from tens of seconds to minutes, so video generation
+runs as a background job instead of inside the request:
+
+- submit() starts the render and returns a job immediately; identical
+  requests already rendering share one job
+- a single poller task checks every pending render, each on its own
+  adaptive interval (short at first, backing off while it keeps rendering)
+- listeners (e.g. a WebSocket session) are called when a job finishes, and
+  job status can be read at any time by id
+- finished video URLs are cached per (avatar, voice, text), so repeated
+  answers never render twice
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tts_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[["VideoJob"], Awaitable[None]]
+
+
+@dataclass
+class VideoJob:
+    id: str
+    key: Tuple[str, str, str]  # (avatar_id, voice_id, normalized text)
+    status: str = "queued"  # queued, processing, completed, failed
+    video_id: Optional[str] = None
+    video_url: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    interval: float = 0.0
+    next_check: float = 0.0
+    listeners: List[Listener] = field(default_factory=list)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "video_url": self.video_url,
+            "error": self.error,
+            "cached": self.cached,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+    async def wait(self, timeout: Optional[float] = None) -> "VideoJob":
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self
+
+
+class VideoJobManager:
+    """Background avatar renders with one shared, adaptive status poller"""
+
+    def __init__(
+        self,
+        avatar,
+        initial_interval: float = 2.0,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        timeout: float = 600.0,
+        max_concurrent_checks: int = 8,
+        max_jobs: int = 10000,
+        url_cache_size: int = 1000,
+        url_ttl: float = 24 * 3600
+    ):
+        self.avatar = avatar
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.url_cache_size = url_cache_size
+        self.url_ttl = url_ttl
+        self.status_checks = 0
+        self._checks = asyncio.Semaphore(max_concurrent_checks)
+        self._jobs: "OrderedDict[str, VideoJob]" = OrderedDict()
+        self._rendering: Dict[Tuple[str, str, str], VideoJob] = {}
+        self._polling: Dict[str, VideoJob] = {}
+        self._urls: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._tasks = set()
+        self._poller: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        return self._jobs.get(job_id)
+
+    def submit(
+        self,
+        text: str,
+        avatar_id: str = "default",
+        voice_id: str = "default",
+        listener: Optional[Listener] = None
+    ) -> VideoJob:
+        """Start (or join) a render; listener is called when a pending job finishes"""
+        key = (avatar_id, voice_id, normalize_text(text))
+
+        rendering = self._rendering.get(key)
+        if rendering:
+            if listener:
+                rendering.listeners.append(listener)
+            return rendering
+
+        job = VideoJob(id=uuid.uuid4().hex, key=key)
+        self._remember(job)
+
+        url = self._cached_url(key)
+        if url:
+            job.status, job.video_url, job.cached = "completed", url, True
+            job.finished_at = time.time()
+            job.done.set()
+            return job
+
+        if listener:
+            job.listeners.append(listener)
+        self._rendering[key] = job
+        self._spawn(self._start(job, text, avatar_id, voice_id))
+        return job
+
+    async def close(self):
+        for task in list(self._tasks) + ([self._poller] if self._poller else []):
+            task.cancel()
+
+    async def _start(self, job: VideoJob, text: str, avatar_id: str, voice_id: str):
+        video_id = await self.avatar.create_video(text, avatar_id, voice_id)
+        if not video_id:
+            self._finish(job, "failed", error="video generation request failed")
+            return
+
+        job.video_id = video_id
+        job.status = "processing"
+        job.interval = self.initial_interval
+        job.next_check = time.monotonic() + job.interval
+        self._polling[job.id] = job
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        self._wake.set()
+
+    async def _poll(self):
+        """One loop for every pending render; sleeps until the next one is due"""
+        while self._polling:
+            now = time.monotonic()
+            due = [job for job in self._polling.values() if job.next_check <= now]
+            if due:
+                await asyncio.gather(*(self._check(job) for job in due))
+                continue
+
+            self._wake.clear()
+            next_check = min(job.next_check for job in self._polling.values())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=next_check - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, job: VideoJob):
+        async with self._checks:
+            self.status_checks += 1
+            status, url, error = await self.avatar.get_video_status(job.video_id)
+
+        if status == "completed" and url:
+            self._finish(job, "completed", url=url)
+        elif status == "failed":
+            self._finish(job, "failed", error=error or "video generation failed")
+        elif time.time() - job.created_at > self.timeout:
+            self._finish(job, "failed", error="video generation timed out")
+        else:
+            # Still rendering (or a transient status error): back off
+            job.interval = min(job.interval * self.backoff, self.max_interval)
+            job.next_check = time.monotonic() + job.interval
+
+    def _finish(self, job: VideoJob, status: str, url: Optional[str] = None, error: Optional[str] = None):
+        job.status, job.video_url, job.error = status, url, error
+        job.finished_at = time.time()
+        self._polling.pop(job.id, None)
+        self._rendering.pop(job.key, None)
+        if url:
+            self._urls[job.key] = (url, time.monotonic())
+            self._urls.move_to_end(job.key)
+            while len(self._urls) > self.url_cache_size:
+                self._urls.popitem(last=False)
+        job.done.set()
+
+        for listener in job.listeners:
+            self._spawn(self._notify(listener, job))
+        job.listeners = []
+
+    async def _notify(self, listener: Listener, job: VideoJob):
+        try:
+            await listener(job)
+        except Exception as e:
+            logger.warning(f"Video job listener failed for {job.id}: {str(e)}")
+
+    def _cached_url(self, key: Tuple[str, str, str]) -> Optional[str]:
+        entry = self._urls.get(key)
+        if not entry:
+            return None
+        url, stored_at = entry
+        if time.monotonic() - stored_at > self.url_ttl:
+            del self._urls[key]
+            return None
+        self._urls.move_to_end(key)
+        return url
+
+    def _remember(self, job: VideoJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,255 @@
+"""
+Digital Human WebSocket Session
+
+One session per connection, split into three tasks so receiving never
+waits on generation and generation never waits on a slow client:
+
+- reader: parses incoming frames and queues utterances in the per-session
+  work queue; an interrupt (barge-in) cancels the reply in flight, drops
+  queued work and purges its not-yet-sent frames
+- worker: answers queued utterances one at a time, in arrival order
+- writer: sends outgoing frames in order; every JSON frame gets a
+  connection-wide "seq" and the "request_id" of the utterance it answers
+
+Outgoing frames wait in a buffer bounded by max_buffered_bytes: when a
+client reads slower than audio is produced, the reply pauses instead of
+growing memory without limit.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from audio_codecs import DEFAULT_CODEC, negotiate
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[Dict, bytes]
+
+_CONTROL_FRAME_BYTES = 256  # rough size of a JSON control frame without its text
+
+
+def _frame_size(frame: Frame) -> int:
+    if isinstance(frame, bytes):
+        return len(frame)
+    return _CONTROL_FRAME_BYTES + len(frame.get("text") or "")
+
+
+class _Outbox:
+    """Ordered outgoing frames, bounded by bytes, purgeable per request"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.closed = False
+        self._frames: Deque[Tuple[Optional[str], Frame, int]] = deque()
+        self._changed = asyncio.Condition()
+
+    async def put(self, request_id: Optional[str], frame: Frame):
+        size = _frame_size(frame)
+        async with self._changed:
+            # An oversized frame still goes through once everything before it is sent
+            await self._changed.wait_for(
+                lambda: self.closed or not self._frames or self.size + size <= self.max_bytes
+            )
+            if self.closed:
+                return
+            self._frames.append((request_id, frame, size))
+            self.size += size
+            self._changed.notify_all()
+
+    async def get(self) -> Optional[Frame]:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.closed or self._frames)
+            if not self._frames:
+                return None
+            _, frame, size = self._frames.popleft()
+            self.size -= size
+            self._changed.notify_all()
+            return frame
+
+    async def purge(self, request_id: str):
+        async with self._changed:
+            kept = deque(f for f in self._frames if f[0] != request_id)
+            self.size = sum(f[2] for f in kept)
+            self._frames = kept
+            self._changed.notify_all()
+
+    async def close(self):
+        async with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+
+class DigitalHumanSession:
+    """Reader / worker / writer tasks for one /ws/digital-human connection"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        manager,
+        agent_id: str,
+        max_buffered_bytes: int = 4 * 1024 * 1024,
+        max_pending: int = 8
+    ):
+        self.websocket = websocket
+        self.manager = manager
+        self.agent_id = agent_id
+        self.codec = DEFAULT_CODEC
+        self._outbox = _Outbox(max_buffered_bytes)
+        self._work: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._ids = itertools.count(1)
+        self._seq = itertools.count(1)
+        self._current: Optional[asyncio.Task] = None
+        self._current_id: Optional[str] = None
+        self._cancelled = set()
+
+    async def run(self):
+        reader = asyncio.create_task(self._read())
+        writer = asyncio.create_task(self._write())
+        worker = asyncio.create_task(self._serve())
+        try:
+            # Ends when the client disconnects (reader) or stops accepting frames (writer)
+            await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (reader, worker, self._current):
+                if task:
+                    task.cancel()
+            await self._outbox.close()
+            await asyncio.gather(reader, worker, writer, return_exceptions=True)
+
+    async def send(self, frame: Frame, request_id: Optional[str] = None):
+        if request_id in self._cancelled:
+            return
+        await self._outbox.put(request_id, frame)
+
+    async def _read(self):
+        try:
+            while True:
+                data = await self.websocket.receive_json()
+                kind = data.get("type")
+
+                if kind == "hello":
+                    self.codec = negotiate(data.get("codecs"))
+                    await self.send({"type": "hello", **self.codec.describe()})
+                    continue
+
+                if kind == "interrupt" or data.get("interrupt"):
+                    await self._interrupt()
+                    if kind == "interrupt":
+                        continue
+
+                request_id = str(data.get("id") or f"r{next(self._ids)}")
+                try:
+                    self._work.put_nowait((request_id, data))
+                except asyncio.QueueFull:
+                    await self.send({
+                        "type": "error",
+                        "request_id": request_id,
+                        "error": "too many pending messages"
+                    })
+
+        except WebSocketDisconnect:
+            logger.info(f"WebSocket disconnected for agent {self.agent_id}")
+
+    async def _interrupt(self):
+        """Barge-in: stop the reply being spoken and everything queued behind it"""
+        dropped = []
+        while not self._work.empty():
+            dropped.append(self._work.get_nowait()[0])
+        current = self._current_id
+        if self._current and not self._current.done():
+            self._current.cancel()
+            dropped.append(current)
+
+        for request_id in dropped:
+            self._cancelled.add(request_id)
+            await self._outbox.purge(request_id)
+        if dropped:
+            await self._outbox.put(None, {"type": "interrupted", "request_ids": dropped})
+
+    async def _serve(self):
+        while True:
+            request_id, data = await self._work.get()
+            self._current_id = request_id
+            self._current = asyncio.create_task(self._respond(request_id, data))
+            try:
+                await self._current
+            except asyncio.CancelledError:
+                if request_id not in self._cancelled:
+                    raise  # the session itself is shutting down
+            except Exception as e:
+                logger.error(f"WebSocket error: {str(e)}")
+                await self.send({"type": "error", "request_id": request_id, "error": str(e)}, request_id)
+            finally:
+                self._current = None
+                self._current_id = None
+
+    async def _respond(self, request_id: str, data: Dict):
+        message = data.get("message", "")
+        output_format = data.get("format", "audio")
+        manager = self.manager
+
+        if output_format == "audio" and manager.voice_engine:
+            speech = manager.speech_stream(self.codec)
+            tokens = manager.stream_ai_response(
+                message, self.agent_id, visitor_id=data.get("visitor_id", "digital-human")
+            )
+            async for event in speech.stream(tokens):
+                if event.type == "sentence":
+                    await self.send({
+                        "type": "sentence",
+                        "request_id": request_id,
+                        "sequence": event.sequence,
+                        "text": event.text
+                    }, request_id)
+                else:
+                    await self.send(event.audio, request_id)
+
+            first_audio = speech.time_to_first_audio
+            await self.send({
+                "type": "done",
+                "request_id": request_id,
+                "text": speech.text,
+                "format": output_format,
+                "time_to_first_audio_ms": int(first_audio * 1000) if first_audio is not None else None
+            }, request_id)
+            return
+
+        async def push_video(job):
+            await self.send({"type": "video", "request_id": request_id, **job.as_dict()}, request_id)
+
+        response = await manager.process_message(
+            text=message,
+            agent_id=self.agent_id,
+            output_format=output_format,
+            codec=self.codec,
+            encode_audio=False,
+            on_video=push_video
+        )
+
+        # Control frame, then the raw audio
+        audio = response.pop("audio", None)
+        if audio:
+            response["audio_bytes"] = len(audio)
+        await self.send({"type": "response", "request_id": request_id, **response}, request_id)
+        if audio:
+            await self.send(audio, request_id)
+
+    async def _write(self):
+        try:
+            while True:
+                frame = await self._outbox.get()
+                if frame is None:
+                    return
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(json.dumps({**frame, "seq": next(self._seq)}))
+        except Exception as e:
+            logger.info(f"WebSocket send failed for agent {self.agent_id}: {str(e)}")
@@ -0,0 +1,310 @@
+"""
+Multi-Account Scheduler
+
+Runs one persistent ImapSession per active email account under shared
+limits:
+
+- accounts are loaded from the email_accounts table and refreshed
+  periodically; sessions are started, stopped or restarted to match
+- a global semaphore caps how many accounts connect at once (no login
+  storm on startup) and another caps how many sync concurrently; each
+  account's own pipeline limits still apply inside its sync
+- with several processes, accounts are sharded by consistent hashing so
+  adding a shard only moves ~1/N of the accounts
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from imap_session import ImapSession, MailboxState
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# SHARDING
+# ============================================
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Maps keys to nodes with virtual nodes for an even spread"""
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        self._ring: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in self._ring]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+@dataclass
+class ShardAssignment:
+    """Which slice of the accounts this process owns"""
+    index: int = 0
+    count: int = 1
+
+    def __post_init__(self):
+        self._ring = ConsistentHashRing([f"shard-{i}" for i in range(self.count)])
+
+    def owns(self, account_id: str) -> bool:
+        return self.count <= 1 or self._ring.node_for(account_id) == f"shard-{self.index}"
+
+    @classmethod
+    def from_env(cls) -> "ShardAssignment":
+        import os
+
+        return cls(
+            index=int(os.getenv("EMAIL_SHARD_INDEX", "0")),
+            count=int(os.getenv("EMAIL_SHARD_COUNT", "1"))
+        )
+
+
+# ============================================
+# DATABASE
+# ============================================
+
+class AccountRepository:
+    """Loads email accounts and persists mailbox sync state in Postgres"""
+
+    def __init__(self, database_url: str, encryption_key: Optional[str], account_factory: Callable):
+        self.database_url = database_url
+        self.fernet = None
+        if encryption_key:
+            from cryptography.fernet import Fernet
+            self.fernet = Fernet(encryption_key)
+        self.account_factory = account_factory
+        self.pool = None
+
+    async def connect(self):
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=5)
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+
+    async def load_active_accounts(self) -> List:
+        rows = await self.pool.fetch(
+            """
+            SELECT id, agent_id, email_address, imap_host, imap_port, smtp_host,
+                   smtp_port, username, password_encrypted
+            FROM email_accounts
+            WHERE is_active = true
+            """
+        )
+        accounts = []
+        for row in rows:
+            try:
+                password = self._decrypt(row["password_encrypted"])
+            except Exception as e:
+                logger.error(f"Cannot decrypt password for account {row['id']}: {str(e)}")
+                continue
+            accounts.append(self.account_factory(
+                email_address=row["email_address"],
+                imap_host=row["imap_host"],
+                imap_port=row["imap_port"],
+                smtp_host=row["smtp_host"],
+                smtp_port=row["smtp_port"],
+                username=row["username"],
+                password=password,
+                agent_id=str(row["agent_id"]) if row["agent_id"] else None,
+                account_id=str(row["id"])
+            ))
+        return accounts
+
+    def _decrypt(self, value: str) -> str:
+        if not self.fernet:
+            return value
+        return self.fernet.decrypt(value.encode()).decode()
+
+    async def load_training_examples(self, limit: int = 20000) -> List[Dict]:
+        """Most recent LLM-classified emails, for training the local pre-classifier"""
+        rows = await self.pool.fetch(
+            """
+            SELECT from_address, subject, LEFT(body_text, 500) AS body_text,
+                   COALESCE(attachments, '[]'::jsonb) <> '[]'::jsonb AS has_attachments,
+                   category
+            FROM email_messages
+            WHERE category IS NOT NULL AND classification_source = 'llm'
+            ORDER BY received_at DESC
+            LIMIT $1
+            """,
+            limit
+        )
+        return [dict(row) for row in rows]
+
+    async def record_classification(self, account_id: str, email_data: Dict, classification: Dict):
+        """Store a classified inbound email in email_messages"""
+        if not email_data.get("message_id"):
+            return
+
+        category = classification.get("category")
+        if category in ("spam", "newsletter", "auto_reply"):
+            status = "ignored"
+        elif classification.get("requires_human"):
+            status = "pending"
+        else:
+            status = "processing"
+
+        received_at = email_data.get("date") or datetime.utcnow()
+        if received_at.tzinfo:
+            received_at = received_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+        try:
+            await self.pool.execute(
+                """
+                INSERT INTO email_messages (
+                    email_account_id, message_id, thread_id, from_address, to_addresses,
+                    cc_addresses, subject, body_text, attachments, status, category,
+                    classification_source, ai_confidence, requires_human, received_at
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9::jsonb, $10, $11, $12, $13, $14, $15)
+                ON CONFLICT (email_account_id, message_id) DO NOTHING
+                """,
+                account_id,
+                email_data["message_id"],
+                email_data.get("thread_id"),
+                email_data.get("from_address") or "",
+                email_data.get("to_addresses") or [],
+                email_data.get("cc_addresses") or [],
+                (email_data.get("subject") or "")[:500],
+                email_data.get("body_text"),
+                json.dumps(email_data.get("attachments") or []),
+                status,
+                category,
+                classification.get("source"),
+                classification.get("confidence"),
+                bool(classification.get("requires_human")),
+                received_at
+            )
+        except Exception as e:
+            logger.error(f"Failed to record email {email_data['message_id']}: {str(e)}")
+
+    # MailboxStateStore interface, keyed by email_accounts.id
+
+    async def load(self, account_key: str) -> MailboxState:
+        row = await self.pool.fetchrow(
+            "SELECT uid_validity, last_seen_uid FROM email_accounts WHERE id = $1",
+            account_key
+        )
+        if not row or row["uid_validity"] is None:
+            return MailboxState()
+        return MailboxState(uid_validity=row["uid_validity"], last_seen_uid=row["last_seen_uid"] or 0)
+
+    async def save(self, account_key: str, state: MailboxState):
+        await self.pool.execute(
+            """
+            UPDATE email_accounts
+            SET uid_validity = $2, last_seen_uid = $3, last_sync = CURRENT_TIMESTAMP
+            WHERE id = $1
+            """,
+            account_key, state.uid_validity, state.last_seen_uid
+        )
+
+
+# ============================================
+# SCHEDULER
+# ============================================
+
+def _fingerprint(account) -> Tuple:
+    """Fields whose change requires reconnecting the account"""
+    return (
+        account.imap_host, account.imap_port, account.smtp_host, account.smtp_port,
+        account.username, account.password, account.agent_id
+    )
+
+
+class AccountScheduler:
+    """
+    Keeps an ImapSession running for every owned, active account
+
+    session_factory(account, connect_limiter, sync_limiter) builds the
+    session; account_source() returns the current list of active accounts.
+    """
+
+    def __init__(
+        self,
+        account_source: Callable[[], Awaitable[List]],
+        session_factory: Callable[..., ImapSession],
+        shard: Optional[ShardAssignment] = None,
+        max_concurrent_connects: int = 20,
+        max_concurrent_syncs: int = 50,
+        refresh_interval: float = 60.0
+    ):
+        self.account_source = account_source
+        self.session_factory = session_factory
+        self.shard = shard or ShardAssignment()
+        self.connect_limiter = asyncio.Semaphore(max_concurrent_connects)
+        self.sync_limiter = asyncio.Semaphore(max_concurrent_syncs)
+        self.refresh_interval = refresh_interval
+        self.sessions: Dict[str, Tuple[ImapSession, asyncio.Task, Tuple]] = {}
+        self._stopped = asyncio.Event()
+
+    async def run(self):
+        """Rebalance on every refresh until stopped"""
+        try:
+            while not self._stopped.is_set():
+                try:
+                    await self.rebalance()
+                except Exception as e:
+                    logger.error(f"Account refresh failed, keeping current sessions: {str(e)}")
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.refresh_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def rebalance(self):
+        """Start, stop or restart sessions to match the active account list"""
+        accounts = await self.account_source()
+        owned = {a.account_id: a for a in accounts if self.shard.owns(a.account_id)}
+
+        removed = [key for key in self.sessions if key not in owned]
+        changed = [
+            key for key, account in owned.items()
+            if key in self.sessions and self.sessions[key][2] != _fingerprint(account)
+        ]
+        for key in removed + changed:
+            await self._stop_session(key)
+
+        added = [key for key in owned if key not in self.sessions]
+        for key in added:
+            self._start_session(owned[key])
+
+        if removed or changed or added:
+            logger.info(
+                f"Shard {self.shard.index}/{self.shard.count}: {len(self.sessions)} accounts "
+                f"(+{len(added)} -{len(removed)} ~{len(changed)})"
+            )
+
+    def _start_session(self, account):
+        session = self.session_factory(account, self.connect_limiter, self.sync_limiter)
+        task = asyncio.create_task(session.run(), name=f"imap-{account.account_id}")
+        self.sessions[account.account_id] = (session, task, _fingerprint(account))
+
+    async def _stop_session(self, key: str):
+        session, task, _ = self.sessions.pop(key)
+        session.stop()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def shutdown(self):
+        for key in list(self.sessions):
+            await self._stop_session(key)
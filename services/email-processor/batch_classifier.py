@@ -0,0 +1,120 @@
+"""
+Batched Classification Client
+
+Coalesces concurrent classify calls from the pipeline's classify stage
+(across all accounts sharing the instance) into requests to the
+orchestrator's /api/v1/internal/classify/batch endpoint. A batch is sent
+when max_batch emails are waiting or max_wait has passed since the first.
+Each email resolves to its own classification, or None when the
+orchestrator reported an error for it or the request failed.
+"""
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from orchestrator_client import OrchestratorClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Pending:
+    id: str
+    email: Dict
+    result: asyncio.Future
+
+
+class BatchClassifier:
+    """Micro-batching client for orchestrator email classification"""
+
+    def __init__(
+        self,
+        orchestrator: OrchestratorClient,
+        max_batch: int = 16,
+        max_wait: float = 0.05,
+        timeout: float = 60.0,
+        body_chars: int = 500
+    ):
+        self.orchestrator = orchestrator
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.body_chars = body_chars
+        self.requests = 0
+        self.classified = 0
+        self._ids = itertools.count()
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def classify(self, email_data: Dict) -> Optional[Dict]:
+        loop = asyncio.get_running_loop()
+        pending = _Pending(str(next(self._ids)), email_data, loop.create_future())
+        self._pending.append(pending)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await pending.result
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.classified / self.requests if self.requests else 0.0
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _send(self, batch: List[_Pending]):
+        results: Dict[str, Dict] = {}
+        try:
+            response = await self.orchestrator.classify_batch(
+                [
+                    {
+                        "id": p.id,
+                        "from_address": p.email.get("from_address") or "",
+                        "subject": p.email.get("subject") or "",
+                        "body_text": (p.email.get("body_text") or "")[:self.body_chars]
+                    }
+                    for p in batch
+                ],
+                deadline=self.timeout
+            )
+            self.requests += 1
+            self.classified += len(batch)
+            results = {r["id"]: r for r in response}
+
+        except Exception as e:
+            logger.error(f"Classification error: {str(e)}")
+
+        for pending in batch:
+            result = results.get(pending.id)
+            if result and result.get("error"):
+                logger.warning(f"Classification failed for {pending.email.get('message_id')}: {result['error']}")
+                result = None
+            if not pending.result.done():
+                pending.result.set_result(
+                    {k: v for k, v in result.items() if k not in ("id", "error")} if result else None
+                )
+
+    async def close(self):
+        while self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,111 @@
+"""
+HTML extraction benchmark
+
+Generates heavy marketing-style HTML emails (inline CSS, nested layout
+tables, tracking pixels) and compares, per email:
+
+- legacy: html2text on the event loop, as parsing used to do
+- fast path: fast_text for the classifier prefix on the loop, full_text
+  in the worker pool (as response generation does)
+
+A ticker coroutine measures the longest event-loop stall in each mode.
+
+    python benchmarks/html_extract_test.py --emails 50 --blocks 400
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from html2text import html2text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import CLASSIFIER_CHARS, fast_text, full_text, shutdown  # noqa: E402
+
+
+def build_html(index: int, blocks: int) -> str:
+    style = "<style>" + "".join(f".c{i}{{color:#{i:06x};padding:{i % 9}px}}" for i in range(300)) + "</style>"
+    rows = "".join(
+        f'<tr><td class="c{i % 300}" style="font-family:Arial;font-size:14px">'
+        f'<table><tr><td><a href="https://example.com/p/{i}?utm=email{index}">'
+        f'<img src="https://example.com/i/{i}.png" width="120" alt="Product {i}"></a></td>'
+        f'<td><h3>Deal {i}</h3><p>Save {i % 70}% on item {i} &amp; more &mdash; limited time.</p></td></tr></table>'
+        f"</td></tr>"
+        for i in range(blocks)
+    )
+    return (
+        f"<html><head><title>Newsletter {index}</title>{style}</head><body>"
+        f'<img src="https://track.example.com/{index}.gif" width="1" height="1">'
+        f"<table width=\"100%\">{rows}</table></body></html>"
+    )
+
+
+class StallMeter:
+    """Records the longest gap between ticks of a 1ms ticker"""
+
+    def __init__(self):
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _tick(self):
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            self.max_stall = max(self.max_stall, now - last - 0.001)
+            last = now
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def legacy(documents):
+    for html in documents:
+        html2text(html)[:CLASSIFIER_CHARS]
+        await asyncio.sleep(0)
+
+
+async def fast_path(documents):
+    for html in documents:
+        fast_text(html)
+        await asyncio.sleep(0)
+    await asyncio.gather(*(full_text(html) for html in documents))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--blocks", type=int, default=400, help="product blocks per email")
+    args = parser.parse_args()
+
+    documents = [build_html(i, args.blocks) for i in range(args.emails)]
+    await full_text(documents[0])  # start the worker pool outside the measurement
+
+    started = time.perf_counter()
+    for html in documents:
+        fast_text(html)
+    classify_prefix_ms = (time.perf_counter() - started) / len(documents) * 1000
+
+    for label, run in (("legacy", legacy), ("fast_path", fast_path)):
+        started = time.perf_counter()
+        with StallMeter() as meter:
+            await run(documents)
+        print({
+            "mode": label,
+            "html_kb": round(len(documents[0]) / 1024),
+            "total_s": round(time.perf_counter() - started, 2),
+            "max_loop_stall_ms": round(meter.max_stall * 1000, 1)
+        })
+    print({"fast_text_ms_per_email": round(classify_prefix_ms, 2)})
+    shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+MIME parsing memory benchmark
+
+Builds a corpus of messages that each carry a large base64 attachment
+(25MB by default) next to a short text/HTML body, writes them to disk, and
+parses every message twice:
+
+- legacy: the whole message read into memory, email.message_from_bytes and
+  get_payload(decode=True) on every part (the old _parse_email)
+- streaming: the message fed to StreamingMimeParser in chunk_size pieces,
+  as _fetch_email_by_id does with partial FETCHes
+
+Reports peak traced Python memory per message and parse time.
+
+    python benchmarks/mime_memory_test.py --messages 5 --attachment-mb 25
+"""
+
+import argparse
+import email
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+from email_processor import EmailProcessor  # noqa: E402
+from mime_stream import ParserLimits, StreamingMimeParser  # noqa: E402
+
+
+def build_message(index: int, attachment_mb: int) -> bytes:
+    msg = MIMEMultipart("mixed")
+    msg["From"] = f"customer{index}@example.com"
+    msg["To"] = "support@example.com"
+    msg["Subject"] = f"Invoice {index}"
+    msg["Message-ID"] = f"<mime-{index}@example.com>"
+    msg["Date"] = "Mon, 01 Jan 2024 10:00:00 +0000"
+
+    body = MIMEMultipart("alternative")
+    body.attach(MIMEText(f"Please see the attached invoice {index}.", "plain"))
+    body.attach(MIMEText(f"<p>Please see the attached invoice {index}.</p>", "html"))
+    msg.attach(body)
+
+    attachment = MIMEApplication(os.urandom(attachment_mb * 1024 * 1024), "pdf")
+    attachment.add_header("Content-Disposition", "attachment", filename=f"invoice-{index}.pdf")
+    msg.attach(attachment)
+    return msg.as_bytes()
+
+
+def parse_legacy(path: str) -> int:
+    with open(path, "rb") as f:
+        msg = email.message_from_bytes(f.read())
+    size = 0
+    for part in msg.walk():
+        if part.get_content_maintype() == "multipart":
+            continue
+        payload = part.get_payload(decode=True)
+        if part.get_filename():
+            size += len(payload)
+    return size
+
+
+def parse_streaming(path: str, processor: EmailProcessor) -> int:
+    limits = processor.mime_limits
+    parser = StreamingMimeParser(limits)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(limits.chunk_size), b""):
+            parser.feed(chunk)
+    email_data = processor._email_data_from_stream(path, parser.close())
+    return sum(a["size"] for a in email_data["attachments"])
+
+
+def measure(label, paths, parse):
+    peaks, sizes = [], []
+    started = time.perf_counter()
+    for path in paths:
+        tracemalloc.start()
+        sizes.append(parse(path))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        "parser": label,
+        "peak_mb_per_message": round(max(peaks) / 1024 / 1024, 1),
+        "ms_per_message": round(elapsed / len(paths) * 1000, 1),
+        "attachment_mb_reported": round(sizes[0] / 1024 / 1024, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--attachment-mb", type=int, default=25)
+    args = parser.parse_args()
+
+    processor = EmailProcessor(mime_limits=ParserLimits(max_attachment_bytes=(args.attachment_mb + 1) * 1024 * 1024))
+
+    with tempfile.TemporaryDirectory() as corpus:
+        paths = []
+        for i in range(args.messages):
+            path = os.path.join(corpus, f"{i}.eml")
+            with open(path, "wb") as f:
+                f.write(build_message(i, args.attachment_mb))
+            paths.append(path)
+
+        print(measure("legacy", paths, parse_legacy))
+        print(measure("streaming", paths, lambda path: parse_streaming(path, processor)))
+
+
+if __name__ == "__main__":
+    main()
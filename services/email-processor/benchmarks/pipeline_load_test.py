@@ -0,0 +1,183 @@
+"""
+Email pipeline load test
+
+Drives EmailProcessor.process_inbox against in-process IMAP/SMTP stand-ins
+and stub classify/generate calls with realistic latencies, and reports
+emails per minute for a sequential run versus the staged pipeline.
+
+    python benchmarks/pipeline_load_test.py --emails 300
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from email.mime.text import MIMEText
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+from email_pipeline import PipelineConfig  # noqa: E402
+from email_processor import EmailAccount, EmailProcessor  # noqa: E402
+
+
+class StandInIMAP:
+    """Minimal aioimaplib look-alike serving a generated text/plain mailbox"""
+
+    def __init__(self, messages: List[bytes], latency: float):
+        self.messages = messages
+        self.latency = latency
+        self.round_trips = 0
+
+    async def search(self, *criteria):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        ids = b" ".join(str(i).encode() for i in range(1, len(self.messages) + 1))
+        return ("OK", [ids, b"SEARCH completed"])
+
+    async def fetch(self, message_set: str, parts: str):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        lines = []
+        for seq in self._expand(message_set):
+            raw = self.messages[seq - 1]
+            header, _, body = raw.partition(b"\n\n")
+            header += b"\n\n"
+            if "BODYSTRUCTURE" in parts:
+                structure = b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" %d 1 NIL NIL NIL)' % len(body)
+                lines.append(b"%d FETCH (UID %d RFC822.SIZE %d BODYSTRUCTURE %s BODY[HEADER] {%d}"
+                             % (seq, seq, len(raw), structure, len(header)))
+                lines.append(bytearray(header))
+            elif "BODY.PEEK[1]" in parts:
+                lines.append(b"%d FETCH (BODY[1] {%d}" % (seq, len(body)))
+                lines.append(bytearray(body))
+            else:
+                lines.append(b"%d FETCH (RFC822 {%d}" % (seq, len(raw)))
+                lines.append(bytearray(raw))
+            lines.append(b")")
+        lines.append(b"FETCH completed")
+        return ("OK", lines)
+
+    async def store(self, message_set: str, *flags):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        return ("OK", [b"STORE completed"])
+
+    async def logout(self):
+        return ("OK", [])
+
+    @staticmethod
+    def _expand(message_set: str) -> List[int]:
+        ids = []
+        for chunk in message_set.split(","):
+            start, _, end = chunk.partition(":")
+            ids.extend(range(int(start), int(end or start) + 1))
+        return ids
+
+
+class StandInSMTP:
+    """Records outbound replies after a simulated send latency"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent: List[Dict] = []
+
+    async def send(self, account, to_address, subject, body, in_reply_to=None) -> bool:
+        await asyncio.sleep(self.latency)
+        self.sent.append({"to": to_address, "subject": subject, "in_reply_to": in_reply_to})
+        return True
+
+
+def build_mailbox(count: int, senders: int) -> List[bytes]:
+    """Generate `count` plain-text messages spread across `senders` senders"""
+    messages = []
+    for i in range(count):
+        msg = MIMEText(f"Hello, I have a question about order #{i}. " * 5)
+        msg["From"] = f"customer{i % senders}@example.com"
+        msg["To"] = "support@example.com"
+        msg["Subject"] = f"Order {i}"
+        msg["Message-ID"] = f"<load-{i}@example.com>"
+        msg["Date"] = "Mon, 01 Jan 2024 10:00:00 +0000"
+        messages.append(msg.as_bytes())
+    return messages
+
+
+async def run_once(args, config: PipelineConfig) -> Dict:
+    imap = StandInIMAP(build_mailbox(args.emails, args.senders), args.imap_latency)
+    smtp = StandInSMTP(args.smtp_latency)
+    processor = EmailProcessor(pipeline_config=config)
+
+    async def connect_imap(account):
+        processor.imap_client = imap
+        return True
+
+    async def classify_email(email_data):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * args.classify_latency)
+        return {
+            "category": "general_inquiry",
+            "sentiment": "neutral",
+            "requires_human": False,
+            "priority": "medium",
+            "confidence": 0.9
+        }
+
+    async def generate_response(email_data, classification, agent_id):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * args.generate_latency)
+        return "Thanks for reaching out!"
+
+    processor.connect_imap = connect_imap
+    processor.classify_email = classify_email
+    processor.generate_response = generate_response
+    processor.send_email = smtp.send
+
+    account = EmailAccount(
+        email_address="support@example.com",
+        imap_host="localhost",
+        imap_port=993,
+        smtp_host="localhost",
+        smtp_port=587,
+        username="support",
+        password="secret",
+        agent_id="load-test"
+    )
+
+    started = time.perf_counter()
+    await processor.process_inbox(account)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "emails_per_minute": round(args.emails / elapsed * 60, 1),
+        "imap_round_trips": imap.round_trips,
+        "replies_sent": len(smtp.sent)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=300)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--imap-latency", type=float, default=0.005)
+    parser.add_argument("--classify-latency", type=float, default=0.2)
+    parser.add_argument("--generate-latency", type=float, default=0.5)
+    parser.add_argument("--smtp-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    sequential = PipelineConfig(
+        fetch_concurrency=1,
+        parse_concurrency=1,
+        classify_concurrency=1,
+        generate_concurrency=1,
+        send_concurrency=1
+    )
+
+    for label, config in [("sequential", sequential), ("pipeline", PipelineConfig.from_env())]:
+        result = await run_once(args, config)
+        print(f"{label:>10}: {result}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,185 @@
+"""
+Multi-account scheduler load test
+
+Runs AccountScheduler over N mock accounts on one node. Every account gets
+an in-process IMAP stand-in (no IDLE, so sessions poll over their
+persistent connection) with a few unread emails. The test reports how long
+it takes for every account to connect and finish its first sync,
+processed emails per minute, and peak RSS. It exits non-zero if any
+session logged an error, since a failing session just reconnects and the
+numbers would then measure that loop instead.
+
+    python benchmarks/scheduler_load_test.py --accounts 1000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from account_scheduler import AccountScheduler, ShardAssignment  # noqa: E402
+from email_pipeline import PipelineConfig  # noqa: E402
+from email_processor import EmailAccount, EmailProcessor  # noqa: E402
+from imap_session import ImapSession, MailboxState  # noqa: E402
+from pipeline_load_test import StandInIMAP, build_mailbox  # noqa: E402
+
+
+class StandInMailbox(StandInIMAP):
+    """Stand-in that also answers the UID commands used by ImapSession"""
+
+    class protocol:
+        capabilities = set()  # no IDLE: exercise the polling fallback
+
+    async def uid_search(self, *criteria):
+        await asyncio.sleep(self.latency)
+        self.round_trips += 1
+        low = int(criteria[-1].split(":")[0]) if len(criteria) > 1 else 1
+        uids = [i for i in range(1, len(self.messages) + 1) if i >= low] or [len(self.messages)]
+        return ("OK", [b" ".join(str(i).encode() for i in uids)])
+
+    async def uid(self, command, *args):
+        if command == "fetch":
+            return await self.fetch(*args)
+        if command == "store":
+            return await self.store(*args)
+        raise ValueError(f"unsupported UID command: {command}")
+
+    async def noop(self):
+        await asyncio.sleep(self.latency)
+        return ("OK", [])
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR records logged anywhere during the run"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+        self.first: Optional[str] = None
+
+    def emit(self, record):
+        self.count += 1
+        if self.first is None:
+            self.first = record.getMessage()
+
+
+class MemoryStateStore:
+    def __init__(self):
+        self.states: Dict[str, MailboxState] = {}
+
+    async def load(self, account_key):
+        return self.states.get(account_key, MailboxState())
+
+    async def save(self, account_key, state):
+        self.states[account_key] = MailboxState(state.uid_validity, state.last_seen_uid)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--emails-per-account", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="per IMAP/orchestrator/SMTP call")
+    parser.add_argument("--max-connects", type=int, default=50)
+    parser.add_argument("--max-syncs", type=int, default=100)
+    args = parser.parse_args()
+
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    accounts = [
+        EmailAccount(
+            email_address=f"support{i}@example.com",
+            imap_host="localhost",
+            imap_port=993,
+            smtp_host="localhost",
+            smtp_port=587,
+            username=f"support{i}",
+            password="secret",
+            agent_id=f"agent-{i}",
+            account_id=f"account-{i}"
+        )
+        for i in range(args.accounts)
+    ]
+    store = MemoryStateStore()
+    sent = []
+
+    async def account_source():
+        return accounts
+
+    def session_factory(account, connect_limiter, sync_limiter):
+        processor = EmailProcessor(pipeline_config=PipelineConfig())
+        mailbox = StandInMailbox(build_mailbox(args.emails_per_account, 2), args.latency)
+
+        async def connect_imap(acc):
+            await asyncio.sleep(args.latency * 3)  # hello + login + select
+            processor.imap_client = mailbox
+            processor.mailbox_status = {"UIDVALIDITY": 1}
+            return True
+
+        async def classify_email(email_data):
+            await asyncio.sleep(args.latency)
+            return {"category": "general_inquiry", "sentiment": "neutral",
+                    "requires_human": False, "priority": "low", "confidence": 0.9}
+
+        async def generate_response(email_data, classification, agent_id):
+            await asyncio.sleep(args.latency)
+            return "Thanks!"
+
+        async def send_email(acc, to_address, subject, body, in_reply_to=None):
+            await asyncio.sleep(args.latency)
+            sent.append(to_address)
+            return True
+
+        processor.connect_imap = connect_imap
+        processor.classify_email = classify_email
+        processor.generate_response = generate_response
+        processor.send_email = send_email
+
+        return ImapSession(processor, account, store, poll_interval=30,
+                           connect_limiter=connect_limiter, sync_limiter=sync_limiter)
+
+    scheduler = AccountScheduler(
+        account_source,
+        session_factory,
+        shard=ShardAssignment(),
+        max_concurrent_connects=args.max_connects,
+        max_concurrent_syncs=args.max_syncs,
+        refresh_interval=3600
+    )
+
+    expected = args.accounts * args.emails_per_account
+    started = time.perf_counter()
+    runner = asyncio.create_task(scheduler.run())
+    while len(sent) < expected and time.perf_counter() - started < 600:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+
+    scheduler.stop()
+    await runner
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print({
+        "accounts": args.accounts,
+        "emails_processed": len(sent),
+        "all_synced_s": round(elapsed, 2),
+        "emails_per_minute": round(len(sent) / elapsed * 60, 1),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "errors": errors.count
+    })
+
+    if errors.count:
+        print(f"{errors.count} errors logged, first: {errors.first}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
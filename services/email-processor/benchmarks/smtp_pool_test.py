@@ -0,0 +1,153 @@
+"""
+SMTP pool benchmark against a local aiosmtpd server
+
+Starts an aiosmtpd stand-in (AUTH PLAIN/LOGIN without TLS, optional random
+451 replies) and sends N replies twice:
+
+- per message: connect, login, send, quit (the old send_email)
+- pooled: EmailProcessor.send_email through the account's OutboundQueue
+
+Reports messages per second, connections opened, messages per connection,
+retries and whether every message arrived exactly once.
+
+    pip install aiosmtpd
+    python benchmarks/smtp_pool_test.py --messages 500 --transient-failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import sys
+import time
+from email.mime.text import MIMEText
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common"))
+
+from email_processor import EmailAccount, EmailProcessor  # noqa: E402
+from smtp_pool import SmtpPoolConfig  # noqa: E402
+
+
+class StandInHandler:
+    """Records delivered subjects; rejects a fraction of DATA with 451"""
+
+    def __init__(self, failure_rate: float):
+        self.failure_rate = failure_rate
+        self.received = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if random.random() < self.failure_rate:
+            return "451 4.3.0 Try again later"
+        subject = next(
+            (line[9:] for line in envelope.content.decode().splitlines() if line.startswith("Subject: ")),
+            ""
+        )
+        self.received.append(subject)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def authenticator(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+async def send_per_message(account: EmailAccount, count: int):
+    for i in range(count):
+        msg = MIMEText("Thanks!")
+        msg["From"] = account.email_address
+        msg["To"] = f"customer{i}@example.com"
+        msg["Subject"] = f"legacy-{i}"
+        for attempt in range(4):
+            try:
+                async with aiosmtplib.SMTP(hostname=account.smtp_host, port=account.smtp_port) as smtp:
+                    await smtp.login(account.username, account.password)
+                    await smtp.send_message(msg)
+                break
+            except aiosmtplib.SMTPResponseException:
+                continue
+
+
+async def send_pooled(processor: EmailProcessor, account: EmailAccount, count: int, concurrency: int):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with limiter:
+            await processor.send_email(account, f"customer{i}@example.com", f"pooled-{i}", "Thanks!")
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4, help="pipeline send stage concurrency")
+    parser.add_argument("--transient-failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    handler = StandInHandler(args.transient_failure_rate)
+    controller = Controller(
+        handler, hostname="127.0.0.1", port=free_port(),
+        authenticator=authenticator, auth_require_tls=False
+    )
+    controller.start()
+    account = EmailAccount(
+        email_address="support@example.com",
+        imap_host="127.0.0.1",
+        imap_port=993,
+        smtp_host="127.0.0.1",
+        smtp_port=controller.port,
+        username="support",
+        password="secret",
+        agent_id="bench"
+    )
+
+    try:
+        started = time.perf_counter()
+        await send_per_message(account, args.messages)
+        legacy_elapsed = time.perf_counter() - started
+        legacy_connections = handler.connections
+
+        processor = EmailProcessor(smtp_config=SmtpPoolConfig(retry_backoff=0.01))
+        started = time.perf_counter()
+        await send_pooled(processor, account, args.messages, args.concurrency)
+        stats = processor.outbound_queue(account).stats.as_dict()
+        await processor.close()
+        pooled_elapsed = time.perf_counter() - started
+
+        pooled = [s for s in handler.received if s.startswith("pooled-")]
+        print({
+            "per_message": {
+                "messages_per_second": round(args.messages / legacy_elapsed, 1),
+                "connections": legacy_connections
+            },
+            "pooled": {
+                "messages_per_second": round(args.messages / pooled_elapsed, 1),
+                "delivered_once": len(pooled) == len(set(pooled)) == args.messages,
+                **stats
+            }
+        })
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,306 @@
+"""
+Staged Email Pipeline
+
+Runs the inbox workflow as concurrent stages connected by bounded queues:
+
+    fetch -> parse -> classify -> generate -> send
+
+- fetch/parse keep mailbox (UID) order while running items concurrently
+- classify/generate/send are sharded by sender, so every email from the
+  same sender goes through the same worker of each stage, in order
+- bounded queues give backpressure: a slow stage stalls its producers
+  instead of buffering the whole backlog in memory
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[Optional[Any]]]
+
+_STOP = object()
+
+
+@dataclass
+class PipelineConfig:
+    """Per-stage concurrency limits and queue sizes"""
+    fetch_concurrency: int = 1  # one IMAP connection serializes commands anyway
+    fetch_batch_size: int = 50  # messages per FETCH message set
+    parse_concurrency: int = 4
+    classify_concurrency: int = 16  # lets the batch classifier fill its batches
+    generate_concurrency: int = 4
+    send_concurrency: int = 4
+    queue_size: int = 32
+    max_attempts: int = 5  # syncs that may fail a message before it is marked seen anyway
+
+    @classmethod
+    def from_env(cls) -> "PipelineConfig":
+        """Build config from EMAIL_PIPELINE_* environment variables"""
+        import os
+
+        defaults = cls()
+        return cls(**{
+            name: int(os.getenv(f"EMAIL_PIPELINE_{name.upper()}", getattr(defaults, name)))
+            for name in defaults.__dataclass_fields__
+        })
+
+
+@dataclass
+class StageStats:
+    """Counters for a single stage"""
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+
+
+@dataclass
+class PipelineStats:
+    """Aggregate statistics for one pipeline run"""
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at
+
+    @property
+    def sent(self) -> int:
+        stage = self.stages.get("send")
+        return stage.processed if stage else 0
+
+    @property
+    def emails_per_minute(self) -> float:
+        fetched = self.stages["fetch"].processed if "fetch" in self.stages else 0
+        return fetched / self.elapsed_seconds * 60 if self.elapsed_seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "emails_per_minute": round(self.emails_per_minute, 1),
+            "stages": {
+                name: {
+                    "processed": s.processed,
+                    "dropped": s.dropped,
+                    "failed": s.failed,
+                    "busy_seconds": round(s.busy_seconds, 3)
+                }
+                for name, s in self.stages.items()
+            }
+        }
+
+
+class _Stage:
+    """Base class for a pipeline stage"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Handler,
+        concurrency: int,
+        queue_size: int,
+        stats: StageStats,
+        fan_out: bool = False
+    ):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.stats = stats
+        self.fan_out = fan_out  # handler returns a list of items for the next stage
+        self.downstream: Optional["_Stage"] = None
+
+    async def put(self, item: Any):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def start(self) -> List[asyncio.Task]:
+        raise NotImplementedError
+
+    async def _handle(self, item: Any) -> Optional[Any]:
+        """Run the handler, isolating failures to the item"""
+        started = time.monotonic()
+        try:
+            result = await self.handler(item)
+        except Exception as e:
+            logger.error(f"Pipeline stage {self.name} failed: {str(e)}")
+            self.stats.failed += 1
+            return None
+        finally:
+            self.stats.busy_seconds += time.monotonic() - started
+
+        if result is None:
+            self.stats.dropped += 1
+        else:
+            self.stats.processed += len(result) if self.fan_out else 1
+        return result
+
+    async def _forward(self, result: Optional[Any]):
+        if result is None or not self.downstream:
+            return
+        for item in (result if self.fan_out else [result]):
+            await self.downstream.put(item)
+
+
+class _OrderedStage(_Stage):
+    """
+    Runs up to `concurrency` items at once but emits results in input order
+
+    A dispatcher starts a task per item (once one of `concurrency` slots
+    is free) and pushes it onto a bounded in-flight queue; an emitter
+    awaits the tasks in that same order.
+    """
+
+    def start(self) -> List[asyncio.Task]:
+        self._input: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._in_flight: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return [
+            asyncio.create_task(self._dispatch(), name=f"{self.name}-dispatch"),
+            asyncio.create_task(self._emit(), name=f"{self.name}-emit")
+        ]
+
+    async def put(self, item: Any):
+        await self._input.put(item)
+
+    async def close(self):
+        await self._input.put(_STOP)
+
+    async def _dispatch(self):
+        while True:
+            item = await self._input.get()
+            if item is _STOP:
+                await self._in_flight.put(_STOP)
+                return
+            await self._slots.acquire()
+            await self._in_flight.put(asyncio.create_task(self._handle_in_slot(item)))
+
+    async def _handle_in_slot(self, item: Any) -> Optional[Any]:
+        try:
+            return await self._handle(item)
+        finally:
+            self._slots.release()
+
+    async def _emit(self):
+        while True:
+            task = await self._in_flight.get()
+            if task is _STOP:
+                if self.downstream:
+                    await self.downstream.close()
+                return
+            await self._forward(await task)
+
+
+class _KeyedStage(_Stage):
+    """
+    Shards items across `concurrency` FIFO workers by key
+
+    Items sharing a key always land on the same worker, so their relative
+    order is preserved through this stage and into the next one.
+    """
+
+    def __init__(self, *args, key: Callable[[Any], str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = key
+
+    def start(self) -> List[asyncio.Task]:
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.concurrency)]
+        self._workers = [
+            asyncio.create_task(self._work(queue), name=f"{self.name}-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        return self._workers + [asyncio.create_task(self._close_downstream(), name=f"{self.name}-close")]
+
+    async def put(self, item: Any):
+        shard = zlib.crc32(self.key(item).encode("utf-8")) % self.concurrency
+        await self._queues[shard].put(item)
+
+    async def close(self):
+        for queue in self._queues:
+            await queue.put(_STOP)
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            await self._forward(await self._handle(item))
+
+    async def _close_downstream(self):
+        await asyncio.gather(*self._workers)
+        if self.downstream:
+            await self.downstream.close()
+
+
+class EmailPipeline:
+    """
+    Concurrent fetch/parse/classify/generate/send pipeline for one inbox
+
+    Each stage is an async callable that returns the item for the next
+    stage, or None to drop it (spam, human review, nothing to send...).
+    The fetch stage receives batches of message ids and returns a list
+    of fetched messages, which are fanned out to the parse stage.
+    """
+
+    def __init__(
+        self,
+        fetch: Handler,
+        parse: Handler,
+        classify: Handler,
+        generate: Handler,
+        send: Handler,
+        config: Optional[PipelineConfig] = None,
+        sender_key: Optional[Callable[[Any], str]] = None
+    ):
+        self.config = config or PipelineConfig()
+        self.sender_key = sender_key or (lambda item: (item.get("from_address") or "").lower())
+        self.stats = PipelineStats()
+
+        c = self.config
+        self.stages: List[_Stage] = [
+            _OrderedStage("fetch", fetch, c.fetch_concurrency, c.queue_size, self._stats_for("fetch"),
+                          fan_out=True),
+            _OrderedStage("parse", parse, c.parse_concurrency, c.queue_size, self._stats_for("parse")),
+            _KeyedStage("classify", classify, c.classify_concurrency, c.queue_size,
+                        self._stats_for("classify"), key=self.sender_key),
+            _KeyedStage("generate", generate, c.generate_concurrency, c.queue_size,
+                        self._stats_for("generate"), key=self.sender_key),
+            _KeyedStage("send", send, c.send_concurrency, c.queue_size,
+                        self._stats_for("send"), key=self.sender_key)
+        ]
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.downstream = downstream
+
+    def _stats_for(self, name: str) -> StageStats:
+        return self.stats.stages.setdefault(name, StageStats())
+
+    async def run(self, items: List[Any]) -> PipelineStats:
+        """Feed items into the first stage and wait for the pipeline to drain"""
+        self.stats.started_at = time.monotonic()
+        tasks = [task for stage in self.stages for task in stage.start()]
+
+        try:
+            head = self.stages[0]
+            for item in items:
+                await head.put(item)  # blocks when the fetch queue is full
+            await head.close()
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.stats.finished_at = time.monotonic()
+
+        logger.info(f"Pipeline drained: {self.stats.as_dict()}")
+        return self.stats
@@ -5,19 +5,31 @@ Automatically reads, classifies, and responds to emails using AI agents
 """
 
 import asyncio
+import time
 import email
+import email.utils
+from email.parser import BytesHeaderParser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from typing import Callable, Iterable, List, Optional, Dict, Set
 import logging
-import httpx
-from html2text import html2text
 
 import aioimaplib
-import aiosmtplib
 from cryptography.fernet import Fernet
 
+from email_pipeline import EmailPipeline, PipelineConfig
+from imap_fetch import BatchFetcher, FetchedMessage, chunk_ids, decode_part, iter_fetch_responses
+from imap_session import ImapSession, MailboxStateStore, parse_select_response
+from account_scheduler import AccountRepository, AccountScheduler, ShardAssignment
+from pre_classifier import PreClassifier
+from mime_stream import MessageTooLarge, ParsedEmail, ParserLimits, StreamingMimeParser
+from thread_tracker import ThreadTracker
+from smtp_pool import OutboundQueue, SmtpConnectionPool, SmtpPoolConfig
+from batch_classifier import BatchClassifier
+from orchestrator_client import OrchestratorClient, OrchestratorError
+from html_text import fast_text, full_text, shutdown as shutdown_html_workers
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,7 +46,8 @@ class EmailAccount:
         smtp_port: int,
         username: str,
         password: str,
-        agent_id: str
+        agent_id: str,
+        account_id: Optional[str] = None
     ):
         self.email_address = email_address
         self.imap_host = imap_host
@@ -44,6 +57,7 @@ class EmailAccount:
         self.username = username
         self.password = password
         self.agent_id = agent_id
+        self.account_id = account_id  # email_accounts.id when loaded from the database
 
 
 class EmailProcessor:
@@ -58,9 +72,34 @@ class EmailProcessor:
     - Attachment handling
     """
     
-    def __init__(self, orchestrator_url: str = "http://orchestrator:8080"):
-        self.orchestrator_url = orchestrator_url
+    NO_REPLY_CATEGORIES = ('spam', 'newsletter', 'auto_reply')
+    
+    def __init__(
+        self,
+        orchestrator: Optional[OrchestratorClient] = None,
+        pipeline_config: Optional[PipelineConfig] = None,
+        pre_classifier: Optional[PreClassifier] = None,
+        repository: Optional[AccountRepository] = None,
+        mime_limits: Optional[ParserLimits] = None,
+        smtp_config: Optional[SmtpPoolConfig] = None,
+        batch_classifier: Optional[BatchClassifier] = None
+    ):
+        self._owns_orchestrator = orchestrator is None
+        self.orchestrator = orchestrator or OrchestratorClient()
         self.imap_client = None
+        self.mailbox_status: Dict[str, int] = {}
+        self.pipeline_config = pipeline_config or PipelineConfig()
+        self.pre_classifier = pre_classifier
+        self.repository = repository
+        self.mime_limits = mime_limits or ParserLimits()
+        self.threads = ThreadTracker()
+        self.uid_attempts: Dict[int, int] = {}  # failed syncs per UID, cleared on UIDVALIDITY change
+        self.deferred_uids: Set[int] = set()  # coalesced into a newer message's reply that is not sent yet
+        self.smtp_config = smtp_config or SmtpPoolConfig()
+        self.outbound: Dict[str, OutboundQueue] = {}  # per account
+        # Shared across accounts when passed in, so batches fill up faster
+        self._owns_classifier = batch_classifier is None
+        self.batch_classifier = batch_classifier or BatchClassifier(self.orchestrator)
     
     async def connect_imap(self, account: EmailAccount):
         """Connect to IMAP server"""
@@ -72,7 +111,8 @@ class EmailProcessor:
             
             await self.imap_client.wait_hello_from_server()
             await self.imap_client.login(account.username, account.password)
-            await self.imap_client.select('INBOX')
+            response = await self.imap_client.select('INBOX')
+            self.mailbox_status = parse_select_response(response[1])
             
             logger.info(f"Connected to IMAP for {account.email_address}")
             return True
@@ -81,24 +121,40 @@ class EmailProcessor:
             logger.error(f"IMAP connection failed: {str(e)}")
             return False
     
+    async def search_unread(self) -> List[bytes]:
+        """Return message IDs of unread emails in the selected mailbox"""
+        response = await self.imap_client.search('UNSEEN')
+        
+        if response[0] != 'OK':
+            return []
+        
+        return response[1][0].split()
+    
+    async def search_new_uids(self, after_uid: int = 0) -> List[int]:
+        """Return UIDs of unread emails above a UID high-water mark"""
+        criteria = ['UNSEEN', 'UID', f'{after_uid + 1}:*'] if after_uid else ['UNSEEN']
+        response = await self.imap_client.uid_search(*criteria)
+        
+        if response[0] != 'OK':
+            return []
+        
+        # "n:*" always matches the highest UID, even when it is below n
+        return sorted(uid for uid in map(int, response[1][0].split()) if uid > after_uid)
+    
     async def fetch_unread_emails(self) -> List[Dict]:
         """Fetch unread emails from inbox"""
         try:
             # Search for unread emails
-            response = await self.imap_client.search('UNSEEN')
-            
-            if response[0] != 'OK':
-                return []
-            
-            message_ids = response[1][0].split()
+            message_ids = await self.search_unread()
             
             if not message_ids:
                 logger.info("No unread emails")
                 return []
             
+            fetcher = BatchFetcher(self.imap_client, self.pipeline_config.fetch_batch_size)
             emails = []
-            for msg_id in message_ids:
-                email_data = await self._fetch_email_by_id(msg_id)
+            for fetched in await fetcher.fetch(message_ids):
+                email_data = self._build_email_data(fetched)
                 if email_data:
                     emails.append(email_data)
             
@@ -109,60 +165,213 @@ class EmailProcessor:
             logger.error(f"Error fetching emails: {str(e)}")
             return []
     
-    async def _fetch_email_by_id(self, msg_id: bytes) -> Optional[Dict]:
-        """Fetch and parse a single email"""
+    async def _fetch_email_by_id(self, msg_id, by_uid: bool = False) -> Optional[Dict]:
+        """
+        Fetch and parse a single email, streamed in partial FETCH chunks so
+        neither the raw message nor its attachments are held in memory
+        """
+        limits = self.mime_limits
+        parser = StreamingMimeParser(limits)
+        fetch_id = msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id)
+        offset = 0
+        
+        try:
+            while True:
+                items = f"(BODY.PEEK[]<{offset}.{limits.chunk_size}>)"
+                if by_uid:
+                    response = await self.imap_client.uid('fetch', fetch_id, items)
+                else:
+                    response = await self.imap_client.fetch(fetch_id, items)
+                
+                if response[0] != 'OK':
+                    return None
+                
+                chunk = None
+                for _, fetched in iter_fetch_responses(response[1]):
+                    chunk = fetched.get(f"BODY[]<{offset}>")
+                if not isinstance(chunk, bytes) or not chunk:
+                    break
+                
+                parser.feed(chunk)
+                offset += len(chunk)
+                if len(chunk) < limits.chunk_size:
+                    break
+                
+        except MessageTooLarge:
+            logger.warning(f"Email {fetch_id} exceeds {limits.max_message_bytes} bytes, parsing the first part only")
+        except Exception as e:
+            logger.error(f"Error fetching email {fetch_id}: {str(e)}")
+            parser.close().close()
+            return None
+        
+        return self._email_data_from_stream(fetch_id, parser.close())
+    
+    def _parse_email(self, msg_id: bytes, raw_email: bytes) -> Optional[Dict]:
+        """Parse raw RFC822 bytes into email data"""
+        limits = self.mime_limits
+        parser = StreamingMimeParser(limits)
+        view = memoryview(raw_email)
+        
+        try:
+            for start in range(0, len(view), limits.chunk_size):
+                parser.feed(bytes(view[start:start + limits.chunk_size]))
+        except MessageTooLarge:
+            logger.warning(f"Email {msg_id} exceeds {limits.max_message_bytes} bytes, parsing the first part only")
+        
+        return self._email_data_from_stream(msg_id, parser.close())
+    
+    def _email_data_from_stream(self, msg_id, parsed: ParsedEmail) -> Optional[Dict]:
+        """Build email data from a streamed message, then release its temp files"""
         try:
-            response = await self.imap_client.fetch(msg_id, '(RFC822)')
+            email_data = self._header_fields(parsed.headers)
             
-            if response[0] != 'OK':
-                return None
+            for part in parsed.text_parts:
+                content = part.read_text(self.mime_limits.max_text_bytes)
+                if part.content_type == "text/plain" and not email_data["body_text"]:
+                    email_data["body_text"] = content
+                elif part.content_type == "text/html" and not email_data["body_html"]:
+                    email_data["body_html"] = content
             
-            # Parse email
-            raw_email = response[1][0][1]
-            msg = email.message_from_bytes(raw_email)
-            
-            # Extract email data
-            email_data = {
-                "message_id": msg.get('Message-ID'),
-                "thread_id": msg.get('In-Reply-To') or msg.get('References'),
-                "from_address": email.utils.parseaddr(msg.get('From'))[1],
-                "to_addresses": [addr[1] for addr in email.utils.getaddresses([msg.get('To')])],
-                "cc_addresses": [addr[1] for addr in email.utils.getaddresses([msg.get('Cc', '')])],
-                "subject": msg.get('Subject', ''),
-                "date": email.utils.parsedate_to_datetime(msg.get('Date')),
-                "body_text": "",
-                "body_html": "",
-                "attachments": []
-            }
+            self._html_fallback(email_data)
             
-            # Extract body
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    
-                    if content_type == "text/plain":
-                        email_data["body_text"] = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    elif content_type == "text/html":
-                        html_content = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        email_data["body_html"] = html_content
-                        # Convert HTML to text if no plain text
-                        if not email_data["body_text"]:
-                            email_data["body_text"] = html2text(html_content)
-                    elif part.get_filename():
-                        # Handle attachments
-                        email_data["attachments"].append({
-                            "filename": part.get_filename(),
-                            "content_type": content_type,
-                            "size": len(part.get_payload(decode=True))
-                        })
-            else:
-                email_data["body_text"] = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
+            # Sizes come from the encoded octets; payloads are never decoded
+            email_data["attachments"] = [
+                {
+                    "filename": part.filename,
+                    "content_type": part.content_type,
+                    "size": part.size,
+                    **({"oversized": True} if part.oversized else {})
+                }
+                for part in parsed.attachments
+                if part.filename
+            ]
+            email_data["truncated"] = parsed.truncated
             
             return email_data
             
         except Exception as e:
             logger.error(f"Error parsing email {msg_id}: {str(e)}")
             return None
+        
+        finally:
+            parsed.close()
+    
+    def _build_email_data(self, fetched: FetchedMessage) -> Optional[Dict]:
+        """Build email data from a batch-fetched header block and text parts"""
+        try:
+            headers = BytesHeaderParser().parsebytes(fetched.header)
+            email_data = self._header_fields(headers)
+            
+            for part in fetched.text_parts:
+                data = fetched.sections.get(part.section)
+                if data is None:
+                    continue
+                
+                content = decode_part(part, data)
+                if part.content_type == "text/plain" and not email_data["body_text"]:
+                    email_data["body_text"] = content
+                elif part.content_type == "text/html" and not email_data["body_html"]:
+                    email_data["body_html"] = content
+            
+            self._html_fallback(email_data)
+            
+            # Attachments are described from BODYSTRUCTURE, never downloaded;
+            # size is the decoded size estimated from the encoded octets
+            email_data["attachments"] = [
+                {
+                    "filename": part.filename,
+                    "content_type": part.content_type,
+                    "size": part.size * 3 // 4 if part.encoding == "base64" else part.size
+                }
+                for part in fetched.attachments
+                if part.filename
+            ]
+            
+            return email_data
+            
+        except Exception as e:
+            logger.error(f"Error parsing email {fetched.seq}: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _html_fallback(email_data: Dict):
+        """
+        For HTML-only emails, extract just the text prefix classification
+        reads; the full conversion is deferred to _ensure_full_text
+        """
+        if not email_data["body_text"] and email_data["body_html"]:
+            email_data["body_text"] = fast_text(email_data["body_html"])
+            email_data["body_text_partial"] = True
+    
+    async def _ensure_full_text(self, email_data: Dict):
+        """Convert the whole HTML body (in the worker pool) before generating a reply"""
+        if email_data.pop("body_text_partial", False):
+            email_data["body_text"] = await full_text(email_data["body_html"])
+    
+    @staticmethod
+    def _parse_date(value) -> Optional[datetime]:
+        """Date header as a datetime, None when it is missing or malformed"""
+        if not value:
+            return None
+        try:
+            return email.utils.parsedate_to_datetime(str(value))
+        except (TypeError, ValueError):
+            return None
+
+    def _header_fields(self, msg) -> Dict:
+        """Extract addressing and threading fields from message headers"""
+        return {
+            "message_id": msg.get('Message-ID'),
+            "thread_id": msg.get('In-Reply-To') or msg.get('References'),
+            "in_reply_to": msg.get('In-Reply-To'),
+            "references": msg.get('References'),
+            "from_address": email.utils.parseaddr(msg.get('From'))[1],
+            "to_addresses": [addr[1] for addr in email.utils.getaddresses([msg.get('To', '')])],
+            "cc_addresses": [addr[1] for addr in email.utils.getaddresses([msg.get('Cc', '')])],
+            "subject": msg.get('Subject', ''),
+            "date": self._parse_date(msg.get('Date')),
+            "body_text": "",
+            "body_html": "",
+            "attachments": [],
+            # Headers used by the local pre-classifier
+            "headers": {
+                name.lower(): str(msg.get(name))
+                for name in (
+                    'List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted',
+                    'X-Autoreply', 'X-Autorespond'
+                )
+                if msg.get(name)
+            }
+        }
+    
+    async def classify(self, email_data: Dict) -> Dict:
+        """
+        Classify locally when the pre-classifier is confident, otherwise
+        escalate to the LLM classification; follow-ups reuse the thread's
+        classification. The fallback used when the LLM fails is not cached,
+        so the next message of the thread asks again
+        """
+        classification = self.threads.cached_classification(email_data)
+        if classification:
+            return classification
+        
+        classification = await self._classify_uncached(email_data)
+        if classification.get("source") != "default":
+            self.threads.store_classification(email_data, classification)
+        return classification
+    
+    async def _classify_uncached(self, email_data: Dict) -> Dict:
+        if self.pre_classifier:
+            classification = self.pre_classifier.classify(email_data)
+            if classification:
+                return classification
+        
+        started = time.perf_counter()
+        classification = await self.classify_email(email_data)
+        
+        if self.pre_classifier and classification.get("source") == "llm":
+            self.pre_classifier.observe(email_data, classification, time.perf_counter() - started)
+        return classification
     
     async def classify_email(self, email_data: Dict) -> Dict:
         """
@@ -176,53 +385,14 @@ class EmailProcessor:
         - spam
         - newsletter
         - order_related
+        - auto_reply
         """
         
-        classification_prompt = f"""Analyze this email and classify it:
-
-From: {email_data['from_address']}
-Subject: {email_data['subject']}
-Body: {email_data['body_text'][:500]}
-
-Classify into ONE category:
-- urgent_inquiry (needs immediate response)
-- general_inquiry (standard question)
-- complaint (customer dissatisfaction)
-- feedback (suggestions/praise)
-- spam (promotional/irrelevant)
-- order_related (purchase/shipping inquiry)
-
-Also determine:
-- Sentiment (positive/neutral/negative)
-- Requires human (true/false)
-- Priority (high/medium/low)
-
-Respond ONLY with JSON:
-{{
-  "category": "category_name",
-  "sentiment": "positive|neutral|negative",
-  "requires_human": true/false,
-  "priority": "high|medium|low",
-  "confidence": 0.0-1.0
-}}"""
-        
-        # Call orchestrator for classification
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.orchestrator_url}/api/v1/internal/classify",
-                    json={"prompt": classification_prompt},
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return self._default_classification()
-                    
-            except Exception as e:
-                logger.error(f"Classification error: {str(e)}")
-                return self._default_classification()
+        # Batched with the other emails in flight; the orchestrator builds the prompt
+        classification = await self.batch_classifier.classify(email_data)
+        if not classification:
+            return self._default_classification()
+        return {**classification, "source": "llm"}
     
     def _default_classification(self) -> Dict:
         """Default classification if AI fails"""
@@ -231,7 +401,8 @@ Respond ONLY with JSON:
             "sentiment": "neutral",
             "requires_human": False,
             "priority": "medium",
-            "confidence": 0.5
+            "confidence": 0.5,
+            "source": "default"
         }
     
     async def generate_response(
@@ -245,7 +416,7 @@ Respond ONLY with JSON:
         """
         
         # Don't respond to spam or newsletters
-        if classification['category'] in ['spam', 'newsletter']:
+        if classification['category'] in self.NO_REPLY_CATEGORIES:
             logger.info(f"Skipping response for {classification['category']}")
             return None
         
@@ -259,6 +430,7 @@ From: {email_data['from_address']}
 Subject: {email_data['subject']}
 Body:
 {email_data['body_text']}
+{self._earlier_messages_prompt(email_data)}
 
 Context:
 - Category: {classification['category']}
@@ -275,30 +447,24 @@ Requirements:
 Generate ONLY the email body (no subject line):"""
         
         # Call orchestrator for response generation
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.orchestrator_url}/api/v1/agents/{agent_id}/generate",
-                    json={
-                        "message": response_prompt,
-                        "context": {
-                            "email_data": email_data,
-                            "classification": classification
-                        }
-                    },
-                    timeout=60.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get('text', '')
-                else:
-                    logger.error(f"Response generation failed: {response.status_code}")
-                    return None
-                    
-            except Exception as e:
-                logger.error(f"Response generation error: {str(e)}")
-                return None
+        try:
+            result = await self.orchestrator.chat(
+                agent_id=agent_id,
+                message=response_prompt,
+                visitor_id=email_data['from_address'],
+                channel="email",
+                metadata={
+                    "message_id": email_data.get('message_id'),
+                    "thread_id": email_data.get('thread_id'),
+                    "classification": classification
+                },
+                deadline=60.0
+            )
+            return result.get('response', '')
+            
+        except OrchestratorError as e:
+            logger.error(f"Response generation error: {str(e)}")
+            return None
     
     async def send_email(
         self,
@@ -323,14 +489,9 @@ Generate ONLY the email body (no subject line):"""
             
             msg.attach(MIMEText(body, 'plain'))
             
-            # Send via SMTP
-            async with aiosmtplib.SMTP(
-                hostname=account.smtp_host,
-                port=account.smtp_port,
-                use_tls=True
-            ) as smtp:
-                await smtp.login(account.username, account.password)
-                await smtp.send_message(msg)
+            # Send via the account's pooled SMTP connections
+            if not await self.outbound_queue(account).send(msg):
+                return False
             
             logger.info(f"Email sent to {to_address}")
             return True
@@ -339,54 +500,44 @@ Generate ONLY the email body (no subject line):"""
             logger.error(f"Failed to send email: {str(e)}")
             return False
     
+    def outbound_queue(self, account: EmailAccount) -> OutboundQueue:
+        """The account's outbound queue, created on first use"""
+        key = account.account_id or account.email_address
+        if key not in self.outbound:
+            self.outbound[key] = OutboundQueue(SmtpConnectionPool(account, self.smtp_config))
+        return self.outbound[key]
+    
+    async def close(self):
+        """Deliver queued replies, close pooled SMTP connections and the orchestrator client"""
+        for queue in self.outbound.values():
+            await queue.close()
+        self.outbound = {}
+        if self._owns_classifier:
+            await self.batch_classifier.close()
+        if self._owns_orchestrator:
+            await self.orchestrator.close()
+    
     async def process_inbox(self, account: EmailAccount):
         """
-        Main processing loop
+        Single polling cycle
         
         1. Connect to IMAP
-        2. Fetch unread emails
-        3. Classify each email
-        4. Generate responses
-        5. Send responses
+        2. Search unread emails
+        3. Process them (see process_messages)
+        4. Log out
         """
         
         if not await self.connect_imap(account):
             return
         
         try:
-            emails = await self.fetch_unread_emails()
+            message_ids = await self.search_unread()
             
-            for email_data in emails:
-                logger.info(f"Processing email from {email_data['from_address']}")
-                
-                # Classify
-                classification = await self.classify_email(email_data)
-                logger.info(f"Classification: {classification}")
-                
-                # Check if requires human
-                if classification['requires_human'] or classification['priority'] == 'high':
-                    logger.info("Email flagged for human review")
-                    # TODO: Send to human agent queue
-                    continue
-                
-                # Generate response
-                response_text = await self.generate_response(
-                    email_data,
-                    classification,
-                    account.agent_id
-                )
-                
-                if response_text:
-                    # Send response
-                    await self.send_email(
-                        account,
-                        email_data['from_address'],
-                        email_data['subject'],
-                        response_text,
-                        email_data['message_id']
-                    )
-                    
-                    logger.info(f"Automated response sent to {email_data['from_address']}")
+            if not message_ids:
+                logger.info("No unread emails")
+                return
+            
+            await self.process_messages(account, message_ids)
                 
         except Exception as e:
             logger.error(f"Error processing inbox: {str(e)}")
@@ -394,16 +545,230 @@ Generate ONLY the email body (no subject line):"""
         finally:
             if self.imap_client:
                 await self.imap_client.logout()
+    
+    @staticmethod
+    def _earlier_messages_prompt(email_data: Dict) -> str:
+        """Earlier unanswered messages of the thread, answered in the same reply"""
+        earlier = email_data.get("thread_messages")
+        if not earlier:
+            return ""
+        
+        blocks = "\n\n".join(
+            f"Subject: {m['subject']}\nBody:\n{m['body_text']}" for m in earlier
+        )
+        return f"""
+The customer also sent these earlier messages in the same thread; address them in the same reply:
+{blocks}
+"""
+    
+    async def process_messages(self, account: EmailAccount, message_ids: List, by_uid: bool = False) -> Set[int]:
+        """
+        Run messages through the staged pipeline in FETCH batches:
+        fetch -> parse -> classify -> generate -> send
+        
+        Fetching only peeks; the processed messages get the Seen flag
+        afterwards, so UNSEEN searches do not return them again. Messages
+        that failed (not fetched, an error, no reply generated or sent) stay
+        unseen for the next sync. With UIDs, a message that failed
+        max_attempts syncs is marked seen anyway, and one whose reply is
+        left to a newer message of its thread stays unseen (and is not
+        processed again) until that reply is sent. The ids kept unseen are
+        returned.
+        """
+        failed: Set[int] = set()
+        settled: Set[int] = set()
+        if by_uid:
+            message_ids = [i for i in message_ids if int(i) not in self.deferred_uids]
+        pipeline = self.build_pipeline(account, by_uid=by_uid, failed=failed, settled=settled)
+        stats = await pipeline.run(chunk_ids(message_ids, self.pipeline_config.fetch_batch_size))
+        if by_uid:
+            exhausted = self._exhausted_uids(account, message_ids, failed)
+            failed -= exhausted
+            dropped = set(self.threads.drop(exhausted)) - exhausted
+            if dropped:
+                logger.error(
+                    f"Giving up on {len(dropped)} earlier emails for {account.email_address} "
+                    f"that those replies would have answered"
+                )
+            settled |= exhausted | dropped
+            self.deferred_uids -= settled
+        
+        fetcher = BatchFetcher(self.imap_client, self.pipeline_config.fetch_batch_size, by_uid=by_uid)
+        processed = {int(i) for i in message_ids} - failed - self.deferred_uids
+        if processed | settled:
+            await fetcher.mark_seen(sorted(processed | settled))
+        if failed:
+            logger.warning(f"{len(failed)} emails for {account.email_address} failed, retrying them on the next sync")
+        
+        logger.info(
+            f"Processed {len(message_ids)} emails for {account.email_address} "
+            f"({stats.emails_per_minute:.1f} emails/min, {stats.sent} replies sent)"
+        )
+        if self.pre_classifier:
+            logger.info(f"Pre-classifier: {self.pre_classifier.stats.as_dict()}")
+        logger.info(f"Threads: {self.threads.stats.as_dict()}")
+        for key, queue in self.outbound.items():
+            logger.info(f"SMTP {key}: {queue.stats.as_dict()}")
+        return failed | self.deferred_uids
+    
+    def _exhausted_uids(self, account: EmailAccount, uids: List, failed: Set[int]) -> Set[int]:
+        """Count another failed attempt per UID; the ones out of attempts"""
+        for uid in uids:
+            if int(uid) not in failed:
+                self.uid_attempts.pop(int(uid), None)
+        
+        exhausted = set()
+        for uid in failed:
+            self.uid_attempts[uid] = self.uid_attempts.get(uid, 0) + 1
+            if self.uid_attempts[uid] >= self.pipeline_config.max_attempts:
+                exhausted.add(uid)
+                del self.uid_attempts[uid]
+        
+        if exhausted:
+            logger.error(
+                f"Giving up on {len(exhausted)} emails for {account.email_address} after "
+                f"{self.pipeline_config.max_attempts} failed attempts, marking them seen: {sorted(exhausted)}"
+            )
+        return exhausted
+    
+    def build_pipeline(
+        self,
+        account: EmailAccount,
+        by_uid: bool = False,
+        failed: Optional[Set[int]] = None,
+        settled: Optional[Set[int]] = None
+    ) -> EmailPipeline:
+        """
+        Wire this processor's steps into a staged pipeline for an account
+        
+        Ids of messages that fail in any step are added to `failed`; UIDs
+        released from deferred_uids by a sent reply are added to `settled`.
+        """
+        failed = failed if failed is not None else set()
+        settled = settled if settled is not None else set()
+        fetcher = BatchFetcher(self.imap_client, self.pipeline_config.fetch_batch_size, by_uid=by_uid)
+        
+        def settle(email_data: Dict):
+            released = self.threads.settle(email_data)
+            if by_uid:
+                self.deferred_uids.difference_update(released)
+                settled.update(released)
+        
+        def message_id(fetched: FetchedMessage) -> int:
+            return fetched.uid if by_uid else fetched.seq
+        
+        def tracked(handler: Callable, ids: Callable[[object], Iterable[int]]) -> Callable:
+            async def run(item):
+                try:
+                    return await handler(item)
+                except Exception:
+                    failed.update(ids(item))
+                    raise
+            return run
+        
+        async def fetch(batch: List[int]) -> List[FetchedMessage]:
+            messages = await fetcher.fetch_batch(batch)
+            failed.update(set(batch) - {message_id(m) for m in messages})
+            return messages
+        
+        async def parse(fetched: FetchedMessage) -> Optional[Dict]:
+            if not fetched.parts:
+                # BODYSTRUCTURE was unusable: stream the whole message instead
+                email_data = await self._fetch_email_by_id(message_id(fetched), by_uid)
+            else:
+                email_data = self._build_email_data(fetched)
+            
+            if not email_data:
+                failed.add(message_id(fetched))
+                return None
+            email_data["imap_id"] = message_id(fetched)
+            
+            if not self.threads.admit(email_data):
+                logger.info(f"Dropping duplicate email from {email_data['from_address']}")
+                return None
+            return email_data
+        
+        async def classify(email_data: Dict) -> Optional[Dict]:
+            logger.info(f"Processing email from {email_data['from_address']}")
+            
+            classification = await self.classify(email_data)
+            logger.info(f"Classification: {classification}")
+            
+            if self.repository and account.account_id and classification.get("source") != "default":
+                await self.repository.record_classification(account.account_id, email_data, classification)
+            
+            # Check if requires human
+            if classification['requires_human'] or classification['priority'] == 'high':
+                logger.info("Email flagged for human review")
+                # TODO: Send to human agent queue
+                settle(email_data)
+                return None
+            
+            email_data["classification"] = classification
+            return email_data
+        
+        async def generate(email_data: Dict) -> Optional[Dict]:
+            earlier = self.threads.take_burst(email_data)
+            if earlier is None:
+                if by_uid and self.threads.is_pending(email_data):
+                    self.deferred_uids.add(email_data["imap_id"])
+                logger.info(f"Newer message in thread {email_data['thread_id']} will answer {email_data['message_id']}")
+                return None
+            if earlier:
+                email_data["thread_messages"] = earlier
+            
+            await self._ensure_full_text(email_data)
+            response_text = await self.generate_response(
+                email_data,
+                email_data["classification"],
+                account.agent_id
+            )
+            
+            if not response_text:
+                if email_data["classification"]["category"] in self.NO_REPLY_CATEGORIES:
+                    settle(email_data)
+                else:
+                    failed.add(email_data["imap_id"])
+                return None
+            
+            email_data["response_text"] = response_text
+            return email_data
+        
+        async def send(email_data: Dict) -> Optional[Dict]:
+            sent = await self.send_email(
+                account,
+                email_data['from_address'],
+                email_data['subject'],
+                email_data['response_text'],
+                email_data['message_id']
+            )
+            
+            if not sent:
+                failed.add(email_data["imap_id"])
+                return None
+            
+            settle(email_data)
+            logger.info(f"Automated response sent to {email_data['from_address']}")
+            return email_data
+        
+        def email_id(email_data: Dict) -> List[int]:
+            return [email_data["imap_id"]]
+        
+        return EmailPipeline(
+            fetch=tracked(fetch, lambda batch: batch),
+            parse=tracked(parse, lambda fetched: [message_id(fetched)]),
+            classify=tracked(classify, email_id),
+            generate=tracked(generate, email_id),
+            send=tracked(send, email_id),
+            config=self.pipeline_config
+        )
 
 
-async def main():
-    """Main entry point for email processor service"""
-    
-    # In production, fetch accounts from database
-    # For demo, using environment variables
+def env_account() -> EmailAccount:
+    """Single account configured through environment variables"""
     import os
     
-    account = EmailAccount(
+    return EmailAccount(
         email_address=os.getenv("EMAIL_ADDRESS"),
         imap_host=os.getenv("IMAP_HOST", "imap.gmail.com"),
         imap_port=int(os.getenv("IMAP_PORT", "993")),
@@ -411,23 +776,115 @@ async def main():
         smtp_port=int(os.getenv("SMTP_PORT", "587")),
         username=os.getenv("EMAIL_USERNAME"),
         password=os.getenv("EMAIL_PASSWORD"),
-        agent_id=os.getenv("AGENT_ID")
+        agent_id=os.getenv("AGENT_ID"),
+        account_id=os.getenv("EMAIL_ADDRESS")
     )
+
+
+async def main():
+    """Main entry point for email processor service"""
+    import os
     
-    processor = EmailProcessor()
+    pipeline_config = PipelineConfig.from_env()
+    mime_limits = ParserLimits.from_env()
+    smtp_config = SmtpPoolConfig.from_env()
+    orchestrator = OrchestratorClient.from_env()
+    batch_classifier = BatchClassifier(
+        orchestrator,
+        max_batch=int(os.getenv("EMAIL_CLASSIFY_BATCH_SIZE", "16")),
+        max_wait=int(os.getenv("EMAIL_CLASSIFY_BATCH_WAIT_MS", "50")) / 1000
+    )
+    poll_interval = int(os.getenv("EMAIL_POLL_INTERVAL", "60"))
     
-    # Process inbox every 60 seconds
-    while True:
-        try:
-            logger.info("Checking for new emails...")
-            await processor.process_inbox(account)
-            await asyncio.sleep(60)  # Check every minute
-        except KeyboardInterrupt:
-            logger.info("Shutting down email processor...")
-            break
-        except Exception as e:
-            logger.error(f"Main loop error: {str(e)}")
-            await asyncio.sleep(60)
+    # Legacy mode: one env-configured account, reconnect every poll interval
+    if os.getenv("EMAIL_MODE", "idle") == "poll":
+        account = env_account()
+        processor = EmailProcessor(
+            orchestrator=orchestrator,
+            pipeline_config=pipeline_config,
+            mime_limits=mime_limits,
+            smtp_config=smtp_config,
+            batch_classifier=batch_classifier
+        )
+        while True:
+            try:
+                logger.info("Checking for new emails...")
+                await processor.process_inbox(account)
+                await asyncio.sleep(poll_interval)
+            except KeyboardInterrupt:
+                logger.info("Shutting down email processor...")
+                break
+            except Exception as e:
+                logger.error(f"Main loop error: {str(e)}")
+                await asyncio.sleep(poll_interval)
+        shutdown_html_workers()
+        return
+    
+    pre_classifier = PreClassifier(
+        model_threshold=float(os.getenv("EMAIL_PRECLASSIFIER_THRESHOLD", "0.92"))
+    )
+    
+    # Accounts come from email_accounts when a database is configured,
+    # otherwise from environment variables
+    repository = None
+    if os.getenv("DATABASE_URL") and os.getenv("EMAIL_ACCOUNT_SOURCE", "database") == "database":
+        repository = AccountRepository(
+            os.getenv("DATABASE_URL"),
+            os.getenv("EMAIL_ENCRYPTION_KEY"),
+            account_factory=EmailAccount
+        )
+        await repository.connect()
+        account_source = repository.load_active_accounts
+        state_store = repository
+        
+        # Train the local pre-classifier on past classifications off the event loop
+        rows = await repository.load_training_examples(int(os.getenv("EMAIL_PRECLASSIFIER_TRAINING_ROWS", "20000")))
+        if rows:
+            await asyncio.to_thread(pre_classifier.train, rows)
+    else:
+        async def account_source():
+            return [env_account()]
+        state_store = MailboxStateStore(os.getenv("EMAIL_STATE_PATH", "mailbox_state.json"))
+    
+    # Persistent connection per account with IMAP IDLE (falls back to
+    # polling on the same connection when the server has no IDLE)
+    def session_factory(account, connect_limiter, sync_limiter) -> ImapSession:
+        return ImapSession(
+            EmailProcessor(
+                orchestrator=orchestrator,
+                pipeline_config=pipeline_config,
+                pre_classifier=pre_classifier,
+                repository=repository,
+                mime_limits=mime_limits,
+                smtp_config=smtp_config,
+                batch_classifier=batch_classifier
+            ),
+            account,
+            state_store,
+            poll_interval=poll_interval,
+            connect_limiter=connect_limiter,
+            sync_limiter=sync_limiter
+        )
+    
+    scheduler = AccountScheduler(
+        account_source,
+        session_factory,
+        shard=ShardAssignment.from_env(),
+        max_concurrent_connects=int(os.getenv("EMAIL_MAX_CONCURRENT_CONNECTS", "20")),
+        max_concurrent_syncs=int(os.getenv("EMAIL_MAX_CONCURRENT_SYNCS", "50")),
+        refresh_interval=float(os.getenv("EMAIL_ACCOUNT_REFRESH_INTERVAL", "60"))
+    )
+    
+    try:
+        await scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("Shutting down email processor...")
+    finally:
+        await batch_classifier.close()
+        await orchestrator.close()
+        if repository:
+            await repository.close()
+        shutdown_html_workers()
 
 
 if __name__ == "__main__":
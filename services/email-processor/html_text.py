@@ -0,0 +1,116 @@
+"""
+HTML to Text
+
+Two ways to get text out of an HTML-only email:
+
+- fast_text: a streaming tag stripper that stops as soon as it has the
+  first N characters of visible text (the classifier only reads the first
+  500), cheap enough to run on the event loop
+- full_text: the complete html2text conversion used for response
+  generation, run in a shared process pool so heavy marketing HTML never
+  blocks the event loop
+"""
+
+import asyncio
+import logging
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from html2text import html2text
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_CHARS = 500  # body_text prefix used by classification
+
+_FEED_CHUNK = 8 * 1024
+_INLINE_LIMIT = 4 * 1024  # smaller documents are converted in-process
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template"}
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "section", "blockquote"}
+_WHITESPACE_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+class _PrefixExtractor(HTMLParser):
+    """Collects visible text until limit characters have been seen"""
+
+    def __init__(self, limit: int):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.parts: List[str] = []
+        self.length = 0
+        self._skip_depth = 0
+
+    @property
+    def done(self) -> bool:
+        return self.length >= self.limit
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skip_depth or self.done:
+            return
+        text = _WHITESPACE_RE.sub(" ", data)
+        if text.strip():
+            self.parts.append(text)
+            self.length += len(text)
+
+
+def fast_text(html: str, limit: int = CLASSIFIER_CHARS) -> str:
+    """First `limit` characters of visible text, parsing only as much HTML as needed"""
+    parser = _PrefixExtractor(limit)
+    for start in range(0, len(html), _FEED_CHUNK):
+        parser.feed(html[start:start + _FEED_CHUNK])
+        if parser.done:
+            break
+    text = _BLANK_LINES_RE.sub("\n\n", "".join(parser.parts))
+    return "\n".join(line.strip() for line in text.split("\n")).strip()[:limit]
+
+
+_executor: Optional[Executor] = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=int(os.getenv("EMAIL_HTML_WORKERS", "2")))
+    return _executor
+
+
+def shutdown():
+    """Stop the worker pool; a later full_text call starts a new one"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+async def full_text(html: str) -> str:
+    """Complete html2text conversion, off the event loop for anything sizeable"""
+    global _executor
+    if len(html) <= _INLINE_LIMIT:
+        return html2text(html)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), html2text, html)
+    except BrokenProcessPool:
+        logger.warning("HTML worker pool died, restarting it")
+        _executor = None
+        return await asyncio.to_thread(html2text, html)
@@ -0,0 +1,354 @@
+"""
+Batched IMAP FETCH helpers
+
+Fetches many messages per round-trip using message-set ranges and avoids
+downloading what classification does not need:
+
+1. One FETCH per batch for UID, size, BODYSTRUCTURE and the header block
+2. One FETCH per distinct set of text sections (usually just one), pulling
+   only the text/plain or text/html parts; attachments are described from
+   BODYSTRUCTURE and never downloaded
+
+Every FETCH peeks, so nothing gets the Seen flag as a side effect; callers
+flag what they processed with BatchFetcher.mark_seen.
+
+FETCH responses are parsed incrementally, one message at a time, straight
+from aioimaplib's response lines (text lines as bytes, literals as
+bytearray) without re-joining them into one buffer.
+"""
+
+import base64
+import logging
+import quopri
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ITEMS = "(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])"
+
+_FETCH_START_RE = re.compile(rb"^(?:\* )?(\d+) FETCH ", re.IGNORECASE)
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?))')
+
+
+# ============================================
+# MESSAGE SETS
+# ============================================
+
+def compress_message_set(ids: Iterable[int]) -> str:
+    """Render ids as an IMAP message set, e.g. [1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'"""
+    ranges = []
+    for value in sorted(set(ids)):
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def chunk_ids(ids: Sequence, batch_size: int) -> List[List[int]]:
+    """Split message ids (bytes or int) into sorted batches of at most batch_size"""
+    ordered = sorted(int(i) for i in ids)
+    return [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+
+
+# ============================================
+# RESPONSE PARSING
+# ============================================
+
+class _Quoted(str):
+    """A quoted string token, never treated as NIL or a number"""
+
+
+class _Literal:
+    """Marker for literal data inside a tokenized FETCH response"""
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def _tokenize(text: bytes) -> Iterator[Any]:
+    """Tokenize one text line of a FETCH response"""
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        open_paren, close_paren, quoted, atom = match.groups()
+        if open_paren:
+            yield "("
+        elif close_paren:
+            yield ")"
+        elif quoted is not None:
+            yield _Quoted(re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", errors="replace"))
+        elif atom is not None:
+            yield atom.decode("ascii", errors="replace")
+
+
+def _build(tokens: Iterator[Any]) -> List[Any]:
+    """Build a nested list from tokens until the matching close paren"""
+    items: List[Any] = []
+    for token in tokens:
+        if token == "(":
+            items.append(_build(tokens))
+        elif token == ")":
+            return items
+        elif isinstance(token, _Literal):
+            items.append(token.data)
+        elif isinstance(token, _Quoted):
+            items.append(str(token))
+        elif token.upper() == "NIL":
+            items.append(None)
+        elif token.isdigit():
+            items.append(int(token))
+        else:
+            items.append(token)
+    return items
+
+
+def iter_fetch_responses(lines: Sequence[Any]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield (sequence_number, {item_name: value}) for each message in a FETCH response
+
+    Literal data arrives as its own bytearray element right after the text
+    line announcing it with {size}; every other element is a text line.
+    """
+    pending: List[Any] = []
+    seq: Optional[int] = None
+    depth = 0
+
+    def finish():
+        tokens = iter(pending)
+        next(tokens, None)  # opening paren of the item list
+        items = _build(tokens)
+        return dict(zip((str(k).upper() for k in items[0::2]), items[1::2]))
+
+    for line in lines:
+        if isinstance(line, bytearray):
+            if seq is not None:
+                pending.append(_Literal(bytes(line)))
+            continue
+
+        text = bytes(line).rstrip(b"\r\n")
+        if seq is None:
+            match = _FETCH_START_RE.match(text)
+            if not match:
+                continue  # tagged completion line or unrelated untagged response
+            seq = int(match.group(1))
+            text = text[match.end():]
+
+        literal = _LITERAL_RE.search(text)
+        if literal:
+            text = text[:literal.start()]
+
+        for token in _tokenize(text):
+            pending.append(token)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+
+        if depth == 0 and pending and not literal:
+            yield seq, finish()
+            pending, seq = [], None
+
+
+# ============================================
+# BODYSTRUCTURE
+# ============================================
+
+@dataclass
+class BodyPart:
+    """A leaf part described by BODYSTRUCTURE"""
+    section: str
+    content_type: str
+    params: Dict[str, str]
+    encoding: str
+    size: int
+    filename: Optional[str] = None
+
+    @property
+    def charset(self) -> str:
+        return self.params.get("charset", "utf-8")
+
+    @property
+    def is_attachment(self) -> bool:
+        return bool(self.filename) or not self.content_type.startswith("text/")
+
+
+def _param_dict(values: Optional[List[Any]]) -> Dict[str, str]:
+    if not isinstance(values, list):
+        return {}
+    return {str(k).lower(): str(v) for k, v in zip(values[0::2], values[1::2])}
+
+
+def parse_bodystructure(structure: List[Any], section: str = "") -> List[BodyPart]:
+    """Flatten a BODYSTRUCTURE into its leaf parts with IMAP section numbers"""
+    if structure and isinstance(structure[0], list):
+        parts = []
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break  # multipart subtype and extension data follow the children
+            index += 1
+            parts.extend(parse_bodystructure(child, f"{section}.{index}" if section else str(index)))
+        return parts
+
+    main_type = str(structure[0]).lower()
+    sub_type = str(structure[1]).lower()
+    params = _param_dict(structure[2])
+
+    # Disposition sits after the type-specific fields and MD5
+    disposition_index = {"text": 9, "message": 11}.get(main_type, 8)
+    if main_type == "message" and sub_type != "rfc822":
+        disposition_index = 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    disposition_params = _param_dict(disposition[1]) if isinstance(disposition, list) and len(disposition) > 1 else {}
+
+    return [BodyPart(
+        section=section or "1",
+        content_type=f"{main_type}/{sub_type}",
+        params=params,
+        encoding=str(structure[5] or "7bit").lower(),
+        size=structure[6] if isinstance(structure[6], int) else 0,
+        filename=disposition_params.get("filename") or params.get("name")
+    )]
+
+
+def decode_part(part: BodyPart, data: bytes) -> str:
+    """Undo transfer encoding and charset for a downloaded text part"""
+    if part.encoding == "base64":
+        data = base64.b64decode(data)
+    elif part.encoding == "quoted-printable":
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(part.charset, errors="ignore")
+    except LookupError:
+        return data.decode("utf-8", errors="ignore")
+
+
+# ============================================
+# BATCH FETCHER
+# ============================================
+
+@dataclass
+class FetchedMessage:
+    """Everything downloaded for one message by BatchFetcher"""
+    seq: int
+    uid: Optional[int]
+    size: int
+    header: bytes
+    parts: List[BodyPart]
+    sections: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def text_parts(self) -> List[BodyPart]:
+        return [p for p in self.parts if p.content_type in ("text/plain", "text/html") and not p.filename]
+
+    @property
+    def attachments(self) -> List[BodyPart]:
+        return [p for p in self.parts if p.is_attachment]
+
+
+class BatchFetcher:
+    """
+    Fetches messages from a selected mailbox in message-set batches
+
+    With by_uid=True the ids are UIDs and UID FETCH is used, so results stay
+    correct even if other clients expunge messages between round-trips.
+    Fetching never sets the Seen flag: mark_seen flags processed messages
+    explicitly, whether or not they had text parts to download.
+    """
+
+    def __init__(self, imap_client, batch_size: int = 50, by_uid: bool = False):
+        self.imap_client = imap_client
+        self.batch_size = batch_size
+        self.by_uid = by_uid
+
+    async def fetch(self, ids: Sequence) -> List[FetchedMessage]:
+        """Fetch headers, structure and text parts for ids in two round-trips per batch"""
+        messages: List[FetchedMessage] = []
+        for batch in chunk_ids(ids, self.batch_size):
+            messages.extend(await self.fetch_batch(batch))
+        return messages
+
+    async def mark_seen(self, ids: Sequence) -> bool:
+        """Set the Seen flag on ids, one STORE per batch"""
+        ok = True
+        for batch in chunk_ids(ids, self.batch_size):
+            message_set = compress_message_set(batch)
+            if self.by_uid:
+                response = await self.imap_client.uid('store', message_set, '+FLAGS.SILENT', '(\\Seen)')
+            else:
+                response = await self.imap_client.store(message_set, '+FLAGS.SILENT', '(\\Seen)')
+            if response[0] != 'OK':
+                logger.error(f"STORE \\Seen failed for {len(batch)} messages: {response[0]}")
+                ok = False
+        return ok
+
+    async def fetch_batch(self, ids: Sequence[int]) -> List[FetchedMessage]:
+        messages = await self._fetch_summaries(ids)
+        await self._fetch_text_sections(messages)
+        return [messages[key] for key in sorted(messages)]
+
+    async def _fetch(self, message_set: str, items: str):
+        if self.by_uid:
+            return await self.imap_client.uid('fetch', message_set, items)
+        return await self.imap_client.fetch(message_set, items)
+
+    def _key(self, seq: int, items: Dict[str, Any]) -> Optional[int]:
+        return items.get("UID") if self.by_uid else seq
+
+    async def _fetch_summaries(self, ids: Sequence[int]) -> Dict[int, FetchedMessage]:
+        response = await self._fetch(compress_message_set(ids), SUMMARY_ITEMS)
+        if response[0] != 'OK':
+            logger.error(f"Summary FETCH failed for {len(ids)} messages: {response[0]}")
+            return {}
+
+        messages = {}
+        for seq, items in iter_fetch_responses(response[1]):
+            key = self._key(seq, items)
+            if key is None:
+                continue
+            try:
+                parts = parse_bodystructure(items.get("BODYSTRUCTURE") or [])
+            except (IndexError, TypeError) as e:
+                logger.warning(f"Unparseable BODYSTRUCTURE for message {seq}: {str(e)}")
+                parts = []
+            messages[key] = FetchedMessage(
+                seq=seq,
+                uid=items.get("UID"),
+                size=items.get("RFC822.SIZE") or 0,
+                header=items.get("BODY[HEADER]") or b"",
+                parts=parts
+            )
+        return messages
+
+    async def _fetch_text_sections(self, messages: Dict[int, FetchedMessage]):
+        """Download text parts, one FETCH per distinct section list"""
+        groups: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for key, message in messages.items():
+            sections = tuple(p.section for p in message.text_parts)
+            if sections:
+                groups[sections].append(key)
+
+        for sections, keys in groups.items():
+            items = "(" + " ".join(f"BODY.PEEK[{s}]" for s in sections) + ")"
+            response = await self._fetch(compress_message_set(keys), items)
+            if response[0] != 'OK':
+                logger.error(f"Section FETCH failed for {len(keys)} messages: {response[0]}")
+                continue
+
+            for seq, fetched in iter_fetch_responses(response[1]):
+                message = messages.get(self._key(seq, fetched))
+                if message is None:
+                    continue
+                for section in sections:
+                    data = fetched.get(f"BODY[{section}]")
+                    if isinstance(data, bytes):
+                        message.sections[section] = data
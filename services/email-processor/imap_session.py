@@ -0,0 +1,244 @@
+"""
+Persistent IMAP Sessions
+
+Keeps one logged-in IMAP connection per account instead of reconnecting
+every polling cycle:
+
+- IMAP IDLE push for near-instant notification of new mail, re-issued
+  before the server's 30 minute IDLE limit
+- NOOP-based polling on the same connection for servers without IDLE
+- reconnect with capped exponential backoff and jitter
+- a UIDVALIDITY / UID high-water mark per mailbox, persisted between runs,
+  so a restart only looks at messages that arrived after the last one seen
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_STATUS_RE = re.compile(rb"\[(UIDVALIDITY|UIDNEXT) (\d+)\]", re.IGNORECASE)
+_EXISTS_RE = re.compile(rb"^(?:\* )?(\d+) EXISTS", re.IGNORECASE)
+
+
+def parse_select_response(lines: Sequence) -> Dict[str, int]:
+    """Extract UIDVALIDITY, UIDNEXT and EXISTS from a SELECT response"""
+    status: Dict[str, int] = {}
+    for line in lines:
+        if not isinstance(line, (bytes, bytearray)):
+            continue
+        for name, value in _STATUS_RE.findall(line):
+            status[name.decode().upper()] = int(value)
+        exists = _EXISTS_RE.match(line)
+        if exists:
+            status["EXISTS"] = int(exists.group(1))
+    return status
+
+
+@dataclass
+class MailboxState:
+    """Sync position within one mailbox"""
+    uid_validity: Optional[int] = None
+    last_seen_uid: int = 0
+
+
+class MailboxStateStore:
+    """Persists MailboxState per account as a small JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    async def load(self, account_key: str) -> MailboxState:
+        data = self._read().get(account_key)
+        return MailboxState(**data) if data else MailboxState()
+
+    async def save(self, account_key: str, state: MailboxState):
+        async with self._lock:
+            data = self._read()
+            data[account_key] = asdict(state)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)  # atomic, survives a crash mid-write
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable mailbox state {self.path}: {str(e)}")
+            return {}
+
+
+class ImapSession:
+    """
+    Long-lived IMAP connection for one account
+
+    Drives EmailProcessor over a single connection: sync new mail once after
+    (re)connecting, then wait for IDLE pushes (or poll) and sync again.
+    """
+
+    IDLE_TIMEOUT = 25 * 60  # re-issue IDLE well before the 29 minute cutoff
+
+    def __init__(
+        self,
+        processor,
+        account,
+        state_store: MailboxStateStore,
+        poll_interval: float = 60.0,
+        min_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        use_idle: bool = True,
+        connect_limiter: Optional[asyncio.Semaphore] = None,
+        sync_limiter: Optional[asyncio.Semaphore] = None
+    ):
+        self.processor = processor
+        self.account = account
+        self.state_store = state_store
+        self.poll_interval = poll_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.use_idle = use_idle
+        # Shared across accounts by AccountScheduler to cap global load
+        self.connect_limiter = connect_limiter or asyncio.Semaphore(1)
+        self.sync_limiter = sync_limiter or asyncio.Semaphore(1)
+        self.state = MailboxState()
+        self._stopped = asyncio.Event()
+
+    @property
+    def account_key(self) -> str:
+        return self.account.account_id or f"{self.account.username}@{self.account.imap_host}/INBOX"
+
+    def stop(self):
+        self._stopped.set()
+
+    async def run(self):
+        """Keep the account connected until stop() is called"""
+        try:
+            await self._reconnect_loop()
+        finally:
+            await self.processor.close()  # flush queued replies, close SMTP connections
+
+    async def _reconnect_loop(self):
+        backoff = self.min_backoff
+
+        while not self._stopped.is_set():
+            try:
+                async with self.connect_limiter:
+                    connected = await self.processor.connect_imap(self.account)
+                if not connected:
+                    raise ConnectionError(f"could not connect to {self.account.imap_host}")
+
+                await self._load_state()
+                backoff = self.min_backoff
+                await self.sync()
+
+                if self.use_idle and self._supports_idle():
+                    await self._idle_loop()
+                else:
+                    await self._poll_loop()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"IMAP session error for {self.account.email_address}: {str(e)}")
+
+            finally:
+                await self._disconnect()
+
+            if self._stopped.is_set():
+                break
+
+            delay = backoff * random.uniform(0.5, 1.5)
+            logger.info(f"Reconnecting {self.account.email_address} in {delay:.1f}s")
+            await self._sleep(delay)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def sync(self):
+        """Process unread mail above the high-water mark and advance it"""
+        uids = await self.processor.search_new_uids(self.state.last_seen_uid)
+        if not uids:
+            return
+
+        async with self.sync_limiter:
+            failed = await self.processor.process_messages(self.account, uids, by_uid=True)
+
+        # Failed messages stay unseen and above the mark, so the next sync retries
+        # them (until the processor runs out of attempts and marks them seen)
+        done = [uid for uid in uids if not failed or uid < min(failed)]
+        if done and max(done) > self.state.last_seen_uid:
+            self.state.last_seen_uid = max(done)
+            await self.state_store.save(self.account_key, self.state)
+
+    async def _load_state(self):
+        self.state = await self.state_store.load(self.account_key)
+        uid_validity = self.processor.mailbox_status.get("UIDVALIDITY")
+
+        if uid_validity is not None and self.state.uid_validity != uid_validity:
+            if self.state.uid_validity is not None:
+                logger.warning(f"UIDVALIDITY changed for {self.account.email_address}, rescanning mailbox")
+            self.state = MailboxState(uid_validity=uid_validity, last_seen_uid=0)
+            self.processor.uid_attempts.clear()  # both refer to the old UIDs
+            self.processor.deferred_uids.clear()
+            await self.state_store.save(self.account_key, self.state)
+
+    def _supports_idle(self) -> bool:
+        protocol = getattr(self.processor.imap_client, "protocol", None)
+        return "IDLE" in getattr(protocol, "capabilities", set())
+
+    async def _idle_loop(self):
+        client = self.processor.imap_client
+        logger.info(f"Waiting for new mail via IDLE for {self.account.email_address}")
+
+        while not self._stopped.is_set():
+            idle = await client.idle_start(timeout=self.IDLE_TIMEOUT)
+            try:
+                push = await client.wait_server_push(timeout=self.IDLE_TIMEOUT + 60)
+            finally:
+                client.idle_done()
+                await asyncio.wait_for(idle, timeout=30)
+
+            if self._has_new_mail(push):
+                await self.sync()
+
+    async def _poll_loop(self):
+        client = self.processor.imap_client
+        logger.info(f"Server has no IDLE, polling every {self.poll_interval}s for {self.account.email_address}")
+
+        while not self._stopped.is_set():
+            await self._sleep(self.poll_interval)
+            response = await client.noop()
+            if response[0] != 'OK':
+                raise ConnectionError(f"NOOP failed: {response[0]}")
+            await self.sync()
+
+    @staticmethod
+    def _has_new_mail(push: List) -> bool:
+        lines = push if isinstance(push, list) else [push]
+        return any(isinstance(line, (bytes, bytearray)) and b"EXISTS" in line.upper() for line in lines)
+
+    async def _sleep(self, seconds: float):
+        """Sleep that wakes up early on stop()"""
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _disconnect(self):
+        client = self.processor.imap_client
+        self.processor.imap_client = None
+        if client is None:
+            return
+        try:
+            await asyncio.wait_for(client.logout(), timeout=10)
+        except Exception:
+            pass  # connection is already gone
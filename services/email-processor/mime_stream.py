@@ -0,0 +1,301 @@
+"""
+Streaming MIME Parser
+
+Parses an RFC822 message fed in chunks (e.g. partial IMAP FETCHes) without
+ever holding the whole message or any decoded attachment in memory:
+
+- each part's header block is parsed with email.parser.BytesFeedParser
+- text/plain and text/html bodies are kept in SpooledTemporaryFiles that
+  spill to disk past spill_threshold, or earlier when the per-message
+  memory budget is exhausted
+- attachments are only measured (encoded octets) unless keep_attachments
+  is set, in which case they are spooled the same way; they are never
+  base64-decoded here
+- attachments above max_attachment_bytes are flagged oversized and never
+  stored; messages above max_message_bytes stop streaming and keep what
+  was parsed so far
+"""
+
+import base64
+import binascii
+import logging
+import quopri
+import tempfile
+from dataclasses import dataclass, field
+from email.message import Message
+from email.parser import BytesFeedParser
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lines longer than this cannot be a boundary, so they are flushed as body
+_MAX_BOUNDARY_LINE = 1024
+
+
+@dataclass
+class ParserLimits:
+    """Chunking and memory limits for streaming one message"""
+    chunk_size: int = 256 * 1024  # bytes per partial FETCH / feed() call
+    memory_budget: int = 4 * 1024 * 1024  # in-memory part bodies per message
+    spill_threshold: int = 256 * 1024  # larger parts go to a temp file
+    max_text_bytes: int = 1024 * 1024  # decoded text kept per text part
+    max_attachment_bytes: int = 25 * 1024 * 1024
+    max_message_bytes: int = 50 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "ParserLimits":
+        """Build limits from EMAIL_MIME_* environment variables"""
+        import os
+
+        defaults = cls()
+        return cls(**{
+            name: int(os.getenv(f"EMAIL_MIME_{name.upper()}", getattr(defaults, name)))
+            for name in defaults.__dataclass_fields__
+        })
+
+
+@dataclass
+class MimePart:
+    """A leaf part seen while streaming"""
+    content_type: str
+    charset: str
+    encoding: str
+    filename: Optional[str]
+    encoded_size: int = 0
+    oversized: bool = False
+    body: Optional[tempfile.SpooledTemporaryFile] = None
+
+    @property
+    def is_text(self) -> bool:
+        return self.content_type in ("text/plain", "text/html") and not self.filename
+
+    @property
+    def size(self) -> int:
+        """Decoded size, estimated from the encoded octets (line breaks excluded for base64)"""
+        return self.encoded_size * 3 // 4 if self.encoding == "base64" else self.encoded_size
+
+    def read_text(self, max_bytes: int) -> str:
+        """Decode up to max_bytes of this part's (decoded) content"""
+        if self.body is None:
+            return ""
+        self.body.seek(0)
+        # base64 lines are 76 characters plus CRLF
+        limit = max_bytes * 4 // 3 * 78 // 76 + 4 if self.encoding == "base64" else max_bytes
+        data = self.body.read(limit)
+        if self.encoding == "base64":
+            data = b"".join(data.split())
+            try:
+                data = base64.b64decode(data[:len(data) - len(data) % 4])
+            except binascii.Error:
+                data = b""
+        elif self.encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+        try:
+            return data[:max_bytes].decode(self.charset, errors="ignore")
+        except LookupError:
+            return data[:max_bytes].decode("utf-8", errors="ignore")
+
+
+@dataclass
+class ParsedEmail:
+    headers: Message
+    parts: List[MimePart] = field(default_factory=list)
+    spilled_parts: int = 0
+    truncated: bool = False  # stopped at max_message_bytes
+
+    @property
+    def text_parts(self) -> List[MimePart]:
+        return [p for p in self.parts if p.is_text]
+
+    @property
+    def attachments(self) -> List[MimePart]:
+        return [p for p in self.parts if not p.is_text]
+
+    def close(self):
+        for part in self.parts:
+            if part.body is not None:
+                part.body.close()
+
+
+class MessageTooLarge(Exception):
+    """Raised when a message exceeds max_message_bytes"""
+
+
+class StreamingMimeParser:
+    """Incremental MIME parser; call feed() with chunks, then close()"""
+
+    def __init__(self, limits: Optional[ParserLimits] = None, keep_attachments: bool = False):
+        self.limits = limits or ParserLimits()
+        self.keep_attachments = keep_attachments
+
+        self._buffer = b""
+        self._received = 0
+        self._boundaries: List[bytes] = []
+        self._header_lines: List[bytes] = []
+        self._mode = "headers"  # headers | body | skip
+        self._part: Optional[MimePart] = None
+        self._in_memory = 0
+        self._pending_newline = b""
+        self._result: Optional[ParsedEmail] = None
+
+    def feed(self, data: bytes):
+        self._received += len(data)
+        if self._received > self.limits.max_message_bytes:
+            if self._result is not None:
+                self._result.truncated = True
+            raise MessageTooLarge(f"message exceeds {self.limits.max_message_bytes} bytes")
+
+        buffer = self._buffer + data if self._buffer else data
+        start = 0
+        while True:
+            if self._mode != "headers" and not buffer.startswith(b"--", start):
+                # Only a line starting with "--" can be a boundary: pass
+                # everything up to the next such line through in one piece
+                candidate = buffer.find(b"\n--", start)
+                end = candidate if candidate >= 0 else buffer.rfind(b"\n", start)
+                if end >= start:
+                    self._bulk(buffer[start:end + 1])
+                    start = end + 1
+                if candidate < 0:
+                    break
+                continue
+
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                break
+            self._line(buffer[start:newline + 1])
+            start = newline + 1
+
+        self._buffer = buffer[start:]
+        if len(self._buffer) > _MAX_BOUNDARY_LINE and self._mode != "headers":
+            self._write_body(self._buffer, b"")
+            self._buffer = b""
+
+    def close(self) -> ParsedEmail:
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = b""
+        if self._mode == "headers" and self._header_lines:
+            self._end_headers()
+        self._end_part()
+        if self._result is None:
+            self._result = ParsedEmail(headers=Message())
+        return self._result
+
+    # ---- line handling ----
+
+    def _line(self, line: bytes):
+        if self._mode == "headers":
+            if line.strip():
+                self._header_lines.append(line)
+            else:
+                self._end_headers()
+            return
+
+        stripped = line.rstrip(b"\r\n")
+        if stripped.startswith(b"--") and self._boundaries:
+            for depth in range(len(self._boundaries) - 1, -1, -1):
+                boundary = self._boundaries[depth]
+                if stripped == b"--" + boundary:
+                    self._end_part()
+                    del self._boundaries[depth + 1:]
+                    self._mode = "headers"
+                    return
+                if stripped == b"--" + boundary + b"--":
+                    self._end_part()
+                    del self._boundaries[depth:]
+                    self._mode = "skip"  # epilogue until an outer boundary
+                    return
+
+        if self._mode == "body":
+            body, ending = stripped, line[len(stripped):]
+            self._write_body(body, ending)
+
+    def _bulk(self, lines: bytes):
+        """Body lines known not to contain a boundary, ending in a line break"""
+        if self._mode != "body":
+            return
+        ending = b"\r\n" if lines.endswith(b"\r\n") else b"\n"
+        self._write_body(lines[:-len(ending)], ending)
+
+    def _end_headers(self):
+        parser = BytesFeedParser()
+        parser.feed(b"".join(self._header_lines) + b"\r\n")
+        headers = parser.close()
+        self._header_lines = []
+
+        if self._result is None:
+            self._result = ParsedEmail(headers=headers)
+
+        if headers.get_content_maintype() == "multipart":
+            boundary = headers.get_boundary()
+            if boundary:
+                self._boundaries.append(boundary.encode("utf-8", errors="ignore"))
+            self._mode = "skip"  # preamble
+            return
+
+        part = MimePart(
+            content_type=headers.get_content_type(),
+            charset=headers.get_content_charset() or "utf-8",
+            encoding=(headers.get("Content-Transfer-Encoding") or "7bit").strip().lower(),
+            filename=headers.get_filename()
+        )
+        if part.is_text or self.keep_attachments:
+            part.body = tempfile.SpooledTemporaryFile(max_size=self.limits.spill_threshold)
+        self._part = part
+        self._pending_newline = b""
+        self._mode = "body"
+
+    def _write_body(self, body: bytes, ending: bytes):
+        part = self._part
+        if part is None:
+            return
+        # The line break before a boundary belongs to the boundary, so each
+        # line's ending is only written once the next line arrives
+        chunk = self._pending_newline + body
+        self._pending_newline = ending
+        if part.encoding == "base64":
+            part.encoded_size += len(chunk) - chunk.count(b"\n") - chunk.count(b"\r")
+        else:
+            part.encoded_size += len(chunk)
+        if part.body is None:
+            return
+        if not part.is_text and part.size > self.limits.max_attachment_bytes:
+            self._drop_body(part)
+            return
+
+        was_rolled = part.body._rolled
+        part.body.write(chunk)
+        if was_rolled:
+            return
+        if part.body._rolled:
+            # Crossed spill_threshold; the earlier chunks left memory with it
+            self._in_memory -= part.body.tell() - len(chunk)
+            self._result.spilled_parts += 1
+        else:
+            self._in_memory += len(chunk)
+            if self._in_memory > self.limits.memory_budget:
+                self._spill(part)
+
+    def _spill(self, part: MimePart):
+        """Move the current part to disk to stay within the memory budget"""
+        size = part.body.tell()
+        part.body.rollover()
+        self._in_memory -= size
+        self._result.spilled_parts += 1
+
+    def _drop_body(self, part: MimePart):
+        if not part.body._rolled:
+            self._in_memory -= part.body.tell()
+        part.body.close()
+        part.body = None
+        part.oversized = True
+
+    def _end_part(self):
+        part, self._part = self._part, None
+        self._pending_newline = b""
+        if part is None or self._result is None:
+            return
+        if not part.is_text and part.size > self.limits.max_attachment_bytes:
+            part.oversized = True
+        self._result.parts.append(part)
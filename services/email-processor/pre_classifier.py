@@ -0,0 +1,286 @@
+"""
+Local Email Pre-Classifier
+
+First-stage classifier that runs in-process before the orchestrator's LLM
+classification and decides the obvious cases on its own:
+
+1. Header heuristics: List-Unsubscribe / Precedence: bulk|list|junk mark
+   newsletters, Auto-Submitted and auto-reply headers mark auto replies
+2. Sender reputation: senders repeatedly classified as bulk mail
+   (spam/newsletter/auto_reply) are short-circuited from a bounded cache
+3. A hashed-feature linear model (multinomial logistic regression)
+   trained on past LLM classifications from email_messages
+
+Only bulk mail (spam/newsletter/auto_reply) is decided locally: these
+never get a reply, so a classification without sentiment or a human
+review check is safe. Everything else, and anything below the confidence
+thresholds, returns None and escalates to the LLM; its answer is fed back
+into the sender reputation cache.
+"""
+
+import logging
+import math
+import random
+import re
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = [
+    "urgent_inquiry",
+    "general_inquiry",
+    "complaint",
+    "feedback",
+    "spam",
+    "newsletter",
+    "order_related",
+    "auto_reply"
+]
+
+# Categories that never get a reply, and so are safe to decide by reputation
+BULK_CATEGORIES = {"spam", "newsletter", "auto_reply"}
+
+PRIORITY_BY_CATEGORY = {
+    "urgent_inquiry": "high",
+    "complaint": "medium",
+    "order_related": "medium",
+    "general_inquiry": "medium",
+    "feedback": "low",
+    "spam": "low",
+    "newsletter": "low",
+    "auto_reply": "low"
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]{2,}")
+
+
+def _classification(category: str, confidence: float, source: str) -> Dict:
+    return {
+        "category": category,
+        "sentiment": "neutral",
+        "requires_human": False,
+        "priority": PRIORITY_BY_CATEGORY.get(category, "medium"),
+        "confidence": round(confidence, 3),
+        "source": source
+    }
+
+
+# ============================================
+# HEADER HEURISTICS
+# ============================================
+
+def classify_by_headers(headers: Dict[str, str]) -> Optional[Dict]:
+    """Decide bulk and automated mail from standard headers alone"""
+    auto_submitted = headers.get("auto-submitted", "").lower()
+    if auto_submitted and auto_submitted != "no":
+        return _classification("auto_reply", 0.99, "headers")
+    if headers.get("x-autoreply") or headers.get("x-autorespond"):
+        return _classification("auto_reply", 0.97, "headers")
+
+    precedence = headers.get("precedence", "").lower()
+    if precedence == "junk":
+        return _classification("spam", 0.95, "headers")
+    if precedence in ("bulk", "list") or headers.get("list-unsubscribe") or headers.get("list-id"):
+        return _classification("newsletter", 0.97, "headers")
+
+    return None
+
+
+# ============================================
+# HASHED LINEAR MODEL
+# ============================================
+
+def extract_features(email_data: Dict) -> List[str]:
+    """Tokens from sender domain, subject and the body prefix the LLM sees"""
+    sender = (email_data.get("from_address") or "").lower()
+    features = [f"d:{sender.rpartition('@')[2]}", "bias"]
+    features += [f"s:{w}" for w in _WORD_RE.findall((email_data.get("subject") or "").lower())]
+    features += [f"b:{w}" for w in _WORD_RE.findall((email_data.get("body_text") or "")[:500].lower())]
+    if email_data.get("attachments") or email_data.get("has_attachments"):
+        features.append("has_attachment")
+    return features
+
+
+class HashedLinearModel:
+    """Multinomial logistic regression over hashed sparse features"""
+
+    def __init__(self, categories: List[str] = CATEGORIES, dimensions: int = 1 << 18):
+        self.categories = list(categories)
+        self.dimensions = dimensions
+        self.weights = [array("f", bytes(4 * dimensions)) for _ in self.categories]
+        self.trained_examples = 0
+
+    def _indices(self, features: Iterable[str]) -> List[int]:
+        return [zlib.crc32(f.encode("utf-8")) % self.dimensions for f in set(features)]
+
+    def _scores(self, indices: List[int]) -> List[float]:
+        scores = [sum(w[i] for i in indices) for w in self.weights]
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, features: List[str]) -> Tuple[str, float]:
+        probabilities = self._scores(self._indices(features))
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.categories[best], probabilities[best]
+
+    def fit(self, examples: List[Tuple[List[str], str]], epochs: int = 3, learning_rate: float = 0.2):
+        """SGD on (features, category) pairs; unknown categories are skipped"""
+        labelled = [
+            (self._indices(features), self.categories.index(category))
+            for features, category in examples
+            if category in self.categories
+        ]
+        for epoch in range(epochs):
+            random.shuffle(labelled)
+            rate = learning_rate / (1 + epoch)
+            for indices, label in labelled:
+                probabilities = self._scores(indices)
+                for k, weights in enumerate(self.weights):
+                    gradient = rate * ((1.0 if k == label else 0.0) - probabilities[k])
+                    if abs(gradient) < 1e-6:
+                        continue
+                    for i in indices:
+                        weights[i] += gradient
+        self.trained_examples = len(labelled)
+
+
+# ============================================
+# SENDER REPUTATION
+# ============================================
+
+class SenderReputation:
+    """Bounded LRU of per-sender category counts"""
+
+    def __init__(self, max_senders: int = 50000, min_observations: int = 3, min_agreement: float = 0.9):
+        self.max_senders = max_senders
+        self.min_observations = min_observations
+        self.min_agreement = min_agreement
+        self._senders: "OrderedDict[str, Counter]" = OrderedDict()
+
+    def observe(self, sender: str, category: str):
+        if not sender:
+            return
+        counts = self._senders.pop(sender, None) or Counter()
+        counts[category] += 1
+        self._senders[sender] = counts
+        if len(self._senders) > self.max_senders:
+            self._senders.popitem(last=False)
+
+    def lookup(self, sender: str) -> Optional[Dict]:
+        counts = self._senders.get(sender)
+        if not counts:
+            return None
+        self._senders.move_to_end(sender)
+
+        category, hits = counts.most_common(1)[0]
+        total = sum(counts.values())
+        if category in BULK_CATEGORIES and total >= self.min_observations and hits / total >= self.min_agreement:
+            return _classification(category, hits / total, "reputation")
+        return None
+
+
+# ============================================
+# PRE-CLASSIFIER
+# ============================================
+
+@dataclass
+class PreClassifierStats:
+    decided: Counter = field(default_factory=Counter)  # by source
+    escalated: int = 0
+    local_seconds: float = 0.0
+    llm_seconds: float = 0.0
+    llm_calls: int = 0
+
+    @property
+    def short_circuit_rate(self) -> float:
+        total = sum(self.decided.values()) + self.escalated
+        return sum(self.decided.values()) / total if total else 0.0
+
+    @property
+    def latency_saved_seconds(self) -> float:
+        """Avoided LLM time, using the average observed LLM classification latency"""
+        if not self.llm_calls:
+            return 0.0
+        avg_llm = self.llm_seconds / self.llm_calls
+        return max(0.0, sum(self.decided.values()) * avg_llm - self.local_seconds)
+
+    def as_dict(self) -> Dict:
+        return {
+            "short_circuited": dict(self.decided),
+            "escalated": self.escalated,
+            "short_circuit_rate": round(self.short_circuit_rate, 3),
+            "latency_saved_s": round(self.latency_saved_seconds, 1)
+        }
+
+
+class PreClassifier:
+    """Decides high-confidence emails locally, escalates the rest"""
+
+    def __init__(
+        self,
+        model: Optional[HashedLinearModel] = None,
+        reputation: Optional[SenderReputation] = None,
+        model_threshold: float = 0.92,
+        min_training_examples: int = 200
+    ):
+        self.model = model
+        self.reputation = reputation or SenderReputation()
+        self.model_threshold = model_threshold
+        self.min_training_examples = min_training_examples
+        self.stats = PreClassifierStats()
+
+    def classify(self, email_data: Dict) -> Optional[Dict]:
+        """Return a classification, or None when the LLM should decide"""
+        started = time.perf_counter()
+        try:
+            result = (
+                classify_by_headers(email_data.get("headers") or {})
+                or self.reputation.lookup((email_data.get("from_address") or "").lower())
+                or self._classify_by_model(email_data)
+            )
+        finally:
+            self.stats.local_seconds += time.perf_counter() - started
+
+        if result:
+            self.stats.decided[result["source"]] += 1
+        else:
+            self.stats.escalated += 1
+        return result
+
+    def observe(self, email_data: Dict, classification: Dict, llm_seconds: Optional[float] = None):
+        """Record a final classification (and LLM latency, if it came from the LLM)"""
+        self.reputation.observe((email_data.get("from_address") or "").lower(), classification.get("category"))
+        if llm_seconds is not None:
+            self.stats.llm_seconds += llm_seconds
+            self.stats.llm_calls += 1
+
+    def _classify_by_model(self, email_data: Dict) -> Optional[Dict]:
+        if not self.model or self.model.trained_examples < self.min_training_examples:
+            return None
+        category, confidence = self.model.predict(extract_features(email_data))
+        if confidence < self.model_threshold or category not in BULK_CATEGORIES:
+            return None  # mail that may be answered needs the LLM's sentiment and review check
+        return _classification(category, confidence, "model")
+
+    def train(self, rows: List[Dict], epochs: int = 3):
+        """
+        Fit a fresh model on past classified emails and seed sender reputation
+
+        Rows should be LLM classifications only: training on the
+        pre-classifier's own decisions or on fallbacks would reinforce them.
+        """
+        model = HashedLinearModel()
+        model.fit([(extract_features(row), row["category"]) for row in rows], epochs=epochs)
+
+        for row in rows:
+            self.reputation.observe((row.get("from_address") or "").lower(), row["category"])
+
+        self.model = model
+        logger.info(f"Pre-classifier trained on {model.trained_examples} emails")
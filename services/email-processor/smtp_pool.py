@@ -0,0 +1,260 @@
+"""
+Pooled SMTP Sending
+
+Replaces one connect + TLS + login per reply with:
+
+- SmtpConnectionPool: per-account logged-in connections, reused for up to
+  max_messages_per_connection messages, kept alive with NOOP while idle
+  and closed after idle_timeout
+- OutboundQueue: a bounded queue drained by a fixed number of workers
+  (at most one connection each) that retries transient failures (4xx
+  replies, dropped connections) with exponential backoff
+- SmtpStats: messages per connection and send latency
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from email.message import Message
+from typing import Callable, List, Optional
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SmtpPoolConfig:
+    """Pool size, connection reuse and retry limits for one account"""
+    max_connections: int = 2
+    max_messages_per_connection: int = 100
+    keepalive_interval: float = 30.0  # NOOP idle connections this often
+    idle_timeout: float = 120.0  # close connections idle for longer
+    max_retries: int = 3
+    retry_backoff: float = 2.0  # seconds, doubled per attempt
+    queue_size: int = 1000
+    timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SmtpPoolConfig":
+        """Build config from EMAIL_SMTP_* environment variables"""
+        import os
+
+        defaults = cls()
+        return cls(**{
+            name: type(getattr(defaults, name))(os.getenv(f"EMAIL_SMTP_{name.upper()}", getattr(defaults, name)))
+            for name in defaults.__dataclass_fields__
+        })
+
+
+@dataclass
+class SmtpStats:
+    """Counters for one account's outbound mail"""
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    connections_opened: int = 0
+    send_seconds: float = 0.0
+    max_send_seconds: float = 0.0
+
+    @property
+    def messages_per_connection(self) -> float:
+        return self.sent / self.connections_opened if self.connections_opened else 0.0
+
+    @property
+    def avg_send_seconds(self) -> float:
+        return self.send_seconds / self.sent if self.sent else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "connections_opened": self.connections_opened,
+            "messages_per_connection": round(self.messages_per_connection, 1),
+            "avg_send_ms": round(self.avg_send_seconds * 1000, 1),
+            "max_send_ms": round(self.max_send_seconds * 1000, 1)
+        }
+
+
+def is_transient(error: Exception) -> bool:
+    """4xx replies and connection problems are retried; 5xx replies are not"""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= r.code < 500 for r in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, (aiosmtplib.SMTPException, ConnectionError, OSError, asyncio.TimeoutError))
+
+
+@dataclass
+class _Connection:
+    smtp: aiosmtplib.SMTP
+    messages: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SmtpConnectionPool:
+    """Logged-in SMTP connections for one account"""
+
+    def __init__(self, account, config: Optional[SmtpPoolConfig] = None, smtp_factory: Optional[Callable] = None):
+        self.account = account
+        self.config = config or SmtpPoolConfig()
+        self.smtp_factory = smtp_factory or self._default_factory
+        self.stats = SmtpStats()
+        self._idle: List[_Connection] = []
+        self._slots = asyncio.Semaphore(self.config.max_connections)
+
+    def _default_factory(self) -> aiosmtplib.SMTP:
+        # Implicit TLS on 465, STARTTLS (when offered) on other ports
+        return aiosmtplib.SMTP(
+            hostname=self.account.smtp_host,
+            port=self.account.smtp_port,
+            use_tls=self.account.smtp_port == 465,
+            timeout=self.config.timeout
+        )
+
+    async def _open(self) -> _Connection:
+        smtp = self.smtp_factory()
+        await smtp.connect()
+        if self.account.password:
+            await smtp.login(self.account.username, self.account.password)
+        self.stats.connections_opened += 1
+        return _Connection(smtp)
+
+    async def _close(self, connection: _Connection):
+        try:
+            await asyncio.wait_for(connection.smtp.quit(), timeout=5)
+        except Exception:
+            connection.smtp.close()
+
+    async def send(self, message: Message):
+        """Send one message on a pooled connection"""
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else await self._open()
+            started = time.perf_counter()
+            try:
+                await connection.smtp.send_message(message)
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                # The server rejected this message; the connection is still usable
+                connection.last_used = time.monotonic()
+                self._idle.append(connection)
+                raise
+            except Exception:
+                await self._close(connection)
+                raise
+
+            elapsed = time.perf_counter() - started
+            self.stats.sent += 1
+            self.stats.send_seconds += elapsed
+            self.stats.max_send_seconds = max(self.stats.max_send_seconds, elapsed)
+
+            connection.messages += 1
+            connection.last_used = time.monotonic()
+            if connection.messages >= self.config.max_messages_per_connection:
+                await self._close(connection)
+            else:
+                self._idle.append(connection)
+
+    async def keepalive(self):
+        """Close connections idle past idle_timeout, NOOP the rest"""
+        now = time.monotonic()
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            idle_for = now - connection.last_used
+            if idle_for > self.config.idle_timeout:
+                await self._close(connection)
+                continue
+            if idle_for > self.config.keepalive_interval:
+                try:
+                    await connection.smtp.noop()
+                except Exception:
+                    connection.smtp.close()
+                    continue
+            self._idle.append(connection)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._close(connection)
+
+
+@dataclass
+class _Outbound:
+    message: Message
+    delivered: asyncio.Future
+    attempts: int = 0
+
+
+class OutboundQueue:
+    """Bounded outbound queue for one account, drained through its pool"""
+
+    def __init__(self, pool: SmtpConnectionPool):
+        self.pool = pool
+        self.config = pool.config
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.queue_size)
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def stats(self) -> SmtpStats:
+        return self.pool.stats
+
+    def start(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.config.max_connections)
+            ]
+
+    async def send(self, message: Message) -> bool:
+        """Queue a message; True once delivered, False if it finally failed"""
+        self.start()
+        item = _Outbound(message, asyncio.get_running_loop().create_future())
+        await self._queue.put(item)
+        return await item.delivered
+
+    async def _worker(self):
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=self.config.keepalive_interval)
+            except asyncio.TimeoutError:
+                await self.pool.keepalive()
+                continue
+
+            try:
+                await self._deliver(item)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item: _Outbound):
+        while True:
+            item.attempts += 1
+            try:
+                await self.pool.send(item.message)
+                self._resolve(item, True)
+                return
+            except Exception as e:
+                if not is_transient(e) or item.attempts > self.config.max_retries:
+                    self.stats.failed += 1
+                    logger.error(f"Failed to send email to {item.message['To']}: {str(e)}")
+                    self._resolve(item, False)
+                    return
+
+                delay = self.config.retry_backoff * 2 ** (item.attempts - 1)
+                self.stats.retries += 1
+                logger.warning(f"Transient SMTP error for {item.message['To']}, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _resolve(item: _Outbound, delivered: bool):
+        if not item.delivered.done():  # the sender may have given up waiting
+            item.delivered.set_result(delivered)
+
+    async def close(self):
+        """Finish queued mail, then stop workers and close connections"""
+        if self._workers:
+            await self._queue.join()
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        await self.pool.close()
@@ -0,0 +1,226 @@
+"""
+Email Thread Tracking
+
+Groups inbound mail into threads using Message-ID, In-Reply-To and
+References so one conversation is handled as one unit:
+
+- near-duplicate emails (same thread, sender and normalized body) are dropped
+- the classification of a thread is cached and reused for follow-ups
+- follow-ups that arrive in a burst are coalesced: only the newest message
+  of the thread generates a reply, which covers the earlier ones. They stay
+  pending until that reply is sent (or the thread goes to a human), so a
+  failed reply is retried with them; settle() returns their IMAP ids so
+  the caller can keep them unseen until then
+
+All state is in-memory, per account, and bounded by LRU eviction.
+"""
+
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+_QUOTED_LINE_RE = re.compile(r"^\s*>.*$", re.MULTILINE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def parse_message_ids(value: Optional[str]) -> List[str]:
+    """Message-IDs in header order, e.g. from a References header"""
+    return _MESSAGE_ID_RE.findall(value or "")
+
+
+def body_fingerprint(body: str) -> Optional[str]:
+    """Hash of the body ignoring quoted lines, whitespace and case"""
+    text = _WHITESPACE_RE.sub(" ", _QUOTED_LINE_RE.sub("", body or "")).strip().lower()
+    if not text:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _LRU(OrderedDict):
+    """OrderedDict that evicts its oldest entries beyond max_size"""
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+@dataclass
+class _Thread:
+    latest_message_id: Optional[str] = None
+    pending: List[Dict] = field(default_factory=list)  # admitted, not yet answered
+    classification: Optional[Dict] = None
+    classified_at: float = 0.0
+
+
+@dataclass
+class ThreadStats:
+    duplicates: int = 0
+    cached_classifications: int = 0
+    coalesced: int = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "duplicates_dropped": self.duplicates,
+            "classifications_reused": self.cached_classifications,
+            "replies_coalesced": self.coalesced
+        }
+
+
+class ThreadTracker:
+    """Per-account thread state for dedup, classification reuse and coalescing"""
+
+    def __init__(
+        self,
+        max_threads: int = 10000,
+        duplicate_ttl: float = 24 * 3600,
+        classification_ttl: float = 24 * 3600,
+        burst_window: float = 15 * 60
+    ):
+        self.duplicate_ttl = duplicate_ttl
+        self.classification_ttl = classification_ttl
+        self.burst_window = burst_window
+        self._threads: _LRU = _LRU(max_threads)
+        self._roots: _LRU = _LRU(max_threads * 4)  # message id -> thread root
+        self._fingerprints: _LRU = _LRU(max_threads * 4)  # (thread, sender, body hash) -> (seen at, message id)
+        self.stats = ThreadStats()
+
+    def thread_root(self, email_data: Dict) -> Optional[str]:
+        """Oldest known ancestor of a message, or the message itself"""
+        references = parse_message_ids(email_data.get("references"))
+        in_reply_to = parse_message_ids(email_data.get("in_reply_to"))
+        for message_id in in_reply_to[-1:] + references[::-1]:
+            if message_id in self._roots:
+                return self._roots[message_id]
+        if references:
+            return references[0]
+        if in_reply_to:
+            return in_reply_to[0]
+        return email_data.get("message_id")
+
+    def admit(self, email_data: Dict) -> bool:
+        """
+        Register an inbound email and set its thread_id; False when it is a
+        near-duplicate of a recent email from the same sender in the same
+        thread (a retry of the same message is not a duplicate)
+        """
+        now = time.monotonic()
+        root = self.thread_root(email_data)
+        email_data["thread_id"] = root
+        message_id = email_data.get("message_id")
+
+        # HTML-only emails carry just a text prefix until a reply is generated
+        body = email_data.get("body_html") if email_data.get("body_text_partial") else email_data.get("body_text")
+        fingerprint = body_fingerprint(body)
+        if fingerprint:
+            key = (root, (email_data.get("from_address") or "").lower(), fingerprint)
+            seen = self._fingerprints.get(key)
+            if seen is not None and now - seen[0] < self.duplicate_ttl and (not message_id or seen[1] != message_id):
+                self.stats.duplicates += 1
+                return False
+            self._fingerprints.put(key, (now, message_id))
+
+        if not root or not message_id:
+            return True
+
+        self._roots.put(message_id, root)
+        thread = self._threads.get(root) or _Thread()
+        thread.latest_message_id = message_id
+        if all(m["message_id"] != message_id for m in thread.pending):  # not a retry
+            thread.pending.append({
+                "message_id": message_id,
+                "imap_id": email_data.get("imap_id"),
+                "admitted_at": now,
+                "subject": email_data.get("subject"),
+                "body_text": email_data.get("body_text")
+            })
+        self._threads.put(root, thread)
+        return True
+
+    def cached_classification(self, email_data: Dict) -> Optional[Dict]:
+        """Classification of an earlier message in the same thread, if fresh"""
+        thread = self._threads.get(email_data.get("thread_id"))
+        if not thread or not thread.classification:
+            return None
+        if time.monotonic() - thread.classified_at > self.classification_ttl:
+            return None
+        self.stats.cached_classifications += 1
+        return {**thread.classification, "source": "thread"}
+
+    def store_classification(self, email_data: Dict, classification: Dict):
+        thread = self._threads.get(email_data.get("thread_id"))
+        if thread:
+            thread.classification = classification
+            thread.classified_at = time.monotonic()
+
+    def take_burst(self, email_data: Dict) -> Optional[List[Dict]]:
+        """
+        Earlier unanswered messages of this thread to answer together with
+        this one, or None when a newer message of the thread is in flight
+        and will answer for it
+        """
+        thread = self._threads.get(email_data.get("thread_id"))
+        if not thread:
+            return []
+        if thread.latest_message_id != email_data.get("message_id"):
+            self.stats.coalesced += 1
+            return None
+
+        cutoff = time.monotonic() - self.burst_window
+        return [
+            m for m in thread.pending
+            if m["message_id"] != thread.latest_message_id and m["admitted_at"] >= cutoff
+        ]
+
+    def is_pending(self, email_data: Dict) -> bool:
+        """Whether this message still waits for a reply in its thread"""
+        thread = self._threads.get(email_data.get("thread_id"))
+        return bool(thread) and any(m["message_id"] == email_data.get("message_id") for m in thread.pending)
+
+    def settle(self, email_data: Dict) -> List[int]:
+        """
+        Forget this message and the thread's earlier pending ones: its
+        reply was sent, or the thread was handed to a human. Returns the
+        IMAP ids of the messages forgotten
+        """
+        thread = self._threads.get(email_data.get("thread_id"))
+        if not thread:
+            return []
+        return self._settle(thread, email_data.get("message_id"))
+
+    def drop(self, imap_ids: Iterable[int]) -> List[int]:
+        """
+        Settle pending messages by IMAP id (given up on) together with the
+        earlier ones they would have answered. Returns the IMAP ids forgotten
+        """
+        imap_ids = set(imap_ids)
+        if not imap_ids:
+            return []
+        dropped = []
+        for thread in self._threads.values():
+            for m in reversed(thread.pending):
+                if m["imap_id"] in imap_ids:
+                    dropped.extend(self._settle(thread, m["message_id"]))
+                    break
+        return dropped
+
+    @staticmethod
+    def _settle(thread: _Thread, message_id: Optional[str]) -> List[int]:
+        settled = next((m["admitted_at"] for m in thread.pending if m["message_id"] == message_id), None)
+        if settled is None:
+            return []
+        done = [m["imap_id"] for m in thread.pending if m["admitted_at"] <= settled]
+        thread.pending = [m for m in thread.pending if m["admitted_at"] > settled]
+        return [i for i in done if i is not None]
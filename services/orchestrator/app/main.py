@@ -3,15 +3,22 @@ AI Agent Platform - Main Orchestrator API
 FastAPI-based routing service for intelligent AI model selection
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
 import logging
+import json
 
 from app.core.config import settings
-from app.core.router import IntelligentRouter, TaskType
-from app.services.model_clients import ModelClientFactory, ModelProvider
+from app.services.chat_service import generate_reply, stream_reply
+from app.services.conversation_history import get_conversation_history
+from app.services.agent_config import get_agent_config_cache
+from app.services.embeddings import get_embedder
+from app.services.kb_sync import SyncInProgress, get_kb_sync, load_knowledge_base
+from app.models.database import dispose_engines, get_read_session, pool_stats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,9 +31,16 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 AI Agent Orchestrator starting up...")
     logger.info(f"Environment: {settings.ENVIRONMENT}")
+    await get_agent_config_cache().start()
+    await get_kb_sync().resume_pending()
     yield
     # Shutdown
     logger.info("🛑 Shutting down...")
+    await get_kb_sync().close()
+    await get_conversation_history().close()
+    await get_agent_config_cache().close()
+    await get_embedder().close()
+    await dispose_engines()
 
 app = FastAPI(
     title="AI Agent Platform - Orchestrator",
@@ -64,6 +78,7 @@ async def health_check():
 # API Routes
 from pydantic import BaseModel
 from typing import Optional, List, Dict
+import os
 import uuid
 
 class ChatRequest(BaseModel):
@@ -90,42 +105,45 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
     logger.info(f"Processing chat request for agent: {request.agent_id}")
     
     try:
-        # Get router for this agent
-        intelligent_router = IntelligentRouter(
-            user_tier="pro",  # TODO: Fetch from database
-            conversation_context={}
-        )
-        
-        # Make routing decision
-        decision = intelligent_router.route(request.message)
-        logger.info(f"Routing decision: {decision.provider.value} ({decision.confidence})")
-        
-        # Get model client
-        client = ModelClientFactory.get_client(decision.provider)
-        
-        # Generate response
-        response = await client.generate(
-            prompt=request.message,
+        # The turn is recorded in the conversation history (written to the database in batches)
+        result = await generate_reply(
             agent_id=request.agent_id,
-            conversation_id=request.conversation_id or str(uuid.uuid4())
+            message=request.message,
+            conversation_id=request.conversation_id,
+            channel=request.channel,
+            visitor_id=request.visitor_id
         )
         
-        # TODO: Save to database
-        # background_tasks.add_task(save_conversation, ...)
-        
-        return ChatResponse(
-            response=response.text,
-            conversation_id=request.conversation_id or str(uuid.uuid4()),
-            model_used=response.model,
-            confidence=decision.confidence,
-            cost_usd=response.cost_usd,
-            latency_ms=response.latency_ms
-        )
+        return ChatResponse(**result)
         
     except Exception as e:
         logger.error(f"Error processing chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint - newline-delimited JSON, one {"token": ...}
+    line per chunk, then a final {"done": true, ...} line
+    """
+    logger.info(f"Processing streaming chat request for agent: {request.agent_id}")
+    
+    async def events():
+        try:
+            async for event in stream_reply(
+                agent_id=request.agent_id,
+                message=request.message,
+                conversation_id=request.conversation_id,
+                channel=request.channel,
+                visitor_id=request.visitor_id
+            ):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat: {str(e)}")
+            yield json.dumps({"done": True, "error": str(e)}) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 class AgentCreateRequest(BaseModel):
     name: str
     description: Optional[str] = None
@@ -153,25 +171,142 @@ async def create_agent(request: AgentCreateRequest):
 
 @app.get("/api/v1/agents/{agent_id}")
 async def get_agent(agent_id: str):
-    """Get agent details"""
-    # TODO: Fetch from database
+    """Get agent details (from the agent config cache)"""
+    try:
+        config = await get_agent_config_cache().get(agent_id)
+    except Exception as e:
+        logger.error(f"Error loading agent: {str(e)}")
+        raise HTTPException(status_code=503, detail="Agent configuration unavailable")
+    
+    if config is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
     return {
-        "id": agent_id,
-        "name": "Demo Agent",
-        "status": "active"
+        **config.as_dict(),
+        "status": "active" if config.is_active else "inactive"
     }
 
+@app.post("/api/v1/knowledge-bases/{knowledge_base_id}/sync")
+async def sync_knowledge_base(knowledge_base_id: str, request: Request, full: bool = True):
+    """
+    Incrementally re-index a knowledge base from an export of its documents:
+    an NDJSON body, one {"id", "text", "metadata"} object per line. Only
+    new and changed chunks are embedded; with full=true, documents missing
+    from the export are removed. The agent and chunking settings are the
+    knowledge base's own. Returns the background job
+    """
+    try:
+        knowledge_base = await load_knowledge_base(knowledge_base_id)
+    except Exception as e:
+        logger.error(f"Could not load knowledge base {knowledge_base_id}: {str(e)}")
+        raise HTTPException(status_code=503, detail="Knowledge base unavailable")
+    if knowledge_base is None:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    
+    sync = get_kb_sync()
+    path = sync.spool_path()
+    try:
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                await asyncio.to_thread(f.write, chunk)
+        job = await sync.start(knowledge_base, path, full_export=full)
+    except SyncInProgress as e:
+        os.remove(path)
+        raise HTTPException(status_code=409, detail={"error": str(e), "job": e.job.as_dict()})
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        logger.error(f"Error starting knowledge base sync: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return job.as_dict()
+
+@app.get("/api/v1/knowledge-bases/sync/{job_id}")
+async def knowledge_base_sync_status(job_id: str):
+    """Progress of a knowledge base sync"""
+    job = get_kb_sync().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.as_dict()
+
 @app.get("/api/v1/agents/{agent_id}/analytics")
-async def get_analytics(agent_id: str, days: int = 30):
+async def get_analytics(agent_id: str, days: int = 30, db=Depends(get_read_session)):
     """Get conversation analytics for agent"""
-    # TODO: Implement analytics query
+    from app.services.analytics_service import AnalyticsService
+    try:
+        trends = await AnalyticsService(db).get_trend_analysis(agent_id, days)
+    except Exception as e:
+        logger.error(f"Analytics error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
     return {
         "agent_id": agent_id,
         "period_days": days,
-        "total_conversations": 0,
-        "avg_sentiment": 0.5
+        **trends
     }
 
+# ============================================
+# INTERNAL: EMAIL CLASSIFICATION
+# ============================================
+
+from app.services.email_classifier import get_email_classifier
+
+class ClassifyRequest(BaseModel):
+    prompt: str
+
+class EmailToClassify(BaseModel):
+    id: str
+    from_address: str = ""
+    subject: str = ""
+    body_text: str = ""
+
+class BatchClassifyRequest(BaseModel):
+    emails: List[EmailToClassify]
+
+class EmailClassification(BaseModel):
+    id: str
+    category: Optional[str] = None
+    sentiment: Optional[str] = None
+    requires_human: Optional[bool] = None
+    priority: Optional[str] = None
+    confidence: Optional[float] = None
+    error: Optional[str] = None
+
+class BatchClassifyResponse(BaseModel):
+    results: List[EmailClassification]
+
+@app.post("/api/v1/internal/classify")
+async def classify(request: ClassifyRequest):
+    """Classify a single email from a caller-built prompt"""
+    try:
+        return await get_email_classifier().classify_prompt(request.prompt)
+    except Exception as e:
+        logger.error(f"Error classifying email: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+@app.post("/api/v1/internal/classify/batch", response_model=BatchClassifyResponse)
+async def classify_batch(request: BatchClassifyRequest):
+    """
+    Classify N emails in as few model calls as possible; each result
+    carries either a classification or its own error
+    """
+    results = await get_email_classifier().classify_many([e.model_dump() for e in request.emails])
+    return BatchClassifyResponse(results=results)
+
+@app.get("/api/v1/internal/agent-config/stats")
+async def agent_config_stats():
+    """Agent config cache hits, stale answers and database queries"""
+    return get_agent_config_cache().stats()
+
+@app.get("/api/v1/internal/database/stats")
+async def database_stats():
+    """Connections checked out of each database pool against its capacity"""
+    return pool_stats()
+
+@app.get("/api/v1/internal/embeddings/stats")
+async def embedding_stats():
+    """Embedding throughput (embeddings per second of model time), batch sizes and cache hits"""
+    return get_embedder().stats()
+
 if __name__ == "__main__":
     uvicorn.run(
         app,
@@ -0,0 +1,437 @@
+"""
+Database
+
+Async SQLAlchemy layer over the schema in scripts/init.sql:
+
+- declarative models for its tables (columns named as in init.sql,
+  except "metadata", which SQLAlchemy reserves: mapped as `metadata_`)
+- one pooled asyncpg engine per process for writes
+  (settings.DATABASE_URL) and one per replica in
+  settings.DATABASE_READ_URLS; pools are sized by DATABASE_POOL_SIZE and
+  DATABASE_MAX_OVERFLOW, connections are pre-pinged and recycled, and
+  asyncpg's prepared statement cache is kept across queries
+- get_session() is the per-request FastAPI dependency (primary);
+  get_read_session() is the same on a replica, for reads that can
+  tolerate replication lag (falls back to the primary when none is set)
+- pool_stats() reports each pool's checked-out connections against its
+  capacity and how often it ran full (callers then wait up to
+  DATABASE_POOL_TIMEOUT for a connection)
+"""
+
+import itertools
+import logging
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    event,
+    text
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# MODELS
+# ============================================
+
+class Base(DeclarativeBase):
+    pass
+
+
+def _uuid_pk() -> Mapped[str]:
+    return mapped_column(UUID(as_uuid=False), primary_key=True, server_default=text("uuid_generate_v4()"))
+
+
+def _created_at() -> Mapped[Optional[datetime]]:
+    return mapped_column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id: Mapped[str] = _uuid_pk()
+    email: Mapped[str] = mapped_column(String(255), unique=True)
+    password_hash: Mapped[str] = mapped_column(String(255))
+    full_name: Mapped[Optional[str]] = mapped_column(String(255))
+    company_name: Mapped[Optional[str]] = mapped_column(String(255))
+    tier: Mapped[Optional[str]] = mapped_column(String(50), server_default="free")
+    monthly_message_limit: Mapped[Optional[int]] = mapped_column(Integer, server_default="1000")
+    messages_used_this_month: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+    stripe_customer_id: Mapped[Optional[str]] = mapped_column(String(255))
+    created_at: Mapped[Optional[datetime]] = _created_at()
+    updated_at: Mapped[Optional[datetime]] = _created_at()
+    last_login: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class Agent(Base):
+    __tablename__ = "agents"
+
+    id: Mapped[str] = _uuid_pk()
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"))
+    name: Mapped[str] = mapped_column(String(255))
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    system_prompt: Mapped[Optional[str]] = mapped_column(Text)
+    model_config: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    channels: Mapped[Optional[List]] = mapped_column(JSONB)
+    knowledge_base_id: Mapped[Optional[str]] = mapped_column(UUID(as_uuid=False))
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, server_default=text("true"))
+    created_at: Mapped[Optional[datetime]] = _created_at()
+    updated_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class KnowledgeBase(Base):
+    __tablename__ = "knowledge_bases"
+
+    id: Mapped[str] = _uuid_pk()
+    agent_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"))
+    name: Mapped[str] = mapped_column(String(255))
+    source_type: Mapped[Optional[str]] = mapped_column(String(50))
+    embedding_model: Mapped[Optional[str]] = mapped_column(String(100), server_default="all-MiniLM-L6-v2")
+    chunk_size: Mapped[Optional[int]] = mapped_column(Integer, server_default="512")
+    chunk_overlap: Mapped[Optional[int]] = mapped_column(Integer, server_default="50")
+    documents_count: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+    last_updated: Mapped[Optional[datetime]] = _created_at()
+
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id: Mapped[str] = _uuid_pk()
+    agent_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"))
+    channel: Mapped[str] = mapped_column(String(50))
+    visitor_id: Mapped[Optional[str]] = mapped_column(String(255))
+    visitor_metadata: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    status: Mapped[Optional[str]] = mapped_column(String(50), server_default="active")
+    sentiment_score: Mapped[Optional[float]] = mapped_column(Float)
+    total_messages: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+    first_response_time: Mapped[Optional[int]] = mapped_column(Integer)  # seconds
+    avg_response_time: Mapped[Optional[int]] = mapped_column(Integer)
+    total_cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 6), server_default="0")
+    started_at: Mapped[Optional[datetime]] = _created_at()
+    ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class Message(Base):
+    __tablename__ = "messages"
+
+    id: Mapped[str] = _uuid_pk()
+    conversation_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("conversations.id", ondelete="CASCADE")
+    )
+    role: Mapped[str] = mapped_column(String(20))
+    content: Mapped[str] = mapped_column(Text)
+    metadata_: Mapped[Optional[Dict]] = mapped_column("metadata", JSONB)
+    model_used: Mapped[Optional[str]] = mapped_column(String(100))
+    tokens_used: Mapped[Optional[int]] = mapped_column(Integer)
+    latency_ms: Mapped[Optional[int]] = mapped_column(Integer)
+    cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 6))
+    sentiment_score: Mapped[Optional[float]] = mapped_column(Float)
+    intent: Mapped[Optional[str]] = mapped_column(String(100))
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class ConversationAnalytics(Base):
+    __tablename__ = "conversation_analytics"
+
+    id: Mapped[str] = _uuid_pk()
+    agent_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"))
+    date: Mapped[date] = mapped_column(Date)
+
+    # Volume metrics
+    total_conversations: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+    total_messages: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+    unique_visitors: Mapped[Optional[int]] = mapped_column(Integer, server_default="0")
+
+    # Performance metrics
+    avg_first_response_time: Mapped[Optional[int]] = mapped_column(Integer)
+    avg_conversation_duration: Mapped[Optional[int]] = mapped_column(Integer)
+    resolution_rate: Mapped[Optional[Decimal]] = mapped_column(Numeric(5, 2))
+    escalation_rate: Mapped[Optional[Decimal]] = mapped_column(Numeric(5, 2))
+
+    # Sentiment metrics
+    avg_sentiment_score: Mapped[Optional[float]] = mapped_column(Float)
+    positive_conversations: Mapped[Optional[int]] = mapped_column(Integer)
+    neutral_conversations: Mapped[Optional[int]] = mapped_column(Integer)
+    negative_conversations: Mapped[Optional[int]] = mapped_column(Integer)
+
+    # Cost metrics
+    total_cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 2))
+    cost_per_conversation: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 4))
+
+    top_intents: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    channel_distribution: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class UsageLedger(Base):
+    __tablename__ = "usage_ledger"
+
+    agent_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"), primary_key=True
+    )
+    model_used: Mapped[str] = mapped_column(String(100), primary_key=True)
+    bucket_hour: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    requests: Mapped[int] = mapped_column(Integer, server_default="0")
+    tokens_used: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    cost_usd: Mapped[Decimal] = mapped_column(Numeric(14, 6), server_default="0")
+    updated_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class EmailAccount(Base):
+    __tablename__ = "email_accounts"
+
+    id: Mapped[str] = _uuid_pk()
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"))
+    agent_id: Mapped[Optional[str]] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("agents.id", ondelete="SET NULL")
+    )
+    email_address: Mapped[str] = mapped_column(String(255))
+    imap_host: Mapped[str] = mapped_column(String(255))
+    imap_port: Mapped[Optional[int]] = mapped_column(Integer, server_default="993")
+    smtp_host: Mapped[str] = mapped_column(String(255))
+    smtp_port: Mapped[Optional[int]] = mapped_column(Integer, server_default="587")
+    username: Mapped[str] = mapped_column(String(255))
+    password_encrypted: Mapped[str] = mapped_column(String(500))
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, server_default=text("true"))
+    last_sync: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    uid_validity: Mapped[Optional[int]] = mapped_column(BigInteger)  # IMAP UIDVALIDITY of INBOX at last sync
+    last_seen_uid: Mapped[Optional[int]] = mapped_column(BigInteger, server_default="0")
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class EmailMessage(Base):
+    __tablename__ = "email_messages"
+
+    id: Mapped[str] = _uuid_pk()
+    email_account_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("email_accounts.id", ondelete="CASCADE")
+    )
+    conversation_id: Mapped[Optional[str]] = mapped_column(UUID(as_uuid=False), ForeignKey("conversations.id"))
+    message_id: Mapped[str] = mapped_column(String(500))  # IMAP message ID
+    thread_id: Mapped[Optional[str]] = mapped_column(String(500))
+    from_address: Mapped[str] = mapped_column(String(255))
+    to_addresses: Mapped[List[str]] = mapped_column(ARRAY(Text))
+    cc_addresses: Mapped[Optional[List[str]]] = mapped_column(ARRAY(Text))
+    subject: Mapped[Optional[str]] = mapped_column(String(500))
+    body_text: Mapped[Optional[str]] = mapped_column(Text)
+    body_html: Mapped[Optional[str]] = mapped_column(Text)
+    attachments: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    status: Mapped[Optional[str]] = mapped_column(String(50), server_default="pending")
+    category: Mapped[Optional[str]] = mapped_column(String(50))
+    classification_source: Mapped[Optional[str]] = mapped_column(String(20))
+    ai_response: Mapped[Optional[str]] = mapped_column(Text)
+    ai_confidence: Mapped[Optional[float]] = mapped_column(Float)
+    requires_human: Mapped[Optional[bool]] = mapped_column(Boolean, server_default=text("false"))
+    received_at: Mapped[datetime] = mapped_column(DateTime)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class DigitalHuman(Base):
+    __tablename__ = "digital_humans"
+
+    id: Mapped[str] = _uuid_pk()
+    agent_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"))
+    name: Mapped[str] = mapped_column(String(255))
+    avatar_provider: Mapped[Optional[str]] = mapped_column(String(50))
+    avatar_id: Mapped[Optional[str]] = mapped_column(String(255))
+    voice_provider: Mapped[Optional[str]] = mapped_column(String(50))
+    voice_id: Mapped[Optional[str]] = mapped_column(String(255))
+    voice_config: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    appearance_config: Mapped[Optional[Dict]] = mapped_column(JSONB)
+    gesture_enabled: Mapped[Optional[bool]] = mapped_column(Boolean, server_default=text("true"))
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class Integration(Base):
+    __tablename__ = "integrations"
+
+    id: Mapped[str] = _uuid_pk()
+    agent_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("agents.id", ondelete="CASCADE"))
+    type: Mapped[str] = mapped_column(String(50))
+    name: Mapped[str] = mapped_column(String(255))
+    config: Mapped[Dict] = mapped_column(JSONB)
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, server_default=text("true"))
+    last_triggered: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class UsageLog(Base):
+    __tablename__ = "usage_logs"
+
+    id: Mapped[str] = _uuid_pk()
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"))
+    agent_id: Mapped[Optional[str]] = mapped_column(
+        UUID(as_uuid=False), ForeignKey("agents.id", ondelete="SET NULL")
+    )
+    event_type: Mapped[str] = mapped_column(String(50))
+    model_used: Mapped[Optional[str]] = mapped_column(String(100))
+    tokens_used: Mapped[Optional[int]] = mapped_column(Integer)
+    cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(10, 6))
+    metadata_: Mapped[Optional[Dict]] = mapped_column("metadata", JSONB)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+class Subscription(Base):
+    __tablename__ = "subscriptions"
+
+    id: Mapped[str] = _uuid_pk()
+    user_id: Mapped[str] = mapped_column(UUID(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"))
+    stripe_subscription_id: Mapped[Optional[str]] = mapped_column(String(255))
+    plan: Mapped[str] = mapped_column(String(50))
+    status: Mapped[Optional[str]] = mapped_column(String(50), server_default="active")
+    current_period_start: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    current_period_end: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    cancel_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[Optional[datetime]] = _created_at()
+
+
+# ============================================
+# ENGINES & SESSIONS
+# ============================================
+
+class _PoolMetrics:
+    """Connections checked out of one engine's pool, from pool events"""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.capacity = settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW
+        self.checked_out = 0
+        self.peak = 0
+        self.checkouts = 0
+        self.full = 0  # checkouts that took the last free connection
+        self.full_since: Optional[float] = None
+        self.full_seconds = 0.0
+        event.listen(engine.sync_engine, "checkout", self._checkout)
+        event.listen(engine.sync_engine, "checkin", self._checkin)
+
+    def _checkout(self, *_):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak = max(self.peak, self.checked_out)
+        if self.checked_out >= self.capacity and self.full_since is None:
+            self.full += 1
+            self.full_since = time.monotonic()
+            if self.full == 1:
+                logger.warning(f"Database pool {self.name} is full ({self.capacity} connections), callers are waiting")
+
+    def _checkin(self, *_):
+        self.checked_out -= 1
+        if self.full_since is not None and self.checked_out < self.capacity:
+            self.full_seconds += time.monotonic() - self.full_since
+            self.full_since = None
+
+    def as_dict(self) -> Dict:
+        full_seconds = self.full_seconds + (time.monotonic() - self.full_since if self.full_since else 0.0)
+        return {
+            "capacity": self.capacity,
+            "checked_out": self.checked_out,
+            "saturation": round(self.checked_out / self.capacity, 3) if self.capacity else 0.0,
+            "peak_checked_out": self.peak,
+            "checkouts": self.checkouts,
+            "times_full": self.full,
+            "seconds_full": round(full_seconds, 3)
+        }
+
+
+_engine: Optional[AsyncEngine] = None
+_read_engines: List[AsyncEngine] = []
+_read_cycle: Optional[itertools.cycle] = None
+_sessions: Dict[int, async_sessionmaker] = {}
+_metrics: List[_PoolMetrics] = []
+
+
+def async_url(url: str) -> str:
+    """postgresql:// URLs with the asyncpg driver"""
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    engine = create_async_engine(
+        async_url(url),
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=True,
+        pool_use_lifo=True,  # idle connections beyond the working set age out
+        connect_args={"prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE}
+    )
+    _metrics.append(_PoolMetrics(name, engine))
+    return engine
+
+
+def get_engine() -> AsyncEngine:
+    """The primary: every write, and reads that must see them"""
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(settings.DATABASE_URL, "primary")
+    return _engine
+
+
+def get_read_engine() -> AsyncEngine:
+    """A replica (round-robin over settings.DATABASE_READ_URLS), or the primary if there are none"""
+    global _read_cycle
+    if _read_cycle is None:
+        urls = [url.strip() for url in settings.DATABASE_READ_URLS.split(",") if url.strip()]
+        _read_engines.extend(_create_engine(url, f"replica-{i}") for i, url in enumerate(urls))
+        _read_cycle = itertools.cycle(_read_engines)
+    return next(_read_cycle) if _read_engines else get_engine()
+
+
+def session_factory(engine: AsyncEngine) -> async_sessionmaker:
+    factory = _sessions.get(id(engine))
+    if factory is None:
+        factory = _sessions[id(engine)] = async_sessionmaker(engine, expire_on_commit=False)
+    return factory
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency: a primary session for the request, rolled back on error"""
+    async with session_factory(get_engine())() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency: a replica session for reads that tolerate replication lag"""
+    async with session_factory(get_read_engine())() as session:
+        yield session
+
+
+def pool_stats() -> Dict:
+    return {metrics.name: metrics.as_dict() for metrics in _metrics}
+
+
+async def dispose_engines():
+    global _engine, _read_cycle
+    for engine in ([_engine] if _engine else []) + _read_engines:
+        await engine.dispose()
+    _engine, _read_cycle = None, None
+    _read_engines.clear()
+    _sessions.clear()
+    _metrics.clear()
@@ -0,0 +1,304 @@
+"""
+Agent Configuration Cache
+
+Agents (system prompt, model config, channels) joined with their owner's
+tier, served from memory so a chat turn makes no database round-trip:
+
+- every agent is preloaded at startup; an agent not cached yet is loaded
+  on first use (concurrent misses share one query), and unknown ids are
+  remembered for a short while too
+- entries expire after settings.AGENT_CACHE_TTL (jittered, so preloaded
+  entries do not all expire together). An expired entry is refreshed on
+  use, but if the database does not answer within
+  settings.AGENT_CACHE_REFRESH_TIMEOUT_MS the stale entry is served and
+  the refresh finishes in the background
+- changes are pushed rather than waited for
+  (settings.AGENT_CACHE_INVALIDATION): Postgres LISTEN on the
+  agent_config channel, fed by triggers on agents and users
+  (scripts/init.sql), or a Redis pub/sub channel of the same name.
+  Payloads are an agent id, "user:<id>" (a tier change) or "*". After a
+  reconnect every entry is expired, since notifications may have been
+  missed; a row read while a change was announced is stored expired
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "agent_config"
+_NEGATIVE_TTL = 30.0  # seconds an unknown agent id is remembered
+_PRELOAD_PAGE = 5000
+
+
+@dataclass
+class AgentConfig:
+    id: str
+    user_id: str
+    name: str
+    user_tier: str
+    description: Optional[str] = None
+    system_prompt: Optional[str] = None
+    model_config: Dict = field(default_factory=dict)
+    channels: List[str] = field(default_factory=list)
+    knowledge_base_id: Optional[str] = None
+    is_active: bool = True
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class _Entry:
+    config: Optional[AgentConfig]  # None: no such agent
+    expires: float
+
+
+Loader = Callable[[Optional[List[str]], Optional[str], int], Awaitable[List[AgentConfig]]]
+
+_AGENT_COLUMNS = (
+    "SELECT a.id, a.user_id, a.name, a.description, a.system_prompt, a.model_config, a.channels, "
+    "a.knowledge_base_id, a.is_active, u.tier "
+    "FROM agents a JOIN users u ON u.id = a.user_id "
+)
+
+
+async def load_from_database(
+    agent_ids: Optional[List[str]] = None,
+    after: Optional[str] = None,
+    limit: int = _PRELOAD_PAGE
+) -> List[AgentConfig]:
+    """The given agents, or (preloading) a page of all agents ordered by id after `after`"""
+    from sqlalchemy import text
+    from app.models.database import get_engine
+    if agent_ids is not None:
+        query, params = _AGENT_COLUMNS + "WHERE a.id = ANY(CAST(:ids AS uuid[]))", {"ids": agent_ids}
+    else:
+        query = _AGENT_COLUMNS + ("WHERE a.id > CAST(:after AS uuid) " if after else "") + "ORDER BY a.id LIMIT :limit"
+        params = {"after": after, "limit": limit} if after else {"limit": limit}
+    async with get_engine().connect() as connection:
+        rows = (await connection.execute(text(query), params)).fetchall()
+    return [
+        AgentConfig(
+            id=str(row[0]),
+            user_id=str(row[1]),
+            name=row[2],
+            description=row[3],
+            system_prompt=row[4],
+            model_config=row[5] or {},
+            channels=row[6] or [],
+            knowledge_base_id=str(row[7]) if row[7] else None,
+            is_active=bool(row[8]),
+            user_tier=row[9] or "free"
+        )
+        for row in rows
+    ]
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+class AgentConfigCache:
+    """In-memory agent configs, preloaded, expired by TTL and invalidated by notifications"""
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        refresh_timeout: Optional[float] = None,
+        invalidation: Optional[str] = None,
+        loader: Optional[Loader] = None
+    ):
+        self.ttl = ttl if ttl is not None else settings.AGENT_CACHE_TTL
+        self.refresh_timeout = (
+            refresh_timeout if refresh_timeout is not None else settings.AGENT_CACHE_REFRESH_TIMEOUT_MS / 1000
+        )
+        self.invalidation = invalidation or settings.AGENT_CACHE_INVALIDATION
+        self.loader = loader or load_from_database
+        self._entries: Dict[str, _Entry] = {}
+        self._agents_by_user: Dict[str, Set[str]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._connections = 0
+        self._epoch = 0  # bumped by every invalidation
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "stale_served": 0,
+            "database_queries": 0,
+            "invalidations": 0
+        }
+
+    async def start(self):
+        """Preload every agent and start listening for changes (at startup)"""
+        if self.invalidation != "none" and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+        started = time.perf_counter()
+        try:
+            after, loaded = None, 0
+            while True:
+                self._counters["database_queries"] += 1
+                epoch = self._epoch
+                page = await self.loader(None, after, _PRELOAD_PAGE)
+                for config in page:
+                    self._store(config.id, config, fresh=epoch == self._epoch)
+                loaded += len(page)
+                if len(page) < _PRELOAD_PAGE:
+                    break
+                after = page[-1].id
+            logger.info(f"Preloaded {loaded} agent configs in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Could not preload agent configs, loading them on first use: {str(e)}")
+
+    async def get(self, agent_id: str) -> Optional[AgentConfig]:
+        """The agent's config, None if there is no such agent; raises only if it was never loadable"""
+        agent_id = str(agent_id)
+        entry = self._entries.get(agent_id)
+        if entry is not None and entry.expires > time.monotonic():
+            self._counters["hits"] += 1
+            return entry.config
+        if not _is_uuid(agent_id):
+            return None  # never a row in agents
+
+        if entry is None:
+            self._counters["misses"] += 1
+            return await asyncio.shield(self._load(agent_id))
+
+        # Expired: refresh, but answer from the stale entry if the database is slow or failing
+        if agent_id in self._loading:
+            self._counters["stale_served"] += 1  # someone is already waiting on the database
+            return entry.config
+        self._counters["refreshes"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._load(agent_id)), self.refresh_timeout)
+        except Exception as e:
+            self._counters["stale_served"] += 1
+            if not isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"Could not refresh agent {agent_id}, serving cached config: {str(e)}")
+            return entry.config
+
+    def invalidate(self, key: str):
+        """Expire an agent ("<agent id>"), every agent of a user ("user:<id>") or everything ("*")"""
+        self._counters["invalidations"] += 1
+        self._epoch += 1
+        if key == "*":
+            agent_ids = list(self._entries)
+        elif key.startswith("user:"):
+            agent_ids = list(self._agents_by_user.get(key[len("user:"):], ()))
+        else:
+            agent_ids = [key]
+        for agent_id in agent_ids:
+            entry = self._entries.get(agent_id)
+            if entry is not None:
+                entry.expires = 0.0
+
+    def stats(self) -> Dict:
+        return {**self._counters, "agents": len(self._entries)}
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    # ---- loading ----
+
+    def _load(self, agent_id: str) -> asyncio.Future:
+        loading = self._loading.get(agent_id)
+        if loading is None:
+            loading = self._loading[agent_id] = asyncio.ensure_future(self._fetch(agent_id))
+            loading.add_done_callback(lambda _: self._loading.pop(agent_id, None))
+            # A refresh abandoned for a stale answer still finishes; nobody may read its error
+            loading.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return loading
+
+    async def _fetch(self, agent_id: str) -> Optional[AgentConfig]:
+        self._counters["database_queries"] += 1
+        epoch = self._epoch
+        configs = await self.loader([agent_id], None, 1)
+        config = configs[0] if configs else None
+        self._store(agent_id, config, fresh=epoch == self._epoch)
+        return config
+
+    def _store(self, agent_id: str, config: Optional[AgentConfig], fresh: bool = True):
+        previous = self._entries.get(agent_id)
+        if previous is not None and previous.config is not None:
+            self._agents_by_user.get(previous.config.user_id, set()).discard(agent_id)
+        ttl = self.ttl * random.uniform(0.9, 1.1) if config is not None else _NEGATIVE_TTL
+        # Not fresh: a change was announced meanwhile, the row may predate it
+        self._entries[agent_id] = _Entry(config, time.monotonic() + ttl if fresh else 0.0)
+        if config is not None:
+            self._agents_by_user.setdefault(config.user_id, set()).add(agent_id)
+
+    # ---- notifications ----
+
+    async def _listen(self):
+        backoff = 1.0
+        while True:
+            try:
+                if self.invalidation == "redis":
+                    await self._listen_redis()
+                else:
+                    await self._listen_postgres()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Agent config notifications lost, reconnecting in {backoff:.0f}s: {str(e)}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _connected(self):
+        logger.info(f"Listening for agent config changes ({self.invalidation})")
+        self._connections += 1
+        if self._connections > 1:
+            self.invalidate("*")  # changes while disconnected were not announced
+
+    async def _listen_postgres(self):
+        import asyncpg
+        connection = await asyncpg.connect(settings.DATABASE_URL)
+        try:
+            await connection.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: self.invalidate(payload))
+            self._connected()
+            while True:
+                await asyncio.sleep(30)
+                await connection.fetchval("SELECT 1")  # notice a dropped connection
+        finally:
+            await connection.close()
+
+    async def _listen_redis(self):
+        import redis.asyncio as redis
+        client = redis.from_url(settings.REDIS_URL)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+            self._connected()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    self.invalidate(data.decode() if isinstance(data, bytes) else str(data))
+        finally:
+            await pubsub.close()
+            await client.close()
+
+
+_agent_config_cache: Optional[AgentConfigCache] = None
+
+
+def get_agent_config_cache() -> AgentConfigCache:
+    """Process-wide cache, preloaded by the orchestrator at startup"""
+    global _agent_config_cache
+    if _agent_config_cache is None:
+        _agent_config_cache = AgentConfigCache()
+    return _agent_config_cache
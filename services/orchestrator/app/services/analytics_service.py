@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, desc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import pandas as pd
@@ -7,7 +8,7 @@ import numpy as np
 from collections import Counter
 import logging
 
-from app.models.database import Conversation, Message, ConversationAnalytics
+from app.models.database import Conversation, Message, ConversationAnalytics, UsageLedger
 
 logger = logging.getLogger(__name__)
 
@@ -215,7 +216,8 @@ class AnalyticsService:
     
     async def _save_analytics(self, analytics: Dict):
         """Save analytics to database"""
-        analytics_record = ConversationAnalytics(**analytics)
+        columns = ConversationAnalytics.__table__.columns
+        analytics_record = ConversationAnalytics(**{k: v for k, v in analytics.items() if k in columns})
         self.db.add(analytics_record)
         await self.db.commit()
     
@@ -348,25 +350,36 @@ class AnalyticsService:
             ]
         }
     
-    async def get_cost_breakdown(self, agent_id: str, days: int = 30) -> Dict:
+    async def get_cost_breakdown(
+        self,
+        agent_id: str,
+        days: int = 30,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> Dict:
         """
         Detailed cost analytics by model usage
+
+        Served from the hourly usage ledger, so the window is aligned to
+        whole hours: buckets starting at or after start_date and before
+        end_date, both floored to the hour, are included.
         """
-        start_date = datetime.utcnow() - timedelta(days=days)
+        start_date = self._floor_hour(start_date or datetime.utcnow() - timedelta(days=days))
+        end_date = self._floor_hour(end_date) if end_date else None
+        
+        conditions = [
+            UsageLedger.agent_id == agent_id,
+            UsageLedger.bucket_hour >= start_date
+        ]
+        if end_date:
+            conditions.append(UsageLedger.bucket_hour < end_date)
         
-        # Query messages with cost data
         query = select(
-            Message.model_used,
-            func.count(Message.id).label('count'),
-            func.sum(Message.cost_usd).label('total_cost'),
-            func.sum(Message.tokens_used).label('total_tokens')
-        ).join(Conversation).where(
-            and_(
-                Conversation.agent_id == agent_id,
-                Message.created_at >= start_date,
-                Message.model_used.isnot(None)
-            )
-        ).group_by(Message.model_used)
+            UsageLedger.model_used,
+            func.sum(UsageLedger.requests).label('count'),
+            func.sum(UsageLedger.cost_usd).label('total_cost'),
+            func.sum(UsageLedger.tokens_used).label('total_tokens')
+        ).where(and_(*conditions)).group_by(UsageLedger.model_used)
         
         result = await self.db.execute(query)
         model_costs = result.all()
@@ -375,15 +388,124 @@ class AnalyticsService:
             "models": [
                 {
                     "model": row.model_used,
-                    "requests": row.count,
+                    "requests": int(row.count),
                     "total_cost": float(row.total_cost) if row.total_cost else 0,
-                    "total_tokens": row.total_tokens or 0,
+                    "total_tokens": int(row.total_tokens or 0),
                     "avg_cost_per_request": float(row.total_cost / row.count) if row.count > 0 and row.total_cost else 0
                 }
                 for row in model_costs
             ],
             "total_cost": sum(float(row.total_cost) for row in model_costs if row.total_cost),
-            "total_requests": sum(row.count for row in model_costs)
+            "total_requests": sum(int(row.count) for row in model_costs)
         }
         
         return cost_breakdown
+    
+    async def reconcile_usage_ledger(
+        self,
+        agent_id: str,
+        start_date: datetime,
+        end_date: Optional[datetime] = None,
+        repair: bool = False
+    ) -> Dict:
+        """
+        Compare usage_ledger buckets against raw messages for a window
+
+        Returns every (model, hour) bucket where the ledger disagrees with
+        the messages table. With repair=True the ledger rows are overwritten
+        with the recomputed values. Both ends are floored to the hour, so a
+        partly elapsed last hour is left out rather than compared against a
+        whole bucket.
+        """
+        start_date = self._floor_hour(start_date)
+        end_date = self._floor_hour(end_date or datetime.utcnow())
+        bucket = func.date_trunc('hour', Message.created_at)
+        
+        raw_query = select(
+            Message.model_used,
+            bucket.label('bucket_hour'),
+            func.count(Message.id).label('requests'),
+            func.coalesce(func.sum(Message.tokens_used), 0).label('tokens_used'),
+            func.coalesce(func.sum(Message.cost_usd), 0).label('cost_usd')
+        ).join(Conversation).where(
+            and_(
+                Conversation.agent_id == agent_id,
+                Message.created_at >= start_date,
+                Message.created_at < end_date,
+                Message.model_used.isnot(None)
+            )
+        ).group_by(Message.model_used, bucket)
+        
+        ledger_query = select(UsageLedger).where(
+            and_(
+                UsageLedger.agent_id == agent_id,
+                UsageLedger.bucket_hour >= start_date,
+                UsageLedger.bucket_hour < end_date
+            )
+        )
+        
+        raw = {
+            (row.model_used, row.bucket_hour): (int(row.requests), int(row.tokens_used), float(row.cost_usd))
+            for row in (await self.db.execute(raw_query)).all()
+        }
+        ledger = {
+            (row.model_used, row.bucket_hour): (row.requests, int(row.tokens_used), float(row.cost_usd))
+            for row in (await self.db.execute(ledger_query)).scalars().all()
+        }
+        
+        mismatches = []
+        for key in sorted(set(raw) | set(ledger), key=lambda k: (k[1], k[0])):
+            expected = raw.get(key, (0, 0, 0.0))
+            actual = ledger.get(key, (0, 0, 0.0))
+            if expected[:2] != actual[:2] or abs(expected[2] - actual[2]) > 1e-6:
+                mismatches.append({
+                    "model": key[0],
+                    "bucket_hour": key[1].isoformat(),
+                    "expected": dict(zip(("requests", "tokens_used", "cost_usd"), expected)),
+                    "ledger": dict(zip(("requests", "tokens_used", "cost_usd"), actual))
+                })
+        
+        if repair and mismatches:
+            await self._repair_usage_ledger(agent_id, mismatches, raw)
+        
+        if mismatches:
+            logger.warning(f"Usage ledger drift for agent {agent_id}: {len(mismatches)} buckets")
+        
+        return {
+            "agent_id": agent_id,
+            "buckets_checked": len(set(raw) | set(ledger)),
+            "mismatches": mismatches,
+            "repaired": repair and bool(mismatches)
+        }
+    
+    async def _repair_usage_ledger(self, agent_id: str, mismatches: List[Dict], raw: Dict):
+        """Overwrite drifted ledger buckets with values recomputed from messages"""
+        for mismatch in mismatches:
+            bucket_hour = datetime.fromisoformat(mismatch["bucket_hour"])
+            requests, tokens_used, cost_usd = raw.get((mismatch["model"], bucket_hour), (0, 0, 0.0))
+            
+            stmt = pg_insert(UsageLedger).values(
+                agent_id=agent_id,
+                model_used=mismatch["model"],
+                bucket_hour=bucket_hour,
+                requests=requests,
+                tokens_used=tokens_used,
+                cost_usd=cost_usd
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[UsageLedger.agent_id, UsageLedger.model_used, UsageLedger.bucket_hour],
+                set_={
+                    "requests": stmt.excluded.requests,
+                    "tokens_used": stmt.excluded.tokens_used,
+                    "cost_usd": stmt.excluded.cost_usd,
+                    "updated_at": func.now()
+                }
+            )
+            await self.db.execute(stmt)
+        
+        await self.db.commit()
+    
+    @staticmethod
+    def _floor_hour(value: datetime) -> datetime:
+        """Align a timestamp to the start of its ledger bucket"""
+        return value.replace(minute=0, second=0, microsecond=0)
@@ -0,0 +1,147 @@
+"""
+Chat Turns
+
+Routing plus generation for one chat message, with the owner's tier from
+the agent config cache (agent_config.py) and the conversation's recent
+history (a token-bounded window from conversation_history.py) as context. Used by the /api/v1/chat endpoints and, when a service runs in
+the same process as the orchestrator, called directly by its
+orchestrator client (no HTTP hop).
+"""
+
+import logging
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.router import IntelligentRouter, RoutingDecision
+from app.services.agent_config import get_agent_config_cache
+from app.services.conversation_history import HistoryWindow, get_conversation_history
+from app.services.model_clients import ModelClientFactory
+
+logger = logging.getLogger(__name__)
+
+
+def route(message: str, history: Optional[HistoryWindow] = None, user_tier: Optional[str] = None) -> RoutingDecision:
+    intelligent_router = IntelligentRouter(
+        user_tier=user_tier or settings.AGENT_DEFAULT_TIER,
+        conversation_context={"history": history.messages, "history_tokens": history.tokens} if history else {}
+    )
+    decision = intelligent_router.route(message)
+    logger.info(f"Routing decision: {decision.provider.value} ({decision.confidence})")
+    return decision
+
+
+async def agent_tier(agent_id: str) -> str:
+    """The agent owner's tier, from memory in steady state"""
+    try:
+        config = await get_agent_config_cache().get(agent_id)
+    except Exception as e:
+        logger.error(f"Could not load agent {agent_id}, routing with the default tier: {str(e)}")
+        return settings.AGENT_DEFAULT_TIER
+    return config.user_tier if config else settings.AGENT_DEFAULT_TIER
+
+
+async def history_window(conversation_id: Optional[str]) -> Tuple[str, HistoryWindow]:
+    """The conversation id (new if None) and its recent turns"""
+    history = get_conversation_history()
+    if conversation_id is None:
+        conversation_id = str(uuid.uuid4())
+        await history.start(conversation_id)
+        return conversation_id, HistoryWindow()
+    return conversation_id, await history.window(conversation_id)
+
+
+async def generate_reply(
+    agent_id: str,
+    message: str,
+    conversation_id: Optional[str] = None,
+    channel: str = "web",
+    visitor_id: Optional[str] = None
+) -> Dict:
+    """Complete reply; keys match ChatResponse"""
+    conversation_id, history = await history_window(conversation_id)
+    decision = route(message, history, await agent_tier(agent_id))
+    client = ModelClientFactory.get_client(decision.provider)
+
+    response = await client.generate(
+        prompt=message,
+        agent_id=agent_id,
+        conversation_id=conversation_id,
+        context=history.messages
+    )
+    await get_conversation_history().append(
+        conversation_id,
+        agent_id,
+        [
+            {"role": "user", "content": message},
+            {
+                "role": "assistant",
+                "content": response.text,
+                "model_used": response.model,
+                "tokens_used": response.tokens_used,
+                "latency_ms": response.latency_ms,
+                "cost_usd": response.cost_usd
+            }
+        ],
+        channel=channel,
+        visitor_id=visitor_id
+    )
+
+    return {
+        "response": response.text,
+        "conversation_id": conversation_id,
+        "model_used": response.model,
+        "confidence": decision.confidence,
+        "cost_usd": response.cost_usd,
+        "latency_ms": response.latency_ms
+    }
+
+
+async def stream_reply(
+    agent_id: str,
+    message: str,
+    conversation_id: Optional[str] = None,
+    channel: str = "web",
+    visitor_id: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """{"token": ...} events as they are generated, then one {"done": true, ...}"""
+    conversation_id, history = await history_window(conversation_id)
+    decision = route(message, history, await agent_tier(agent_id))
+    client = ModelClientFactory.get_client(decision.provider)
+
+    tokens = []
+    async for token in client.stream(
+        prompt=message,
+        agent_id=agent_id,
+        conversation_id=conversation_id,
+        context=history.messages
+    ):
+        tokens.append(token)
+        yield {"token": token}
+
+    # Recorded like generate_reply's, so the usage ledger counts streamed turns under the same model
+    response = client.last_response
+    reply = {"role": "assistant", "content": "".join(tokens), "model_used": decision.provider.value}
+    if response is not None:
+        reply.update(
+            model_used=response.model,
+            tokens_used=response.tokens_used,
+            latency_ms=response.latency_ms,
+            cost_usd=response.cost_usd
+        )
+    await get_conversation_history().append(
+        conversation_id,
+        agent_id,
+        [{"role": "user", "content": message}, reply],
+        channel=channel,
+        visitor_id=visitor_id
+    )
+
+    yield {
+        "done": True,
+        "conversation_id": conversation_id,
+        "model_used": reply["model_used"],
+        "confidence": decision.confidence,
+        "cost_usd": reply.get("cost_usd"),
+        "latency_ms": reply.get("latency_ms")
+    }
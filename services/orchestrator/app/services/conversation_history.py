@@ -0,0 +1,479 @@
+"""
+Conversation History
+
+Recent turns of each conversation for multi-turn prompts, without a
+database read per turn:
+
+- a hot tier holds the last settings.CONVERSATION_HOT_TURNS turns of each
+  conversation with their token counts: an in-process LRU of
+  settings.CONVERSATION_CACHE_SIZE conversations, or Redis
+  (settings.CONVERSATION_HISTORY_BACKEND = "redis") when several workers
+  serve the same conversations
+- a conversation missing from the hot tier is loaded once from the
+  messages table (concurrent misses share the query); conversations
+  started here never query it
+- window() returns the most recent turns that fit a token budget
+- new turns go to the hot tier at once and are written to conversations
+  and messages in batches by a background flush (write-behind), each
+  with the time it was appended as created_at (a batch is one
+  transaction, whose CURRENT_TIMESTAMP would tie every row).
+  Conversations or agents whose ids are not UUIDs (demo agents, external
+  session ids) only live in the hot tier
+
+A failing hot tier or database degrades to an empty history for that
+turn; it never fails the chat.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TURN_OVERHEAD = 4  # tokens a chat message costs beyond its content (role, separators)
+
+_encoding = None
+_encoding_failed = False
+_last_timestamp = datetime.min
+
+
+def count_tokens(text: str) -> int:
+    """cl100k_base token count; about four characters per token if the encoding cannot load"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Token encoding unavailable, estimating history tokens from length: {str(e)}")
+            _encoding_failed = True
+    if _encoding is None:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    tokens: int
+
+    @classmethod
+    def of(cls, role: str, content: str) -> "Turn":
+        return cls(role, content, count_tokens(content) + _TURN_OVERHEAD)
+
+    def as_message(self) -> Dict:
+        return {"role": self.role, "content": self.content}
+
+
+@dataclass
+class HistoryWindow:
+    messages: List[Dict] = field(default_factory=list)  # oldest first, {"role", "content"}
+    tokens: int = 0
+    truncated: bool = False  # older turns did not fit
+
+
+Loader = Callable[[str, int], Awaitable[List[Turn]]]
+Writer = Callable[[List[Dict]], Awaitable[None]]
+
+
+class _MemoryTier:
+    """Per-process LRU of conversations"""
+
+    def __init__(self, max_conversations: int, max_turns: int):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self._items: "OrderedDict[str, Deque[Turn]]" = OrderedDict()
+
+    async def get(self, conversation_id: str) -> Optional[List[Turn]]:
+        turns = self._items.get(conversation_id)
+        if turns is None:
+            return None
+        self._items.move_to_end(conversation_id)
+        return list(turns)
+
+    async def put(self, conversation_id: str, turns: List[Turn]):
+        self._items[conversation_id] = deque(turns, maxlen=self.max_turns)
+        self._items.move_to_end(conversation_id)
+        while len(self._items) > self.max_conversations:
+            self._items.popitem(last=False)
+
+    async def append(self, conversation_id: str, turns: List[Turn]) -> bool:
+        """False if the conversation is not hot (the caller loads it instead)"""
+        hot = self._items.get(conversation_id)
+        if hot is None:
+            return False
+        hot.extend(turns)
+        self._items.move_to_end(conversation_id)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class _RedisTier:
+    """
+    Turns in a Redis list per conversation, shared by every worker. A
+    separate marker key says the list holds the whole recent history
+    (a list alone cannot tell "no turns yet" from "not loaded")
+    """
+
+    def __init__(self, url: str, max_turns: int, ttl: int):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.max_turns = max_turns
+        self.ttl = ttl
+
+    async def get(self, conversation_id: str) -> Optional[List[Turn]]:
+        key, marker = self._keys(conversation_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(marker)
+        pipe.lrange(key, 0, -1)
+        hot, raw = await pipe.execute()
+        if not hot:
+            return None
+        return [Turn(**json.loads(item)) for item in raw]
+
+    async def put(self, conversation_id: str, turns: List[Turn]):
+        key, marker = self._keys(conversation_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        if turns:
+            pipe.rpush(key, *(self._encode(turn) for turn in turns[-self.max_turns:]))
+            pipe.expire(key, self.ttl)
+        pipe.set(marker, 1, ex=self.ttl)
+        await pipe.execute()
+
+    async def append(self, conversation_id: str, turns: List[Turn]) -> bool:
+        key, marker = self._keys(conversation_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.exists(marker)
+        pipe.rpush(key, *(self._encode(turn) for turn in turns))
+        pipe.ltrim(key, -self.max_turns, -1)
+        pipe.expire(key, self.ttl)
+        pipe.expire(marker, self.ttl)
+        hot = (await pipe.execute())[0]
+        return bool(hot)  # if not, the caller reloads and put() replaces the partial list
+
+    async def close(self):
+        await self.redis.close()
+
+    @staticmethod
+    def _encode(turn: Turn) -> str:
+        return json.dumps({"role": turn.role, "content": turn.content, "tokens": turn.tokens})
+
+    @staticmethod
+    def _keys(conversation_id: str):
+        return f"conversation:{conversation_id}:turns", f"conversation:{conversation_id}:hot"
+
+
+# ---- messages table ----
+
+async def load_from_database(conversation_id: str, limit: int) -> List[Turn]:
+    """The conversation's last `limit` messages, oldest first"""
+    from sqlalchemy import text
+    from app.models.database import get_engine
+    async with get_engine().connect() as connection:
+        result = await connection.execute(
+            text(
+                "SELECT role, content FROM messages WHERE conversation_id = :conversation_id "
+                "ORDER BY created_at DESC LIMIT :limit"
+            ),
+            {"conversation_id": conversation_id, "limit": limit}
+        )
+        rows = result.fetchall()
+    return [Turn.of(role, content) for role, content in reversed(rows)]
+
+
+async def write_to_database(rows: List[Dict]):
+    """Insert messages (and their conversations, if new) in one transaction"""
+    from sqlalchemy import text
+    from app.models.database import get_engine
+    conversations: Dict[str, Dict] = {}
+    for row in rows:
+        conversation = conversations.setdefault(row["conversation_id"], {
+            "id": row["conversation_id"],
+            "agent_id": row["agent_id"],
+            "channel": row["channel"],
+            "visitor_id": row["visitor_id"],
+            "messages": 0,
+            "cost": 0.0
+        })
+        conversation["messages"] += 1
+        conversation["cost"] += row["cost_usd"] or 0.0
+
+    async with get_engine().begin() as connection:
+        await connection.execute(
+            text(
+                "INSERT INTO conversations (id, agent_id, channel, visitor_id) "
+                "VALUES (:id, :agent_id, :channel, :visitor_id) ON CONFLICT (id) DO NOTHING"
+            ),
+            [{k: c[k] for k in ("id", "agent_id", "channel", "visitor_id")} for c in conversations.values()]
+        )
+        await connection.execute(
+            text(
+                "INSERT INTO messages "
+                "(conversation_id, role, content, model_used, tokens_used, latency_ms, cost_usd, created_at) "
+                "VALUES (:conversation_id, :role, :content, :model_used, :tokens_used, :latency_ms, :cost_usd, "
+                ":created_at)"
+            ),
+            [{k: row[k] for k in (
+                "conversation_id", "role", "content", "model_used", "tokens_used", "latency_ms", "cost_usd",
+                "created_at"
+            )} for row in rows]
+        )
+        await connection.execute(
+            text(
+                "UPDATE conversations SET total_messages = total_messages + :messages, "
+                "total_cost_usd = total_cost_usd + :cost WHERE id = :id"
+            ),
+            [{"id": c["id"], "messages": c["messages"], "cost": c["cost"]} for c in conversations.values()]
+        )
+
+
+def _timestamp() -> datetime:
+    """Now (UTC), strictly after the previous call so turns appended together keep their order"""
+    global _last_timestamp
+    _last_timestamp = max(datetime.utcnow(), _last_timestamp + timedelta(microseconds=1))
+    return _last_timestamp
+
+
+def _is_uuid(value: Optional[str]) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+class ConversationHistory:
+    """Hot recent turns per conversation over the messages table"""
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        max_conversations: Optional[int] = None,
+        max_turns: Optional[int] = None,
+        context_tokens: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: int = 10000,
+        loader: Optional[Loader] = None,
+        writer: Optional[Writer] = None
+    ):
+        backend = backend or settings.CONVERSATION_HISTORY_BACKEND
+        self.max_turns = max_turns or settings.CONVERSATION_HOT_TURNS
+        self.context_tokens = context_tokens or settings.CONVERSATION_CONTEXT_TOKENS
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else settings.CONVERSATION_FLUSH_INTERVAL_MS / 1000
+        )
+        self.max_pending = max_pending
+        self.loader = loader or load_from_database
+        self.writer = writer or write_to_database
+        if backend == "redis":
+            self.tier = _RedisTier(settings.REDIS_URL, self.max_turns, settings.CONVERSATION_REDIS_TTL)
+        else:
+            self.tier = _MemoryTier(max_conversations or settings.CONVERSATION_CACHE_SIZE, self.max_turns)
+
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._pending: Deque[Dict] = deque()  # rows not yet written to the database
+        self._flushing: List[Dict] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._counters = {"hot_hits": 0, "hot_misses": 0, "database_loads": 0, "rows_written": 0, "rows_dropped": 0}
+
+    async def start(self, conversation_id: str):
+        """A conversation created here: known empty, no database read needed"""
+        try:
+            await self.tier.put(conversation_id, [])
+        except Exception as e:
+            logger.error(f"Conversation history unavailable: {str(e)}")
+
+    async def window(
+        self,
+        conversation_id: str,
+        max_tokens: Optional[int] = None,
+        max_turns: Optional[int] = None
+    ) -> HistoryWindow:
+        """The most recent turns fitting max_tokens (and max_turns), oldest first, starting with a user turn"""
+        try:
+            turns = await self._turns(conversation_id)
+        except Exception as e:
+            logger.error(f"Could not load history of conversation {conversation_id}: {str(e)}")
+            return HistoryWindow()
+
+        budget = self.context_tokens if max_tokens is None else max_tokens
+        limit = len(turns) if max_turns is None else max_turns
+        selected: List[Turn] = []
+        tokens = 0
+        for turn in reversed(turns):
+            if len(selected) >= limit or tokens + turn.tokens > budget:
+                break
+            selected.append(turn)
+            tokens += turn.tokens
+        selected.reverse()
+        while selected and selected[0].role == "assistant":
+            # Without the question it answered; chat APIs also expect a user turn first
+            tokens -= selected.pop(0).tokens
+        return HistoryWindow(
+            messages=[turn.as_message() for turn in selected],
+            tokens=tokens,
+            truncated=len(selected) < len(turns)
+        )
+
+    async def append(
+        self,
+        conversation_id: str,
+        agent_id: str,
+        messages: List[Dict],
+        channel: str = "web",
+        visitor_id: Optional[str] = None
+    ):
+        """
+        Record turns ({"role", "content"}, optionally model_used, tokens_used,
+        latency_ms, cost_usd): hot at once, in the database after the next flush
+        """
+        turns = [Turn.of(message["role"], message["content"]) for message in messages]
+        if _is_uuid(conversation_id) and _is_uuid(agent_id):
+            for message in messages:
+                self._queue({
+                    "conversation_id": conversation_id,
+                    "agent_id": agent_id,
+                    "channel": channel,
+                    "visitor_id": visitor_id,
+                    "role": message["role"],
+                    "content": message["content"],
+                    "model_used": message.get("model_used"),
+                    "tokens_used": message.get("tokens_used"),
+                    "latency_ms": message.get("latency_ms"),
+                    "cost_usd": message.get("cost_usd"),
+                    "created_at": _timestamp()
+                })
+
+        try:
+            if not await self.tier.append(conversation_id, turns):
+                # Evicted since it was read (or never read): reload, queued rows included
+                await self._turns(conversation_id)
+        except Exception as e:
+            logger.error(f"Could not update history of conversation {conversation_id}: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            **self._counters,
+            "pending_rows": len(self._pending) + len(self._flushing),
+            "hot_conversations": len(self.tier) if isinstance(self.tier, _MemoryTier) else None
+        }
+
+    async def close(self):
+        """Write out queued turns"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush()
+        if isinstance(self.tier, _RedisTier):
+            await self.tier.close()
+
+    # ---- hot tier ----
+
+    async def _turns(self, conversation_id: str) -> List[Turn]:
+        turns = await self.tier.get(conversation_id)
+        if turns is not None:
+            self._counters["hot_hits"] += 1
+            return turns
+        self._counters["hot_misses"] += 1
+
+        loading = self._loading.get(conversation_id)
+        if loading is None:
+            loading = self._loading[conversation_id] = asyncio.ensure_future(self._load(conversation_id))
+            loading.add_done_callback(lambda _: self._loading.pop(conversation_id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, conversation_id: str) -> List[Turn]:
+        self._counters["database_loads"] += 1
+        turns = await self.loader(conversation_id, self.max_turns) if _is_uuid(conversation_id) else []
+        # Turns recorded here but not flushed yet are not in the database
+        unwritten = [
+            Turn.of(row["role"], row["content"])
+            for row in list(self._flushing) + list(self._pending)
+            if row["conversation_id"] == conversation_id
+        ]
+        turns = (turns + unwritten)[-self.max_turns:]
+        await self.tier.put(conversation_id, turns)
+        return turns
+
+    # ---- write-behind ----
+
+    def _queue(self, row: Dict):
+        self._pending.append(row)
+        if len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            self._counters["rows_dropped"] += 1
+            if self._counters["rows_dropped"] == 1:
+                logger.warning("Conversation history writes are falling behind, dropping the oldest unwritten turns")
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending or self._flushing:
+            return
+        self._flushing = list(self._pending)
+        self._pending.clear()
+        try:
+            failed = await self._write(self._flushing)
+            if len(failed) == len(self._flushing):
+                # Nothing went in: the database is likely down, retry ahead of newer rows
+                self._pending.extendleft(reversed(failed))
+                while len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                    self._counters["rows_dropped"] += 1
+                await asyncio.sleep(self.flush_interval)
+            elif failed:
+                # Others went in, so these rows are the problem (e.g. an agent missing from agents)
+                self._counters["rows_dropped"] += len(failed)
+        finally:
+            self._flushing = []
+
+    async def _write(self, rows: List[Dict]) -> List[Dict]:
+        """Rows that could not be written; one conversation's error does not hold back the others"""
+        try:
+            await self.writer(rows)
+            self._counters["rows_written"] += len(rows)
+            return []
+        except Exception as e:
+            logger.error(f"Could not write {len(rows)} conversation messages: {str(e)}")
+
+        conversations: Dict[str, List[Dict]] = {}
+        for row in rows:
+            conversations.setdefault(row["conversation_id"], []).append(row)
+        if len(conversations) == 1:
+            return rows
+        failed = []
+        for conversation_rows in conversations.values():
+            try:
+                await self.writer(conversation_rows)
+                self._counters["rows_written"] += len(conversation_rows)
+            except Exception:
+                failed.extend(conversation_rows)
+        return failed
+
+
+_conversation_history: Optional[ConversationHistory] = None
+
+
+def get_conversation_history() -> ConversationHistory:
+    """Process-wide store, so every chat turn shares the hot tier"""
+    global _conversation_history
+    if _conversation_history is None:
+        _conversation_history = ConversationHistory()
+    return _conversation_history
@@ -0,0 +1,222 @@
+"""
+Batched Email Classification
+
+Classifies many emails with one model call. Concurrent requests are
+micro-batched: emails are queued and flushed into a single structured
+prompt when max_batch emails are waiting or max_wait has passed. The
+model answers with one JSON array; every email gets its own result, and
+emails the model skipped or answered with invalid data are retried once
+and otherwise returned with an error instead of failing the whole batch.
+
+A merged batch mixes emails from different callers, whose ids may clash,
+so the model sees each email's position in the batch as its id; the
+caller's id is only used in that caller's results.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.router import ModelProvider
+from app.services.model_clients import ModelClientFactory
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = {
+    "urgent_inquiry": "needs immediate response",
+    "general_inquiry": "standard question",
+    "complaint": "customer dissatisfaction",
+    "feedback": "suggestions/praise",
+    "spam": "promotional/irrelevant",
+    "newsletter": "mailing list/marketing",
+    "order_related": "purchase/shipping inquiry",
+    "auto_reply": "out-of-office/automated notification"
+}
+
+SENTIMENTS = {"positive", "neutral", "negative"}
+PRIORITIES = {"high", "medium", "low"}
+
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def build_batch_prompt(emails: List[Dict]) -> str:
+    """One structured prompt classifying every email, keyed by id"""
+    categories = "\n".join(f"- {name} ({hint})" for name, hint in CATEGORIES.items())
+    payload = json.dumps([
+        {
+            "id": e["id"],
+            "from": e.get("from_address", ""),
+            "subject": e.get("subject", ""),
+            "body": (e.get("body_text") or "")[:settings.EMAIL_CLASSIFY_BODY_CHARS]
+        }
+        for e in emails
+    ], ensure_ascii=False)
+
+    return f"""Classify each of the following {len(emails)} emails.
+
+Categories:
+{categories}
+
+For every email also determine sentiment (positive/neutral/negative),
+whether it requires a human (true/false) and priority (high/medium/low).
+
+Emails (JSON):
+{payload}
+
+Respond ONLY with a JSON array containing one object per email, in any order:
+[{{"id": "...", "category": "category_name", "sentiment": "positive|neutral|negative", "requires_human": true/false, "priority": "high|medium|low", "confidence": 0.0-1.0}}]"""
+
+
+def validate_classification(item: Dict) -> Dict:
+    """Normalize one model answer; raises ValueError if it is unusable"""
+    category = str(item.get("category", "")).strip().lower()
+    if category not in CATEGORIES:
+        raise ValueError(f"unknown category {category!r}")
+
+    sentiment = str(item.get("sentiment", "neutral")).lower()
+    priority = str(item.get("priority", "medium")).lower()
+    try:
+        confidence = min(1.0, max(0.0, float(item.get("confidence", 0.5))))
+    except (TypeError, ValueError):
+        confidence = 0.5
+
+    return {
+        "category": category,
+        "sentiment": sentiment if sentiment in SENTIMENTS else "neutral",
+        "requires_human": item.get("requires_human") in (True, "true", "True", 1),
+        "priority": priority if priority in PRIORITIES else "medium",
+        "confidence": confidence
+    }
+
+
+def parse_json(text: str, array: bool = True):
+    """Extract the JSON array (or object) from a model reply"""
+    match = (_JSON_ARRAY_RE if array else _JSON_OBJECT_RE).search(text or "")
+    if not match:
+        raise ValueError("no JSON in model response")
+    return json.loads(match.group(0))
+
+
+@dataclass
+class _Pending:
+    email: Dict
+    result: asyncio.Future
+
+
+class EmailClassifier:
+    """Micro-batching classifier shared by all classification requests"""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        max_batch: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        max_concurrent_calls: Optional[int] = None
+    ):
+        self.provider = ModelProvider(model or settings.EMAIL_CLASSIFIER_MODEL)
+        self.max_batch = max_batch or settings.EMAIL_CLASSIFY_MAX_BATCH
+        self.max_wait = max_wait if max_wait is not None else settings.EMAIL_CLASSIFY_MAX_WAIT_MS / 1000
+        self._calls = asyncio.Semaphore(max_concurrent_calls or settings.EMAIL_CLASSIFY_MAX_CONCURRENT_CALLS)
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def classify_many(self, emails: List[Dict]) -> List[Dict]:
+        """Classify emails (each with an "id"); results keep the input order"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for email in emails:
+            pending = _Pending(email, loop.create_future())
+            self._pending.append(pending)
+            futures.append(pending.result)
+
+        while len(self._pending) >= self.max_batch:
+            self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    async def classify_prompt(self, prompt: str) -> Dict:
+        """Single classification from a caller-built prompt (legacy endpoint)"""
+        async with self._calls:
+            response = await self._generate(prompt)
+        return validate_classification(parse_json(response, array=False))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _run_batch(self, batch: List[_Pending], retry: bool = True):
+        batch_error = None
+        try:
+            prompt = build_batch_prompt([{**p.email, "id": str(position)} for position, p in enumerate(batch)])
+            async with self._calls:
+                response = await self._generate(prompt)
+            answers = {str(item.get("id")): item for item in parse_json(response) if isinstance(item, dict)}
+        except Exception as e:
+            logger.error(f"Batch classification of {len(batch)} emails failed: {str(e)}")
+            answers, batch_error = {}, str(e)
+
+        failed = []
+        for position, pending in enumerate(batch):
+            answer = answers.get(str(position))
+            if answer is None:
+                failed.append((pending, batch_error or "missing from model response"))
+                continue
+            try:
+                result = validate_classification(answer)
+                self._resolve(pending, {"id": str(pending.email["id"]), **result})
+            except ValueError as e:
+                failed.append((pending, str(e)))
+
+        if failed and retry and answers:
+            # The model answered but skipped or garbled some emails: retry just those
+            await self._run_batch([p for p, _ in failed], retry=False)
+            return
+
+        for pending, error in failed:
+            self._resolve(pending, {"id": str(pending.email["id"]), "error": error})
+
+    async def _generate(self, prompt: str) -> str:
+        client = ModelClientFactory.get_client(self.provider)
+        response = await client.generate(
+            prompt=prompt,
+            agent_id="email-classifier",
+            conversation_id=str(uuid.uuid4()),
+            use_rag=False  # the prompt is the emails themselves, no knowledge base
+        )
+        return response.text
+
+    @staticmethod
+    def _resolve(pending: _Pending, result: Dict):
+        if not pending.result.done():
+            pending.result.set_result(result)
+
+
+_classifier: Optional[EmailClassifier] = None
+
+
+def get_email_classifier() -> EmailClassifier:
+    """Process-wide classifier, so concurrent requests share micro-batches"""
+    global _classifier
+    if _classifier is None:
+        _classifier = EmailClassifier()
+    return _classifier
@@ -0,0 +1,507 @@
+"""
+Quantized Embedding Store
+
+On-disk, memory-mapped vector index for many agents on one node (RAG
+backend "mmap"). Per agent, under settings.RAG_STORE_DIR/<agent_id>/:
+
+- codes.i8: int8 vectors (per-row scale in scales.f32), scanned to build
+  a shortlist; a quarter of the bytes of float32
+- vectors.f32: the exact vectors, read (not mapped) only for the
+  shortlist re-rank
+- alive.u8: tombstones; chunks.jsonl + offsets.u64: ids and payloads,
+  read only for the hits returned
+- ivf.npz: once an agent has settings.RAG_IVF_MIN_ROWS chunks, rows are
+  clustered (k-means) and stored list by list; rows appended later are
+  assigned to their nearest list in assign.i16, so a query scans only
+  the lists nearest to it. Clustering is redone when the agent has
+  doubled in size
+
+Nothing is held in RAM except for loaded agents' small headers
+(centroids, list offsets); agents are opened on first query and closed
+least recently used first, so resident memory is bounded by
+settings.RAG_STORE_MAX_LOADED_AGENTS rather than by the total number of
+chunks. Writes append to the current files and commit by atomically
+replacing meta.json; compaction (tombstones, IVF) writes a new
+generation directory and switches to it the same way.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.vector_index import SearchHit, VectorIndex, normalize
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_ROWS = 65536
+_FILES = ("codes.i8", "scales.f32", "vectors.f32", "alive.u8", "chunks.jsonl", "offsets.u64")
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: vector ~= codes * scale"""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def kmeans(sample: np.ndarray, clusters: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) over unit vectors; returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.flatnonzero(np.bincount(assign, minlength=clusters) == 0)
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+@dataclass
+class _Segment:
+    """Read-only view of one agent's committed rows"""
+    directory: str
+    size: int
+    dimension: int
+    codes: np.ndarray
+    scales: np.ndarray
+    vectors: np.ndarray
+    alive: np.ndarray  # writable map: tombstones are visible to readers immediately
+    offsets: np.ndarray
+    chunks_bytes: int
+    chunks_fd: int
+    vectors_fd: int
+    centroids: Optional[np.ndarray] = None
+    list_offsets: Optional[np.ndarray] = None
+    clustered: int = 0  # rows [0, clustered) are stored list by list
+    assign: Optional[np.ndarray] = None  # list of each row in [clustered, size)
+
+    def __del__(self):
+        # Only once no reader holds the segment any more
+        for fd in (self.chunks_fd, self.vectors_fd):
+            if fd >= 0:
+                os.close(fd)
+
+    def exact(self, rows: np.ndarray) -> np.ndarray:
+        """float32 vectors of a few rows; pread keeps them out of the resident set, unlike the map"""
+        width = self.dimension * 4
+        data = b"".join(os.pread(self.vectors_fd, width, int(row) * width) for row in rows)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), self.dimension)
+
+    def line(self, row: int) -> bytes:
+        end = self.offsets[row + 1] if row + 1 < self.size else self.chunks_bytes
+        start = self.offsets[row]
+        return os.pread(self.chunks_fd, int(end - start), int(start))
+
+    def record(self, row: int) -> Dict:
+        return json.loads(self.line(row))
+
+
+def _release(array: np.ndarray):
+    """Drop a map's pages from this process's resident set (they stay in the page cache)"""
+    mapped = getattr(array, "_mmap", None)
+    if mapped is not None:
+        mapped.madvise(mmap.MADV_DONTNEED)
+
+
+def _map(path: str, dtype, shape, mode: str = "r") -> np.ndarray:
+    if not shape[0]:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+
+class _AgentStore:
+    """One agent's files; writes are serialized by the caller's per-agent lock"""
+
+    def __init__(self, root: str, ivf_min_rows: int):
+        self.root = root
+        self.ivf_min_rows = ivf_min_rows
+        self.meta = self._read_meta()
+        self.dead = 0
+        self._rows: Optional[Dict[str, int]] = None  # id -> row, built on first write
+        self.segment = self._open()
+        if self.segment.size:
+            self.dead = self.segment.size - int(np.count_nonzero(self.segment.alive))
+
+    @property
+    def count(self) -> int:
+        return self.segment.size - self.dead
+
+    # ---- reads ----
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        score_threshold: Optional[float],
+        probes: int,
+        shortlist: int
+    ) -> List[SearchHit]:
+        seg = self.segment
+        if seg.size == 0 or top_k <= 0:
+            return []
+
+        if seg.centroids is not None:
+            lists = np.argsort(-(seg.centroids @ query))[:probes]
+            ranges = [np.arange(seg.list_offsets[l], seg.list_offsets[l + 1]) for l in lists]
+            ranges.append(seg.clustered + np.flatnonzero(np.isin(seg.assign, lists)))
+        else:
+            ranges = [np.arange(seg.size)]
+
+        # Approximate int8 scores over the scanned rows, keeping the best `keep` per block
+        keep = max(shortlist, top_k)
+        rows, scores = [], []
+        for scan in ranges:
+            for start in range(0, len(scan), _BLOCK_ROWS):
+                block = scan[start:start + _BLOCK_ROWS]
+                first, last = int(block[0]), int(block[-1]) + 1
+                if last - first == len(block):  # contiguous: slice the maps instead of gathering
+                    block = slice(first, last)
+                approx = (seg.codes[block].astype(np.float32) @ query) * seg.scales[block]
+                approx[seg.alive[block] == 0] = -np.inf
+                if len(approx) > keep:
+                    top = np.argpartition(-approx, keep - 1)[:keep]
+                else:
+                    top = np.arange(len(approx))
+                rows.append(scan[start + top])
+                scores.append(approx[top])
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        if len(rows) > keep:
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            rows, scores = rows[best], scores[best]
+        rows = np.sort(rows[scores > -np.inf])
+        if not len(rows):
+            return []
+
+        # Exact re-rank of the shortlist from the float32 file
+        exact = seg.exact(rows) @ query
+        hits = []
+        for i in np.argsort(-exact)[:top_k]:
+            score = float(exact[i])
+            if score_threshold is not None and score < score_threshold:
+                break
+            record = seg.record(int(rows[i]))
+            hits.append(SearchHit(record["id"], score, record["payload"]))
+        return hits
+
+    def retrieve(self, ids: List[str]) -> List[SearchHit]:
+        rows, seg = self._row_map(), self.segment
+        hits = []
+        for chunk_id in ids:
+            row = rows.get(chunk_id)
+            if row is not None:
+                record = seg.record(row)
+                hits.append(SearchHit(record["id"], 0.0, record["payload"]))
+        return hits
+
+    # ---- writes ----
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        rows = self._row_map()
+        replaced = [rows[chunk_id] for chunk_id in ids if chunk_id in rows]
+        self._append(ids, vectors, payloads)
+        # Tombstone the old versions only after the new ones are committed
+        self._tombstone(replaced)
+        self._maybe_rebuild()
+
+    def delete(self, ids: List[str]):
+        rows = self._row_map()
+        self._tombstone([rows.pop(chunk_id) for chunk_id in ids if chunk_id in rows])
+        self._maybe_rebuild()
+
+    def _append(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        seg = self.segment
+        size = seg.size
+        dimension = self.meta.get("dimension") or vectors.shape[1]
+        if vectors.shape[1] != dimension:
+            raise ValueError(f"Expected {dimension}-dimensional vectors, got {vectors.shape[1]}")
+        os.makedirs(seg.directory, exist_ok=True)
+
+        codes, scales = quantize(vectors)
+        files = [
+            ("codes.i8", size * dimension, codes.tobytes()),
+            ("scales.f32", size * 4, scales.tobytes()),
+            ("vectors.f32", size * dimension * 4, vectors.astype(np.float32).tobytes()),
+            ("alive.u8", size, np.ones(len(ids), dtype=np.uint8).tobytes())
+        ]
+        if seg.centroids is not None:
+            assign = np.argmax(vectors @ seg.centroids.T, axis=1).astype(np.int16)
+            files.append(("assign.i16", (size - seg.clustered) * 2, assign.tobytes()))
+        lines = [
+            (json.dumps({"id": chunk_id, "payload": payload}, separators=(",", ":")) + "\n").encode()
+            for chunk_id, payload in zip(ids, payloads)
+        ]
+        offsets = seg.chunks_bytes + np.concatenate(([0], np.cumsum([len(line) for line in lines])[:-1]))
+        files.append(("chunks.jsonl", seg.chunks_bytes, b"".join(lines)))
+        files.append(("offsets.u64", size * 8, offsets.astype(np.uint64).tobytes()))
+
+        # Bytes past the committed lengths are leftovers of an interrupted write
+        for name, committed, data in files:
+            path = os.path.join(seg.directory, name)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.truncate(committed)
+                f.seek(committed)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write_meta({
+            **self.meta,
+            "dimension": dimension,
+            "size": size + len(ids),
+            "chunks_bytes": seg.chunks_bytes + sum(len(line) for line in lines)
+        })
+        self.segment = self._open()  # readers still holding the old segment keep using it
+        if self._rows is not None:
+            for row, chunk_id in enumerate(ids, size):
+                self._rows[chunk_id] = row
+
+    def _tombstone(self, rows: List[int]):
+        if not rows:
+            return
+        alive = self.segment.alive
+        alive[np.asarray(rows)] = 0
+        alive.flush()
+        self.dead += len(rows)
+
+    def _row_map(self) -> Dict[str, int]:
+        if self._rows is None:
+            seg = self.segment
+            rows: Dict[str, int] = {}
+            for row in range(seg.size):
+                if seg.alive[row]:
+                    chunk_id = seg.record(row)["id"]
+                    if chunk_id in rows:  # duplicate left by an interrupted upsert: newest wins
+                        self._tombstone([rows[chunk_id]])
+                    rows[chunk_id] = row
+            self._rows = rows
+        return self._rows
+
+    def _maybe_rebuild(self):
+        seg = self.segment
+        if self.dead >= 1024 and self.dead * 4 >= seg.size:
+            self._rebuild()
+        elif self.count >= self.ivf_min_rows and seg.size - seg.clustered >= max(self.ivf_min_rows // 2, seg.clustered):
+            self._rebuild()  # not clustered yet, or doubled since
+
+    def _rebuild(self):
+        """Write live rows to a new generation (clustered into IVF lists when large) and switch to it"""
+        seg = self.segment
+        keep = np.flatnonzero(np.asarray(seg.alive[:seg.size]))
+        directory = os.path.join(self.root, f"gen-{self.meta.get('generation', 0) + 1:06d}")
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+        centroids = list_offsets = None
+        order = keep
+        if len(keep) >= self.ivf_min_rows:
+            clusters = int(np.clip(np.sqrt(len(keep)), 16, 4096))
+            sample = np.sort(np.random.default_rng(0).choice(keep, min(len(keep), clusters * 32), replace=False))
+            centroids = kmeans(np.asarray(seg.vectors[sample]), clusters)
+            assign = np.empty(len(keep), dtype=np.int32)
+            for start in range(0, len(keep), _BLOCK_ROWS):
+                block = np.asarray(seg.vectors[keep[start:start + _BLOCK_ROWS]])
+                assign[start:start + _BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+                _release(seg.vectors)
+            by_list = np.argsort(assign, kind="stable")
+            order = keep[by_list]
+            list_offsets = np.searchsorted(assign[by_list], np.arange(clusters + 1))
+
+        files = {name: open(os.path.join(directory, name), "wb") for name in _FILES}
+        chunks_bytes = 0
+        try:
+            for start in range(0, len(order), _BLOCK_ROWS):
+                rows = order[start:start + _BLOCK_ROWS]
+                files["codes.i8"].write(np.asarray(seg.codes[rows]).tobytes())
+                files["scales.f32"].write(np.asarray(seg.scales[rows]).tobytes())
+                files["vectors.f32"].write(np.asarray(seg.vectors[rows]).tobytes())
+                files["alive.u8"].write(np.ones(len(rows), dtype=np.uint8).tobytes())
+                lines = [seg.line(int(row)) for row in rows]
+                offsets = chunks_bytes + np.concatenate(([0], np.cumsum([len(line) for line in lines])[:-1]))
+                files["chunks.jsonl"].write(b"".join(lines))
+                files["offsets.u64"].write(offsets.astype(np.uint64).tobytes())
+                chunks_bytes += sum(len(line) for line in lines)
+                for array in (seg.codes, seg.scales, seg.vectors):
+                    _release(array)
+            for f in files.values():
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in files.values():
+                f.close()
+        if centroids is not None:
+            np.savez(os.path.join(directory, "ivf.npz"), centroids=centroids, list_offsets=list_offsets, clustered=len(order))
+
+        old = seg.directory
+        self._write_meta({
+            **self.meta,
+            "generation": self.meta.get("generation", 0) + 1,
+            "size": len(order),
+            "chunks_bytes": chunks_bytes
+        })
+        self.segment = self._open()
+        self.dead = 0
+        self._rows = None
+        shutil.rmtree(old, ignore_errors=True)  # open maps of the old files stay valid
+        logger.info(
+            f"Rebuilt {self.root}: {len(order)} rows"
+            + (f", {len(list_offsets) - 1} IVF lists" if list_offsets is not None else "")
+        )
+
+    # ---- files ----
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(os.path.join(self.root, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "size": 0, "chunks_bytes": 0}
+
+    def _write_meta(self, meta: Dict):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, "meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.meta = meta
+
+    def _open(self) -> _Segment:
+        meta = self.meta
+        directory = os.path.join(self.root, f"gen-{meta.get('generation', 0):06d}")
+        size, dimension = meta.get("size", 0), meta.get("dimension", 0)
+        path = lambda name: os.path.join(directory, name)  # noqa: E731
+
+        def fd(name: str) -> int:
+            return os.open(path(name), os.O_RDONLY) if os.path.exists(path(name)) else -1
+
+        segment = _Segment(
+            directory=directory,
+            size=size,
+            dimension=dimension,
+            codes=_map(path("codes.i8"), np.int8, (size, dimension)),
+            scales=_map(path("scales.f32"), np.float32, (size,)),
+            vectors=_map(path("vectors.f32"), np.float32, (size, dimension)),
+            alive=_map(path("alive.u8"), np.uint8, (size,), mode="r+"),
+            offsets=_map(path("offsets.u64"), np.uint64, (size,)),
+            chunks_bytes=meta.get("chunks_bytes", 0),
+            chunks_fd=fd("chunks.jsonl"),
+            vectors_fd=fd("vectors.f32")
+        )
+        if size and os.path.exists(path("ivf.npz")):
+            with np.load(path("ivf.npz")) as ivf:
+                segment.centroids = ivf["centroids"]
+                segment.list_offsets = ivf["list_offsets"]
+                segment.clustered = int(ivf["clustered"])
+            segment.assign = _map(path("assign.i16"), np.int16, (size - segment.clustered,))
+        return segment
+
+
+class EmbeddingStore(VectorIndex):
+    """Per-agent quantized stores, opened on demand, least recently used closed first"""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_loaded_agents: Optional[int] = None,
+        ivf_min_rows: Optional[int] = None,
+        probes: Optional[int] = None,
+        shortlist: int = 100
+    ):
+        self.root = root or settings.RAG_STORE_DIR
+        self.max_loaded_agents = max_loaded_agents or settings.RAG_STORE_MAX_LOADED_AGENTS
+        self.ivf_min_rows = ivf_min_rows or settings.RAG_IVF_MIN_ROWS
+        self.probes = probes or settings.RAG_IVF_PROBES
+        self.shortlist = shortlist
+        self.loads = 0
+        self._loaded: "OrderedDict[str, _AgentStore]" = OrderedDict()
+        self._loaded_lock = threading.Lock()
+        self._write_locks: Dict[str, threading.Lock] = {}
+
+    async def upsert(self, agent_id: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        if ids:
+            await asyncio.to_thread(self._locked, agent_id, "upsert", list(ids), normalize(vectors), list(payloads))
+
+    async def delete(self, agent_id: str, ids: List[str]):
+        if ids and os.path.exists(self._directory(agent_id)):
+            await asyncio.to_thread(self._locked, agent_id, "delete", list(ids))
+
+    async def search(
+        self,
+        agent_id: str,
+        vector: np.ndarray,
+        top_k: int = 3,
+        score_threshold: Optional[float] = None
+    ) -> List[SearchHit]:
+        if not os.path.exists(self._directory(agent_id)):
+            return []
+        return await asyncio.to_thread(self._search, agent_id, normalize(vector), top_k, score_threshold)
+
+    async def retrieve(self, agent_id: str, ids: List[str]) -> List[SearchHit]:
+        if not ids or not os.path.exists(self._directory(agent_id)):
+            return []
+        # The id -> row map is shared with writers
+        return await asyncio.to_thread(self._locked, agent_id, "retrieve", list(ids))
+
+    async def count(self, agent_id: str) -> int:
+        if not os.path.exists(self._directory(agent_id)):
+            return 0
+        return (await asyncio.to_thread(self._agent, agent_id)).count
+
+    async def close(self):
+        with self._loaded_lock:
+            self._loaded.clear()
+
+    @property
+    def loaded_agents(self) -> int:
+        return len(self._loaded)
+
+    def _search(self, agent_id: str, query: np.ndarray, top_k: int, score_threshold: Optional[float]):
+        return self._agent(agent_id).search(query, top_k, score_threshold, self.probes, self.shortlist)
+
+    def _locked(self, agent_id: str, operation: str, *args):
+        with self._loaded_lock:
+            lock = self._write_locks.setdefault(agent_id, threading.Lock())
+        with lock:
+            return getattr(self._agent(agent_id), operation)(*args)
+
+    def _agent(self, agent_id: str) -> _AgentStore:
+        with self._loaded_lock:
+            store = self._loaded.get(agent_id)
+            if store is not None:
+                self._loaded.move_to_end(agent_id)
+                return store
+            store = self._loaded[agent_id] = _AgentStore(self._directory(agent_id), self.ivf_min_rows)
+            self.loads += 1
+            self._evict()
+            return store
+
+    def _evict(self):
+        """Close least recently used agents; never one being written, so readers see its writes"""
+        excess = len(self._loaded) - self.max_loaded_agents
+        for agent_id in list(self._loaded):
+            if excess <= 0:
+                break
+            lock = self._write_locks.get(agent_id)
+            if lock is None or not lock.locked():
+                # In-flight searches keep their segment; its maps close when they finish
+                del self._loaded[agent_id]
+                excess -= 1
+
+    def _directory(self, agent_id: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(agent_id))
+        return os.path.join(self.root, safe)
@@ -0,0 +1,348 @@
+"""
+Text Embeddings
+
+Sentence-transformer embeddings (settings.EMBEDDING_MODEL) for knowledge
+base chunks and queries, shared by every caller in the process:
+
+- the model runs in a dedicated worker process, so encoding never holds
+  the event loop's GIL (settings.EMBEDDING_WORKER_PROCESS; off, it runs
+  in a worker thread instead)
+- concurrent calls are micro-batched: texts are queued and encoded in one
+  model call when max_batch texts are waiting or max_wait has passed;
+  queries go ahead of ingestion chunks
+- query vectors are cached in an LRU keyed by normalized text
+- embed_documents looks chunks up by content hash before encoding, so a
+  document uploaded by several agents is embedded once
+
+Vectors come back L2-normalized: a dot product is their cosine similarity.
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Models loaded in this process: the worker process, or the server itself in thread mode
+_models: Dict[str, object] = {}
+_models_lock = threading.Lock()
+
+# A failed model load is retried after this backoff, doubling up to the maximum
+_LOAD_RETRY_SECONDS = 5.0
+_LOAD_RETRY_MAX_SECONDS = 300.0
+
+
+def _model(model_name: str):
+    with _models_lock:
+        if model_name not in _models:
+            from sentence_transformers import SentenceTransformer
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
+
+
+def _dimension(model_name: str) -> int:
+    return _model(model_name).get_sentence_embedding_dimension()
+
+
+def _encode(model_name: str, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = _model(model_name).encode(
+        texts,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    return vectors.astype(np.float32, copy=False)
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: Unicode-normalized, case-folded, single-spaced"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class _LRU:
+    """Bounded mapping, least recently used entries dropped first"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[object, np.ndarray]" = OrderedDict()
+
+    def get(self, key) -> Optional[np.ndarray]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value: np.ndarray):
+        if self.max_size <= 0:
+            return
+        value = np.array(value)  # not a view that would keep its whole batch alive
+        value.flags.writeable = False  # shared by every caller
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+@dataclass
+class _Pending:
+    text: str
+    result: asyncio.Future
+
+
+class Embedder:
+    """Micro-batching, caching front end to the embedding model"""
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        batch_size: int = 64,
+        max_batch: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        query_cache_size: Optional[int] = None,
+        chunk_cache_size: Optional[int] = None,
+        worker_process: Optional[bool] = None
+    ):
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.batch_size = batch_size
+        self.max_batch = max_batch or settings.EMBEDDING_MAX_BATCH
+        self.max_wait = max_wait if max_wait is not None else settings.EMBEDDING_MAX_WAIT_MS / 1000
+        self.worker_process = settings.EMBEDDING_WORKER_PROCESS if worker_process is None else worker_process
+        self._queries = _LRU(settings.EMBEDDING_QUERY_CACHE_SIZE if query_cache_size is None else query_cache_size)
+        self._chunks = _LRU(settings.EMBEDDING_CHUNK_CACHE_SIZE if chunk_cache_size is None else chunk_cache_size)
+        self._inflight: Dict[str, asyncio.Future] = {}  # normalized query -> vector being computed
+
+        self._urgent: Deque[_Pending] = deque()  # queries
+        self._bulk: Deque[_Pending] = deque()  # ingestion chunks
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._dimension: Optional[int] = None
+        self._load_error: Optional[Exception] = None
+        self._load_retry_at = 0.0
+        self._load_backoff = _LOAD_RETRY_SECONDS
+        self._loading = asyncio.Lock()
+        self._counters = {
+            "texts_encoded": 0,
+            "model_calls": 0,
+            "model_seconds": 0.0,
+            "query_cache_hits": 0,
+            "query_cache_misses": 0,
+            "chunk_cache_hits": 0,
+            "chunk_cache_misses": 0
+        }
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dimension) float32 matrix"""
+        return await self._submit(texts, urgent=False)
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        key = normalize_query(text)
+        vector = self._queries.get(key)
+        if vector is not None:
+            self._counters["query_cache_hits"] += 1
+            return vector
+
+        self._counters["query_cache_misses"] += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            vector = (await self._submit([key], urgent=True))[0]
+            self._queries.put(key, vector)
+            future.set_result(vector)
+            return vector
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: fine if nobody else was waiting
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._inflight[key]
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Like embed, but chunks seen before (by any agent) come from the content-hash cache"""
+        keys = [content_hash(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            cached = self._chunks.get(key)
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                missing[key] = text
+        self._counters["chunk_cache_hits"] += len(texts) - len(missing)
+        self._counters["chunk_cache_misses"] += len(missing)
+
+        if missing:
+            encoded = await self.embed(list(missing.values()))
+            for key, vector in zip(missing, encoded):
+                vectors[key] = vector
+                self._chunks.put(key, vector)
+        if not texts:
+            return np.empty((0, await self.dimension()), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    async def dimension(self) -> int:
+        await self._ensure_loaded()
+        return self._dimension
+
+    def stats(self) -> Dict:
+        counters = dict(self._counters)
+        seconds = counters["model_seconds"]
+        return {
+            **counters,
+            "model_seconds": round(seconds, 3),
+            "embeddings_per_second": round(counters["texts_encoded"] / seconds, 1) if seconds else 0.0,
+            "mean_batch": round(counters["texts_encoded"] / counters["model_calls"], 1) if counters["model_calls"] else 0.0,
+            "query_cache_entries": len(self._queries),
+            "chunk_cache_entries": len(self._chunks),
+            "queued": len(self._urgent) + len(self._bulk)
+        }
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ---- batching ----
+
+    async def _submit(self, texts: List[str], urgent: bool) -> np.ndarray:
+        await self._ensure_loaded()
+        if not texts:
+            return np.empty((0, self._dimension), dtype=np.float32)
+
+        loop = asyncio.get_running_loop()
+        queue = self._urgent if urgent else self._bulk
+        futures = []
+        for text in texts:
+            pending = _Pending(text, loop.create_future())
+            queue.append(pending)
+            futures.append(pending.result)
+
+        if self._drain_task is None:
+            if len(self._urgent) + len(self._bulk) >= self.max_batch:
+                self._start_drain()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._start_drain)
+        return np.stack(await asyncio.gather(*futures))
+
+    def _start_drain(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        """Encode queued texts batch by batch; texts queued meanwhile join the next batch"""
+        try:
+            while self._urgent or self._bulk:
+                batch = []
+                for queue in (self._urgent, self._bulk):
+                    while queue and len(batch) < self.max_batch:
+                        batch.append(queue.popleft())
+                await self._run_batch(batch)
+        finally:
+            self._drain_task = None
+
+    async def _run_batch(self, batch: List[_Pending]):
+        unique = list(dict.fromkeys(p.text for p in batch if not p.result.done()))
+        if not unique:
+            return
+        try:
+            started = time.perf_counter()
+            vectors = await self._call(_encode, self.model_name, unique, self.batch_size)
+            self._counters["model_seconds"] += time.perf_counter() - started
+            self._counters["model_calls"] += 1
+            self._counters["texts_encoded"] += len(unique)
+        except Exception as e:
+            logger.error(f"Embedding a batch of {len(unique)} texts failed: {str(e)}")
+            for pending in batch:
+                if not pending.result.done():
+                    pending.result.set_exception(e)
+            return
+
+        rows = {text: i for i, text in enumerate(unique)}
+        for pending in batch:
+            if not pending.result.done():
+                pending.result.set_result(vectors[rows[pending.text]])
+
+    # ---- model ----
+
+    async def _call(self, function, *args):
+        if not self.worker_process:
+            return await asyncio.to_thread(function, *args)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+        except BrokenProcessPool:
+            # The worker died (e.g. out of memory); the next call starts a new one
+            logger.error("Embedding worker process died, restarting it on the next call")
+            self._pool = None
+            raise
+
+    async def _ensure_loaded(self):
+        if self._dimension is not None:
+            return
+        if self._load_error is not None and time.monotonic() < self._load_retry_at:
+            raise RuntimeError(f"Embedding model {self.model_name} unavailable: {self._load_error}")
+
+        async with self._loading:
+            if self._dimension is None and (self._load_error is None or time.monotonic() >= self._load_retry_at):
+                try:
+                    self._dimension = await self._call(_dimension, self.model_name)
+                    self._load_error = None
+                    self._load_backoff = _LOAD_RETRY_SECONDS
+                    logger.info(
+                        f"Loaded embedding model {self.model_name}"
+                        + (" in a worker process" if self.worker_process else "")
+                    )
+                except Exception as e:
+                    # Often transient (a download error, a crashed worker): retry after a backoff
+                    logger.error(
+                        f"Could not load embedding model {self.model_name}, "
+                        f"retrying in {self._load_backoff:.0f}s: {str(e)}"
+                    )
+                    self._load_error = e
+                    self._load_retry_at = time.monotonic() + self._load_backoff
+                    self._load_backoff = min(self._load_backoff * 2, _LOAD_RETRY_MAX_SECONDS)
+        await self._ensure_loaded()
+
+
+_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """Process-wide embedder, so the model is loaded once and batches are shared"""
+    global _embedder
+    if _embedder is None:
+        _embedder = Embedder()
+    return _embedder
@@ -0,0 +1,614 @@
+"""
+Knowledge Base Sync
+
+Re-indexes a knowledge base from a full export of its documents, embedding
+only what changed since the last sync:
+
+- the export (NDJSON, one {"id", "text", "metadata"} object per line) is
+  spooled to settings.RAG_SYNC_DIR and streamed from there in blocks, so
+  memory stays bounded by one block plus one embedding batch
+- a per-knowledge-base manifest (SQLite) records each document's content
+  hash and chunk ids. Unchanged documents are skipped without chunking;
+  changed ones are re-chunked (rag_service.document_chunks ids are
+  content-addressed), only chunks not indexed yet are embedded, and
+  chunks the document no longer has are deleted after the new ones are in
+- documents missing from the export are deleted once the whole export
+  has been read
+- progress is checkpointed every settings.RAG_SYNC_CHECKPOINT_SECONDS:
+  the keyword index is saved, then the manifest committed. A sync
+  interrupted by a crash or restart is resumed at startup from the same
+  export, and everything checkpointed before is skipped by hash
+
+One sync runs per knowledge base at a time; status is read by job id.
+Chunking settings and the owning agent come from the knowledge_bases row,
+whose documents_count and last_updated are set when a sync completes.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.rag_service import Chunk, Document, RAGService, document_chunks, get_rag_service
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_DOCUMENTS = 256  # documents read from the export at a time
+_DELETE_PAGE = 1000  # chunk ids per delete of documents gone from the export
+
+
+Recorder = Callable[[str, int], Awaitable[None]]
+
+
+async def load_knowledge_base(knowledge_base_id: str) -> Optional[Dict]:
+    """The knowledge_bases row (id, agent_id, chunk_size, chunk_overlap), None if there is none"""
+    try:
+        uuid.UUID(str(knowledge_base_id))
+    except ValueError:
+        return None
+    from sqlalchemy import text
+    from app.models.database import get_engine
+    async with get_engine().connect() as connection:
+        row = (await connection.execute(
+            text("SELECT id, agent_id, chunk_size, chunk_overlap FROM knowledge_bases WHERE id = CAST(:id AS uuid)"),
+            {"id": str(knowledge_base_id)}
+        )).fetchone()
+    if row is None:
+        return None
+    return {"id": str(row[0]), "agent_id": str(row[1]), "chunk_size": row[2] or 512, "chunk_overlap": row[3] or 0}
+
+
+async def record_sync(knowledge_base_id: str, documents_count: int):
+    """Store a completed sync's document count on the knowledge_bases row"""
+    from sqlalchemy import text
+    from app.models.database import get_engine
+    async with get_engine().begin() as connection:
+        await connection.execute(
+            text(
+                "UPDATE knowledge_bases SET documents_count = :count, last_updated = CURRENT_TIMESTAMP "
+                "WHERE id = CAST(:id AS uuid)"
+            ),
+            {"id": knowledge_base_id, "count": documents_count}
+        )
+
+
+class SyncInProgress(Exception):
+    def __init__(self, job: "SyncJob"):
+        super().__init__(f"Knowledge base {job.knowledge_base_id} is already syncing (job {job.id})")
+        self.job = job
+
+
+@dataclass
+class SyncJob:
+    id: str
+    knowledge_base_id: str
+    agent_id: str
+    status: str = "queued"  # queued, processing, completed, failed
+    documents: int = 0  # read from the export so far
+    documents_changed: int = 0
+    documents_deleted: int = 0
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    bytes_read: int = 0
+    bytes_total: int = 0
+    resumed: bool = False
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "knowledge_base_id": self.knowledge_base_id,
+            "agent_id": self.agent_id,
+            "status": self.status,
+            "progress": round(self.bytes_read / self.bytes_total, 3) if self.bytes_total else 0.0,
+            "documents": self.documents,
+            "documents_changed": self.documents_changed,
+            "documents_deleted": self.documents_deleted,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_deleted": self.chunks_deleted,
+            "resumed": self.resumed,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+    def counters(self) -> Dict:
+        return {
+            name: getattr(self, name)
+            for name in ("documents", "documents_changed", "documents_deleted", "chunks_embedded", "chunks_deleted")
+        }
+
+
+def document_hash(knowledge_base: Dict, model_name: str, document: Document) -> str:
+    """Changes whenever the document's chunks or their vectors would"""
+    digest = hashlib.sha256()
+    for part in (
+        model_name,
+        str(knowledge_base.get("chunk_size") or 512),
+        str(knowledge_base.get("chunk_overlap") or 0),
+        json.dumps(document.metadata, sort_keys=True, default=str),
+        document.text
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Manifest:
+    """
+    What is indexed for one knowledge base. Document and chunk writes
+    accumulate in one transaction until checkpoint(), which the sync calls
+    only once the indexes hold everything written; all calls run in a
+    worker thread, one at a time
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level="DEFERRED")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                seen_run INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_seen ON documents (seen_run);
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id);
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                source TEXT NOT NULL,
+                knowledge_base TEXT NOT NULL,
+                full_export INTEGER NOT NULL,
+                position INTEGER NOT NULL DEFAULT 0,
+                counters TEXT NOT NULL DEFAULT '{}',
+                error TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+        """)
+        self.db.commit()
+
+    def pending_run(self) -> Optional[Dict]:
+        row = self.db.execute(
+            "SELECT id, job_id, source, knowledge_base, full_export, position, counters, started_at "
+            "FROM runs WHERE status = 'running' ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "job_id", "source", "knowledge_base", "full_export", "position", "counters", "started_at")
+        run = dict(zip(keys, row))
+        run["knowledge_base"] = json.loads(run["knowledge_base"])
+        run["counters"] = json.loads(run["counters"])
+        return run
+
+    def begin_run(self, job: SyncJob, source: str, knowledge_base: Dict, full_export: bool) -> Tuple[int, List[str]]:
+        """The new run's id, and the exports of unfinished runs it supersedes"""
+        superseded = [row[0] for row in self.db.execute("SELECT source FROM runs WHERE status = 'running'")]
+        self.db.execute("UPDATE runs SET status = 'superseded' WHERE status = 'running'")
+        cursor = self.db.execute(
+            "INSERT INTO runs (job_id, status, source, knowledge_base, full_export, started_at) "
+            "VALUES (?, 'running', ?, ?, ?, ?)",
+            (job.id, source, json.dumps(knowledge_base, default=str), int(full_export), job.created_at)
+        )
+        self.db.commit()
+        return cursor.lastrowid, superseded
+
+    def end_run(self, run_id: int, status: str, counters: Dict, error: Optional[str] = None):
+        self.db.execute(
+            "UPDATE runs SET status = ?, counters = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(counters), error, time.time(), run_id)
+        )
+        self.db.commit()
+
+    def checkpoint(self, run_id: int, position: int, counters: Dict):
+        self.db.execute(
+            "UPDATE runs SET position = ?, counters = ? WHERE id = ?",
+            (position, json.dumps(counters), run_id)
+        )
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def chunk_count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def document_count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def reset(self):
+        self.db.execute("DELETE FROM documents")
+        self.db.execute("DELETE FROM chunks")
+        self.db.commit()
+
+    def hashes(self, document_ids: List[str]) -> Dict[str, str]:
+        found = {}
+        for i in range(0, len(document_ids), 500):
+            page = document_ids[i:i + 500]
+            found.update(self.db.execute(
+                f"SELECT document_id, content_hash FROM documents WHERE document_id IN ({','.join('?' * len(page))})",
+                page
+            ).fetchall())
+        return found
+
+    def chunk_ids(self, document_ids: List[str]) -> Dict[str, Set[str]]:
+        found: Dict[str, Set[str]] = {document_id: set() for document_id in document_ids}
+        for i in range(0, len(document_ids), 500):
+            page = document_ids[i:i + 500]
+            for chunk_id, document_id in self.db.execute(
+                f"SELECT chunk_id, document_id FROM chunks WHERE document_id IN ({','.join('?' * len(page))})",
+                page
+            ):
+                found[document_id].add(chunk_id)
+        return found
+
+    def mark_seen(self, document_ids: List[str], run_id: int):
+        self.db.executemany(
+            "UPDATE documents SET seen_run = ? WHERE document_id = ?",
+            [(run_id, document_id) for document_id in document_ids]
+        )
+
+    def record(self, document_id: str, content_hash: str, run_id: int, chunk_ids: List[str]):
+        self.db.execute(
+            "INSERT OR REPLACE INTO documents (document_id, content_hash, seen_run) VALUES (?, ?, ?)",
+            (document_id, content_hash, run_id)
+        )
+        self.db.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        self.db.executemany(
+            "INSERT OR REPLACE INTO chunks (chunk_id, document_id) VALUES (?, ?)",
+            [(chunk_id, document_id) for chunk_id in chunk_ids]
+        )
+
+    def unseen_chunks(self, run_id: int, limit: int) -> Tuple[List[str], List[str]]:
+        """A page of (document ids, their chunk ids) not in this run's export"""
+        documents = [row[0] for row in self.db.execute(
+            "SELECT document_id FROM documents WHERE seen_run < ? LIMIT ?", (run_id, limit)
+        )]
+        chunk_ids = [chunk_id for ids in self.chunk_ids(documents).values() for chunk_id in ids]
+        return documents, chunk_ids
+
+    def forget(self, document_ids: List[str]):
+        self.db.executemany("DELETE FROM documents WHERE document_id = ?", [(d,) for d in document_ids])
+        self.db.executemany("DELETE FROM chunks WHERE document_id = ?", [(d,) for d in document_ids])
+
+    def close(self):
+        self.db.close()
+
+
+@dataclass
+class _Changed:
+    document_id: str
+    content_hash: str
+    chunk_ids: List[str]
+    removed: Set[str]
+
+
+class KnowledgeBaseSync:
+    """Background incremental syncs, one per knowledge base, resumable after a restart"""
+
+    def __init__(
+        self,
+        rag: Optional[RAGService] = None,
+        directory: Optional[str] = None,
+        checkpoint_interval: Optional[float] = None,
+        max_jobs: int = 1000,
+        recorder: Optional[Recorder] = None
+    ):
+        self.rag = rag or get_rag_service()
+        self.recorder = recorder or record_sync
+        self.directory = directory or settings.RAG_SYNC_DIR
+        self.checkpoint_interval = (
+            settings.RAG_SYNC_CHECKPOINT_SECONDS if checkpoint_interval is None else checkpoint_interval
+        )
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._running: Dict[str, SyncJob] = {}  # knowledge base id -> job
+        self._tasks = set()
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    def spool_path(self) -> str:
+        """Where to write an export before start()"""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"export-{uuid.uuid4().hex}.ndjson")
+
+    async def start(self, knowledge_base: Dict, source: str, full_export: bool = True) -> SyncJob:
+        """
+        Sync a knowledge_bases row (id, agent_id, chunk_size, chunk_overlap)
+        from an NDJSON export at source, which the sync takes ownership of.
+        With full_export, documents not in it are deleted
+        """
+        knowledge_base_id = str(knowledge_base["id"])
+        running = self._running.get(knowledge_base_id)
+        if running is not None:
+            raise SyncInProgress(running)
+
+        job = SyncJob(
+            id=uuid.uuid4().hex,
+            knowledge_base_id=knowledge_base_id,
+            agent_id=str(knowledge_base["agent_id"])
+        )
+        self._remember(job)
+        self._running[knowledge_base_id] = job
+        try:
+            manifest = await asyncio.to_thread(_Manifest, self._manifest_path(knowledge_base_id))
+            run_id, superseded = await asyncio.to_thread(manifest.begin_run, job, source, knowledge_base, full_export)
+        except Exception:
+            del self._running[knowledge_base_id]
+            raise
+        for path in superseded:
+            self._remove(path)
+        self._spawn(self._run(job, manifest, run_id, knowledge_base, source, full_export, position=0))
+        return job
+
+    async def resume_pending(self) -> List[SyncJob]:
+        """Restart syncs interrupted by a crash or shutdown (at startup)"""
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".sqlite"):
+                continue
+            try:
+                job = await self._resume(os.path.join(self.directory, name))
+            except Exception as e:
+                logger.error(f"Could not resume knowledge base sync {name}: {str(e)}")
+                continue
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    async def close(self):
+        """Stop running syncs; they resume from their last checkpoint on the next start"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _resume(self, path: str) -> Optional[SyncJob]:
+        manifest = await asyncio.to_thread(_Manifest, path)
+        run = await asyncio.to_thread(manifest.pending_run)
+        knowledge_base = run and run["knowledge_base"]
+        if run is None or str(knowledge_base["id"]) in self._running:
+            await asyncio.to_thread(manifest.close)
+            return None
+        if not os.path.exists(run["source"]):
+            await asyncio.to_thread(manifest.end_run, run["id"], "failed", run["counters"], "export file missing")
+            await asyncio.to_thread(manifest.close)
+            return None
+
+        job = SyncJob(
+            id=run["job_id"],
+            knowledge_base_id=str(knowledge_base["id"]),
+            agent_id=str(knowledge_base["agent_id"]),
+            resumed=True,
+            created_at=run["started_at"]
+        )
+        for name, value in run["counters"].items():
+            setattr(job, name, value)
+        self._remember(job)
+        self._running[job.knowledge_base_id] = job
+        logger.info(f"Resuming sync of knowledge base {job.knowledge_base_id} (job {job.id})")
+        self._spawn(self._run(
+            job, manifest, run["id"], knowledge_base, run["source"], bool(run["full_export"]), run["position"]
+        ))
+        return job
+
+    async def _run(
+        self,
+        job: SyncJob,
+        manifest: _Manifest,
+        run_id: int,
+        knowledge_base: Dict,
+        source: str,
+        full_export: bool,
+        position: int
+    ):
+        job.status = "processing"
+        started = time.perf_counter()
+        try:
+            if not await self._check_index(job, manifest):
+                position = 0
+                for name in job.counters():
+                    setattr(job, name, 0)
+            await self._apply_export(job, manifest, run_id, knowledge_base, source, position)
+            if full_export:
+                await self._delete_unseen(job, manifest, run_id)
+            await self._checkpoint(job, manifest, run_id, job.bytes_total)
+            await asyncio.to_thread(manifest.end_run, run_id, "completed", job.counters())
+            job.status = "completed"
+            try:
+                await self.recorder(job.knowledge_base_id, await asyncio.to_thread(manifest.document_count))
+            except Exception as e:
+                logger.error(f"Could not update knowledge base {job.knowledge_base_id} after sync: {str(e)}")
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Synced knowledge base {job.knowledge_base_id}: {job.documents} documents, "
+                f"{job.documents_changed} changed, {job.documents_deleted} deleted, "
+                f"{job.chunks_embedded} chunks embedded, {job.chunks_deleted} deleted in {elapsed:.1f}s"
+            )
+        except asyncio.CancelledError:
+            # Shutdown: the run stays 'running' and resumes from its last checkpoint
+            await asyncio.to_thread(manifest.rollback)
+            raise
+        except Exception as e:
+            logger.error(f"Sync of knowledge base {job.knowledge_base_id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+            await asyncio.to_thread(manifest.rollback)
+            await asyncio.to_thread(manifest.end_run, run_id, "failed", job.counters(), str(e))
+        finally:
+            job.finished_at = time.time() if job.status in ("completed", "failed") else None
+            self._running.pop(job.knowledge_base_id, None)
+            await asyncio.to_thread(manifest.close)
+            if job.status in ("completed", "failed"):
+                self._remove(source)
+
+    async def _check_index(self, job: SyncJob, manifest: _Manifest) -> bool:
+        """
+        False (and the manifest emptied) if the indexes lost what the manifest
+        says they hold, e.g. an in-process index after a restart or a wiped volume
+        """
+        if not await asyncio.to_thread(manifest.chunk_count):
+            return True
+        counts = [await self.rag.index.count(job.agent_id)]
+        if self.rag.lexical:
+            counts.append(await self.rag.lexical.count(job.agent_id))
+        if 0 not in counts:
+            return True
+        logger.warning(f"Index for agent {job.agent_id} is empty, re-embedding knowledge base {job.knowledge_base_id}")
+        await asyncio.to_thread(manifest.reset)
+        return False
+
+    async def _apply_export(
+        self,
+        job: SyncJob,
+        manifest: _Manifest,
+        run_id: int,
+        knowledge_base: Dict,
+        source: str,
+        position: int
+    ):
+        model_name = self.rag.embedder.model_name
+        last_checkpoint = time.monotonic()
+        job.bytes_total = os.path.getsize(source)
+        with open(source, "rb") as export:
+            # Resume where the last checkpoint left off; documents after it are re-checked by hash
+            export.seek(position)
+            job.bytes_read = position
+            while True:
+                lines = await asyncio.to_thread(lambda: list(islice(export, _BLOCK_DOCUMENTS)))
+                if not lines:
+                    break
+                documents = [self._parse(line) for line in lines]
+                documents = [document for document in documents if document is not None]
+                await self._apply_block(job, manifest, run_id, knowledge_base, model_name, documents)
+                job.bytes_read += sum(len(line) for line in lines)
+
+                if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    await self._checkpoint(job, manifest, run_id, job.bytes_read)
+                    last_checkpoint = time.monotonic()
+
+    async def _apply_block(
+        self,
+        job: SyncJob,
+        manifest: _Manifest,
+        run_id: int,
+        knowledge_base: Dict,
+        model_name: str,
+        documents: List[Document]
+    ):
+        job.documents += len(documents)
+        hashes = await asyncio.to_thread(manifest.hashes, [document.id for document in documents])
+        current = {document.id: document_hash(knowledge_base, model_name, document) for document in documents}
+        unchanged = [document.id for document in documents if hashes.get(document.id) == current[document.id]]
+        await asyncio.to_thread(manifest.mark_seen, unchanged, run_id)
+
+        changed_documents = [document for document in documents if hashes.get(document.id) != current[document.id]]
+        if not changed_documents:
+            return
+        indexed = await asyncio.to_thread(manifest.chunk_ids, [document.id for document in changed_documents])
+
+        changed: List[_Changed] = []
+        batch: List[Chunk] = []
+        for document in changed_documents:
+            chunks = document_chunks(knowledge_base, document)
+            ids = [chunk.id for chunk in chunks]
+            changed.append(_Changed(document.id, current[document.id], ids, indexed[document.id] - set(ids)))
+            batch.extend(chunk for chunk in chunks if chunk.id not in indexed[document.id])
+            while len(batch) >= self.rag.embed_batch_size:
+                await self._embed(job, batch[:self.rag.embed_batch_size])
+                del batch[:self.rag.embed_batch_size]
+        await self._embed(job, batch)
+
+        # Old chunks go only once their replacements are searchable
+        removed = [chunk_id for entry in changed for chunk_id in entry.removed]
+        for i in range(0, len(removed), _DELETE_PAGE):
+            await self.rag.delete_chunks(job.agent_id, removed[i:i + _DELETE_PAGE], commit=False)
+        job.chunks_deleted += len(removed)
+        job.documents_changed += len(changed)
+
+        def record():
+            for entry in changed:
+                manifest.record(entry.document_id, entry.content_hash, run_id, entry.chunk_ids)
+        await asyncio.to_thread(record)
+
+    async def _embed(self, job: SyncJob, chunks: List[Chunk]):
+        if chunks:
+            await self.rag.index_chunks(job.agent_id, chunks)
+            job.chunks_embedded += len(chunks)
+
+    async def _delete_unseen(self, job: SyncJob, manifest: _Manifest, run_id: int):
+        while True:
+            documents, chunk_ids = await asyncio.to_thread(manifest.unseen_chunks, run_id, _DELETE_PAGE)
+            if not documents:
+                return
+            for i in range(0, len(chunk_ids), _DELETE_PAGE):
+                await self.rag.delete_chunks(job.agent_id, chunk_ids[i:i + _DELETE_PAGE], commit=False)
+            await asyncio.to_thread(manifest.forget, documents)
+            job.documents_deleted += len(documents)
+            job.chunks_deleted += len(chunk_ids)
+
+    async def _checkpoint(self, job: SyncJob, manifest: _Manifest, run_id: int, position: int):
+        # Indexes first: the manifest must never claim chunks the indexes could lose
+        await self.rag.commit(job.agent_id)
+        await asyncio.to_thread(manifest.checkpoint, run_id, position, job.counters())
+
+    @staticmethod
+    def _parse(line: bytes) -> Optional[Document]:
+        line = line.strip()
+        if not line:
+            return None
+        record = json.loads(line)
+        return Document(id=str(record["id"]), text=record.get("text") or "", metadata=record.get("metadata") or {})
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _manifest_path(self, knowledge_base_id: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in knowledge_base_id)
+        return os.path.join(self.directory, f"{safe}.sqlite")
+
+    def _remember(self, job: SyncJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+_kb_sync: Optional[KnowledgeBaseSync] = None
+
+
+def get_kb_sync() -> KnowledgeBaseSync:
+    global _kb_sync
+    if _kb_sync is None:
+        _kb_sync = KnowledgeBaseSync()
+    return _kb_sync
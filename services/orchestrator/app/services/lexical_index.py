@@ -0,0 +1,301 @@
+"""
+Lexical (BM25) Index
+
+Per-agent inverted index over chunk text, for the exact keyword matches
+embeddings miss: SKUs, order numbers, error codes. Built incrementally as
+chunks are ingested:
+
+- tokens are lower-cased words; identifiers such as "SKU-1042" or
+  "E_504" are kept whole and also split into their parts
+- each term's postings are two compact arrays (chunk rows, term
+  frequencies) appended in place and scored as NumPy views
+- deleted chunks are tombstoned and dropped from the postings once they
+  pile up
+- an agent's index is saved under settings.RAG_LEXICAL_DIR after each
+  ingestion or delete and loaded on first use; least recently used
+  agents without unsaved changes are dropped from memory
+
+All reads and writes happen on the event loop thread (the arrays are
+resized in place); only file I/O runs in a worker thread.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+from array import array
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[^\W_]+(?:[-_./][^\W_]+)*")
+_PART = re.compile(r"[^\W_]+")
+_STOPWORDS = frozenset(
+    "a about an and are as at be but by can do does for from has have how i if in is it its me my no not "
+    "of on or our so than that the their then there these they this to was we what when where which "
+    "who why will with you your".split()
+)
+_MAX_TF = 65535
+
+
+def _indexed(token: str) -> bool:
+    return token not in _STOPWORDS and not (len(token) == 1 and token.isalpha())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        if not _indexed(token):
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _PART.findall(token) if _indexed(part))
+    return tokens
+
+
+@dataclass
+class LexicalHit:
+    id: str
+    score: float  # BM25
+    coverage: float  # share of the query's IDF weight this chunk matches, 0..1
+
+
+class _AgentLexicon:
+    """One agent's postings; rows are never reused until compaction renumbers them"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (rows, term frequencies)
+        self.live = 0
+        self.total_length = 0
+
+    @property
+    def dead(self) -> int:
+        return len(self.ids) - self.live
+
+    def add(self, ids: List[str], texts: List[str]):
+        self.remove(ids)
+        for chunk_id, text in zip(ids, texts):
+            tokens = tokenize(text)
+            row = len(self.ids)
+            for term, tf in Counter(tokens).items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("I"), array("H"))
+                postings[0].append(row)
+                postings[1].append(min(tf, _MAX_TF))
+            self.ids.append(chunk_id)
+            self.rows[chunk_id] = row
+            self.lengths.append(len(tokens))
+            self.alive.append(1)
+            self.live += 1
+            self.total_length += len(tokens)
+
+    def remove(self, ids: List[str]):
+        for chunk_id in ids:
+            row = self.rows.pop(chunk_id, None)
+            if row is not None:
+                self.alive[row] = 0
+                self.live -= 1
+                self.total_length -= self.lengths[row]
+        if self.dead >= 1024 and self.dead * 4 >= len(self.ids):
+            self._compact()
+
+    def search(self, terms: List[str], top_k: int, k1: float = 1.2, b: float = 0.75) -> List[LexicalHit]:
+        if not self.live or not terms:
+            return []
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / (self.total_length / self.live))
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = np.zeros(len(self.ids), dtype=np.float32)
+
+        weight = 0.0
+        for term in set(terms):
+            postings = self.postings.get(term)
+            rows = np.frombuffer(postings[0], dtype=np.uint32) if postings else None
+            df = int(np.count_nonzero(alive[rows])) if postings else 0
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            weight += idf  # terms no chunk has still count: the query is not fully covered
+            if df:
+                tf = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                scores[rows] += idf * tf * (k1 + 1) / (tf + norm[rows])
+                matched[rows] += idf
+            del rows
+
+        scores[~alive] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [
+            LexicalHit(self.ids[row], float(scores[row]), float(matched[row]) / weight)
+            for row in candidates
+        ]
+
+    def _compact(self):
+        keep = np.flatnonzero(np.frombuffer(self.alive, dtype=np.uint8))
+        renumber = np.full(len(self.ids), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        postings = {}
+        for term, (rows, tfs) in self.postings.items():
+            rows_ = np.frombuffer(rows, dtype=np.uint32)
+            mask = renumber[rows_] >= 0
+            if mask.any():
+                postings[term] = (
+                    array("I", renumber[rows_[mask]].astype(np.uint32).tobytes()),
+                    array("H", np.frombuffer(tfs, dtype=np.uint16)[mask].tobytes())
+                )
+            del rows_
+        self.postings = postings
+        self.ids = [self.ids[row] for row in keep]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.lengths = array("I", np.frombuffer(self.lengths, dtype=np.uint32)[keep].tobytes())
+        self.alive = bytearray(b"\x01" * len(keep))
+
+    # ---- files ----
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Copies of the index as flat arrays (taken on the event loop, written in a thread)"""
+        terms = list(self.postings)
+        counts = [len(self.postings[term][0]) for term in terms]
+        return {
+            "ids": np.frombuffer(json.dumps(self.ids).encode(), dtype=np.uint8).copy(),
+            "terms": np.frombuffer(json.dumps(terms).encode(), dtype=np.uint8).copy(),
+            "term_offsets": np.concatenate(([0], np.cumsum(counts, dtype=np.uint64))).astype(np.uint64),
+            "rows": np.frombuffer(b"".join(self.postings[t][0].tobytes() for t in terms), dtype=np.uint32),
+            "tfs": np.frombuffer(b"".join(self.postings[t][1].tobytes() for t in terms), dtype=np.uint16),
+            "lengths": np.frombuffer(self.lengths, dtype=np.uint32).copy(),
+            "alive": np.frombuffer(self.alive, dtype=np.uint8).copy()
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "_AgentLexicon":
+        lexicon = cls()
+        lexicon.ids = json.loads(arrays["ids"].tobytes())
+        lexicon.lengths = array("I", arrays["lengths"].astype(np.uint32).tobytes())
+        lexicon.alive = bytearray(arrays["alive"].tobytes())
+        offsets, rows, tfs = arrays["term_offsets"], arrays["rows"], arrays["tfs"]
+        for i, term in enumerate(json.loads(arrays["terms"].tobytes())):
+            start, end = int(offsets[i]), int(offsets[i + 1])
+            lexicon.postings[term] = (array("I", rows[start:end].tobytes()), array("H", tfs[start:end].tobytes()))
+        lexicon.rows = {chunk_id: row for row, chunk_id in enumerate(lexicon.ids) if lexicon.alive[row]}
+        lexicon.live = len(lexicon.rows)
+        lengths = np.frombuffer(lexicon.lengths, dtype=np.uint32)
+        lexicon.total_length = int(lengths[np.frombuffer(lexicon.alive, dtype=np.uint8).astype(bool)].sum())
+        del lengths
+        return lexicon
+
+
+class LexicalIndex:
+    """BM25 over every agent's chunks, loaded per agent on demand"""
+
+    def __init__(self, directory: Optional[str] = None, max_loaded_agents: Optional[int] = None):
+        self.directory = directory if directory is not None else settings.RAG_LEXICAL_DIR
+        self.max_loaded_agents = max_loaded_agents or settings.RAG_LEXICAL_MAX_LOADED_AGENTS
+        self._loaded: "OrderedDict[str, _AgentLexicon]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._unsaved = set()
+        self._save_failed = False
+
+    async def add(self, agent_id: str, ids: List[str], texts: List[str]):
+        (await self._agent(agent_id, create=True)).add(ids, texts)
+        self._unsaved.add(agent_id)
+
+    async def delete(self, agent_id: str, ids: List[str]):
+        lexicon = await self._agent(agent_id)
+        if lexicon is not None:
+            lexicon.remove(ids)
+            self._unsaved.add(agent_id)
+
+    async def search(self, agent_id: str, query: str, top_k: int = 10) -> List[LexicalHit]:
+        lexicon = await self._agent(agent_id)
+        if lexicon is None:
+            return []
+        return lexicon.search(tokenize(query), top_k)
+
+    async def count(self, agent_id: str) -> int:
+        lexicon = await self._agent(agent_id)
+        return lexicon.live if lexicon else 0
+
+    async def save(self, agent_id: str):
+        """Persist an agent's index (after an ingestion or delete); failures only cost a rebuild"""
+        lexicon = self._loaded.get(agent_id)
+        if lexicon is None or not self.directory:
+            return
+        arrays = lexicon.to_arrays()
+        self._unsaved.discard(agent_id)
+        try:
+            await asyncio.to_thread(self._write, self._path(agent_id), arrays)
+        except OSError as e:
+            self._unsaved.add(agent_id)
+            if not self._save_failed:
+                logger.warning(f"Could not save lexical index to {self.directory}, keeping it in memory: {str(e)}")
+                self._save_failed = True
+
+    async def _agent(self, agent_id: str, create: bool = False) -> Optional[_AgentLexicon]:
+        lexicon = self._loaded.get(agent_id)
+        if lexicon is not None:
+            self._loaded.move_to_end(agent_id)
+            return lexicon
+
+        loading = self._loading.get(agent_id)
+        if loading is None:
+            loading = self._loading[agent_id] = asyncio.ensure_future(self._load(agent_id))
+            loading.add_done_callback(lambda _: self._loading.pop(agent_id, None))
+        lexicon = await asyncio.shield(loading)
+        if lexicon is None and create:
+            lexicon = _AgentLexicon()
+        if lexicon is not None and agent_id not in self._loaded:
+            self._loaded[agent_id] = lexicon
+            self._evict()
+        return self._loaded.get(agent_id, lexicon)
+
+    def _evict(self):
+        excess = len(self._loaded) - self.max_loaded_agents
+        for agent_id in list(self._loaded):
+            if excess <= 0:
+                break
+            if agent_id not in self._unsaved:  # otherwise its changes exist only in memory
+                del self._loaded[agent_id]
+                excess -= 1
+
+    async def _load(self, agent_id: str) -> Optional[_AgentLexicon]:
+        path = self._path(agent_id)
+        if not self.directory or not os.path.exists(path):
+            return None
+        try:
+            return await asyncio.to_thread(self._read, path)
+        except Exception as e:
+            logger.error(f"Could not load lexical index {path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _read(path: str) -> _AgentLexicon:
+        with np.load(path) as data:
+            return _AgentLexicon.from_arrays({name: data[name] for name in data.files})
+
+    @staticmethod
+    def _write(path: str, arrays: Dict[str, np.ndarray]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _path(self, agent_id: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(agent_id))
+        return os.path.join(self.directory, f"{safe}.npz")
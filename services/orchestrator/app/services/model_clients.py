@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
+import json
 import httpx
 import openai
 import anthropic
@@ -8,6 +9,7 @@ import logging
 
 from app.core.config import settings
 from app.core.router import ModelProvider
+from app.services.conversation_history import count_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +27,33 @@ class ModelResponse:
 class BaseModelClient(ABC):
     """Abstract base class for all model clients"""
     
+    # Set by stream() once the reply is complete: model, tokens and cost as generate() reports them
+    last_response: Optional[ModelResponse] = None
+    
     @abstractmethod
     async def generate(
         self,
         prompt: str,
         agent_id: str,
         conversation_id: str,
-        context: Optional[List[dict]] = None
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
     ) -> ModelResponse:
-        """Generate response from the model"""
+        """Generate response from the model (use_rag=False skips knowledge base retrieval)"""
         pass
+    
+    async def stream(
+        self,
+        prompt: str,
+        agent_id: str,
+        conversation_id: str,
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
+    ) -> AsyncIterator[str]:
+        """Yield the response in text chunks as the model produces them"""
+        response = await self.generate(prompt, agent_id, conversation_id, context, use_rag)
+        self.last_response = response
+        yield response.text
 
 
 class OllamaClient(BaseModelClient):
@@ -49,14 +68,15 @@ class OllamaClient(BaseModelClient):
         prompt: str,
         agent_id: str,
         conversation_id: str,
-        context: Optional[List[dict]] = None
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
     ) -> ModelResponse:
         """Generate response using Ollama"""
         import time
         start_time = time.time()
         
         # Get RAG context if available
-        rag_context = await self._get_rag_context(agent_id, prompt)
+        rag_context = await self._get_rag_context(agent_id, prompt) if use_rag else []
         
         # Build full prompt with context
         full_prompt = self._build_prompt(prompt, rag_context, context)
@@ -79,7 +99,7 @@ class OllamaClient(BaseModelClient):
                 return ModelResponse(
                     text=result["response"],
                     model=f"ollama:{self.model_name}",
-                    tokens_used=result.get("total_duration", 0),
+                    tokens_used=result.get("prompt_eval_count", 0) + result.get("eval_count", 0),
                     latency_ms=latency_ms,
                     cost_usd=0.0  # Local models are free
                 )
@@ -88,15 +108,63 @@ class OllamaClient(BaseModelClient):
                 logger.error(f"Ollama error: {str(e)}")
                 raise
     
+    async def stream(
+        self,
+        prompt: str,
+        agent_id: str,
+        conversation_id: str,
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
+    ) -> AsyncIterator[str]:
+        """Stream response tokens from Ollama"""
+        import time
+        start_time = time.time()
+        rag_context = await self._get_rag_context(agent_id, prompt) if use_rag else []
+        full_prompt = self._build_prompt(prompt, rag_context, context)
+        text = []
+        
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{self.endpoint}/api/generate",
+                    json={
+                        "model": self.model_name,
+                        "prompt": full_prompt,
+                        "stream": True
+                    }
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("response"):
+                            text.append(chunk["response"])
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            self.last_response = ModelResponse(
+                                text="".join(text),
+                                model=f"ollama:{self.model_name}",
+                                tokens_used=chunk.get("prompt_eval_count", 0) + chunk.get("eval_count", 0),
+                                latency_ms=int((time.time() - start_time) * 1000),
+                                cost_usd=0.0
+                            )
+                            break
+                
+            except Exception as e:
+                logger.error(f"Ollama error: {str(e)}")
+                raise
+    
     async def _get_rag_context(self, agent_id: str, query: str) -> List[str]:
         """Retrieve relevant context from knowledge base"""
-        from app.services.rag_service import RAGService
-        
-        rag_service = RAGService()
         try:
-            results = await rag_service.search(agent_id, query, top_k=3)
-            return results
-        except:
+            from app.services.rag_service import get_rag_service
+            
+            chunks = await get_rag_service().search(agent_id, query)
+            return [chunk.text for chunk in chunks]
+        except Exception as e:
+            logger.warning(f"RAG retrieval failed for agent {agent_id}: {str(e)}")
             return []
     
     def _build_prompt(
@@ -118,7 +186,7 @@ class OllamaClient(BaseModelClient):
         # Add conversation history
         if conversation_context:
             parts.append("# Conversation History:\n")
-            for msg in conversation_context[-5:]:  # Last 5 messages
+            for msg in conversation_context:  # already a token-bounded window
                 role = msg.get("role", "user")
                 content = msg.get("content", "")
                 parts.append(f"{role}: {content}\n")
@@ -143,7 +211,8 @@ class OpenAIClient(BaseModelClient):
         prompt: str,
         agent_id: str,
         conversation_id: str,
-        context: Optional[List[dict]] = None
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
     ) -> ModelResponse:
         """Generate response using OpenAI"""
         import time
@@ -153,7 +222,7 @@ class OpenAIClient(BaseModelClient):
         messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
         
         if context:
-            messages.extend(context[-10:])  # Last 10 messages
+            messages.extend(context)  # recent turns, token-bounded by the caller
         
         messages.append({"role": "user", "content": prompt})
         
@@ -183,6 +252,51 @@ class OpenAIClient(BaseModelClient):
         except Exception as e:
             logger.error(f"OpenAI error: {str(e)}")
             raise
+    
+    async def stream(
+        self,
+        prompt: str,
+        agent_id: str,
+        conversation_id: str,
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
+    ) -> AsyncIterator[str]:
+        """Stream response tokens from OpenAI"""
+        import time
+        start_time = time.time()
+        messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
+        if context:
+            messages.extend(context)
+        messages.append({"role": "user", "content": prompt})
+        
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=2000,
+                stream=True
+            )
+            text = []
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            
+            # Streamed completions report no usage here: estimate it with the same tokenizer
+            tokens_used = sum(count_tokens(m.get("content") or "") for m in messages) + count_tokens("".join(text))
+            cost_per_1k = settings.MODEL_COSTS.get(f"openai:{self.model_name}", 0.00015)
+            self.last_response = ModelResponse(
+                text="".join(text),
+                model=f"openai:{self.model_name}",
+                tokens_used=tokens_used,
+                latency_ms=int((time.time() - start_time) * 1000),
+                cost_usd=(tokens_used / 1000) * cost_per_1k
+            )
+            
+        except Exception as e:
+            logger.error(f"OpenAI error: {str(e)}")
+            raise
 
 
 class AnthropicClient(BaseModelClient):
@@ -197,7 +311,8 @@ class AnthropicClient(BaseModelClient):
         prompt: str,
         agent_id: str,
         conversation_id: str,
-        context: Optional[List[dict]] = None
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
     ) -> ModelResponse:
         """Generate response using Claude"""
         import time
@@ -206,7 +321,7 @@ class AnthropicClient(BaseModelClient):
         # Build messages (Claude format)
         messages = []
         if context:
-            for msg in context[-10:]:
+            for msg in context:
                 messages.append({
                     "role": msg.get("role", "user"),
                     "content": msg.get("content", "")
@@ -253,7 +368,8 @@ class PerplexityClient(BaseModelClient):
         prompt: str,
         agent_id: str,
         conversation_id: str,
-        context: Optional[List[dict]] = None
+        context: Optional[List[dict]] = None,
+        use_rag: bool = True
     ) -> ModelResponse:
         """Generate response with web search"""
         import time
@@ -0,0 +1,300 @@
+"""
+Knowledge Base Retrieval (RAG)
+
+Ingests knowledge_bases documents into a vector index and retrieves the
+chunks closest to a query for the model prompt:
+
+- documents are cut into overlapping chunks (the row's chunk_size and
+  chunk_overlap, in characters), preferring sentence and word boundaries;
+  a chunk's id includes a hash of its content, so it only changes when
+  the chunk does (see kb_sync.py for incremental re-indexing)
+- chunks are embedded with settings.EMBEDDING_MODEL and stored per agent;
+  chunks already embedded for any agent are reused by content hash
+- search embeds the query off the event loop and returns the top_k chunks
+  scoring at least score_threshold (cosine similarity)
+- with settings.RAG_HYBRID, chunks are also indexed for BM25 keyword
+  search (lexical_index.py) and both result lists are merged by
+  reciprocal rank fusion, so exact SKUs, order numbers and error codes
+  are found even when their embeddings are not close. A query whose best
+  keyword match contains (nearly) every query term and clearly leads is
+  answered from the keyword index alone, without embedding it
+
+The index backend is settings.RAG_INDEX_BACKEND: Qdrant, or the
+in-process NumPy index for single-node deployments and tests.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.embeddings import Embedder, get_embedder
+from app.services.lexical_index import LexicalHit, LexicalIndex
+from app.services.vector_index import SearchHit, VectorIndex, create_index
+
+logger = logging.getLogger(__name__)
+
+_RRF_K = 60  # reciprocal rank fusion constant: score = sum of 1 / (_RRF_K + rank)
+_FUSE_COVERAGE = 0.5  # keyword hits matching less of the query's IDF weight are left out of fusion
+_ANSWER_COVERAGE = 0.75  # keyword hits answering on their own must match this much of it
+
+
+@dataclass
+class Document:
+    id: str
+    text: str
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass
+class Chunk:
+    id: str
+    text: str
+    payload: Dict
+
+
+@dataclass
+class RetrievedChunk:
+    id: str
+    text: str
+    score: float
+    document_id: Optional[str] = None
+    knowledge_base_id: Optional[str] = None
+
+
+def chunk_text(text: str, chunk_size: int = 512, chunk_overlap: int = 50) -> List[str]:
+    """Overlapping windows of at most chunk_size characters; same input, same chunks"""
+    text = " ".join(text.split())
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Cut after the last sentence end in the back half of the window, else the last space
+            floor = start + chunk_size // 2
+            cut = max(text.rfind(". ", floor, end), text.rfind("? ", floor, end), text.rfind("! ", floor, end))
+            if cut < 0:
+                cut = text.rfind(" ", floor, end)
+            if cut >= 0:
+                end = cut + 1
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+
+        next_start = max(end - chunk_overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if chunk_overlap and space >= 0 else next_start
+    return [chunk for chunk in chunks if chunk]
+
+
+def document_chunks(knowledge_base: Dict, document: Document) -> List[Chunk]:
+    """
+    A document's chunks under the knowledge base's chunking settings. Ids are
+    "<knowledge base>:<document>:<content hash>": a chunk keeps its id as
+    long as its text and the document metadata are unchanged
+    """
+    knowledge_base_id = str(knowledge_base["id"])
+    metadata = json.dumps(document.metadata, sort_keys=True, default=str)
+    texts = chunk_text(
+        document.text,
+        knowledge_base.get("chunk_size") or 512,
+        knowledge_base.get("chunk_overlap") or 0
+    )
+    occurrences: Dict[str, int] = {}
+    chunks = []
+    for i, text in enumerate(texts):
+        digest = hashlib.sha256(f"{metadata}\0{text}".encode("utf-8")).hexdigest()[:16]
+        occurrences[digest] = occurrences.get(digest, 0) + 1
+        if occurrences[digest] > 1:  # the same text repeated within the document
+            digest = f"{digest}-{occurrences[digest]}"
+        chunks.append(Chunk(
+            id=f"{knowledge_base_id}:{document.id}:{digest}",
+            text=text,
+            payload={
+                "text": text,
+                "document_id": document.id,
+                "knowledge_base_id": knowledge_base_id,
+                "chunk_index": i,
+                "metadata": document.metadata
+            }
+        ))
+    return chunks
+
+
+class RAGService:
+    """Chunking, embedding and retrieval over per-agent knowledge bases"""
+
+    def __init__(
+        self,
+        index: Optional[VectorIndex] = None,
+        embedder: Optional[Embedder] = None,
+        top_k: Optional[int] = None,
+        score_threshold: Optional[float] = None,
+        embed_batch_size: int = 256,
+        lexical: Optional[LexicalIndex] = None,
+        hybrid: Optional[bool] = None,
+        candidates: Optional[int] = None,
+        shortcircuit_margin: Optional[float] = None
+    ):
+        self.index = index or create_index()
+        self.embedder = embedder or get_embedder()
+        self.top_k = top_k or settings.RAG_TOP_K
+        self.score_threshold = settings.RAG_SCORE_THRESHOLD if score_threshold is None else score_threshold
+        self.embed_batch_size = embed_batch_size
+        hybrid = settings.RAG_HYBRID if hybrid is None else hybrid
+        self.lexical = (lexical or LexicalIndex()) if hybrid else None
+        self.candidates = candidates or settings.RAG_HYBRID_CANDIDATES
+        self.shortcircuit_margin = (
+            settings.RAG_LEXICAL_SHORTCIRCUIT_MARGIN if shortcircuit_margin is None else shortcircuit_margin
+        )
+
+    async def ingest(self, knowledge_base: Dict, documents: List[Document]) -> int:
+        """
+        Chunk, embed and index documents of one knowledge_bases row
+        (id, agent_id, chunk_size, chunk_overlap, embedding_model);
+        returns the number of chunks indexed
+        """
+        agent_id = str(knowledge_base["agent_id"])
+        knowledge_base_id = str(knowledge_base["id"])
+        model = knowledge_base.get("embedding_model")
+        if model and model != self.embedder.model_name:
+            logger.warning(
+                f"Knowledge base {knowledge_base_id} expects {model}, embedding with {self.embedder.model_name}"
+            )
+
+        batch: List[Chunk] = []
+        indexed = 0
+        started = time.perf_counter()
+        for document in documents:
+            batch.extend(document_chunks(knowledge_base, document))
+            # Embed in fixed-size batches so memory stays flat for large uploads
+            while len(batch) >= self.embed_batch_size:
+                await self.index_chunks(agent_id, batch[:self.embed_batch_size])
+                indexed += self.embed_batch_size
+                del batch[:self.embed_batch_size]
+
+        if batch:
+            await self.index_chunks(agent_id, batch)
+            indexed += len(batch)
+        await self.commit(agent_id)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Indexed {indexed} chunks from {len(documents)} documents for agent {agent_id} "
+            f"in {elapsed:.1f}s ({indexed / max(elapsed, 1e-6):.0f} chunks/s)"
+        )
+        return indexed
+
+    async def index_chunks(self, agent_id: str, chunks: List[Chunk]):
+        """Embed and index chunks (replacing any with the same ids); call commit() when done"""
+        if not chunks:
+            return
+        agent_id = str(agent_id)
+        ids, texts = [chunk.id for chunk in chunks], [chunk.text for chunk in chunks]
+        vectors = await self.embedder.embed_documents(texts)
+        await self.index.upsert(agent_id, ids, vectors, [chunk.payload for chunk in chunks])
+        if self.lexical:
+            await self.lexical.add(agent_id, ids, texts)
+
+    async def delete_chunks(self, agent_id: str, chunk_ids: List[str], commit: bool = True):
+        agent_id = str(agent_id)
+        await self.index.delete(agent_id, chunk_ids)
+        if self.lexical:
+            await self.lexical.delete(agent_id, chunk_ids)
+        if commit:
+            await self.commit(agent_id)
+
+    async def commit(self, agent_id: str):
+        """Persist the keyword index after a batch of changes (the vector index persists on its own)"""
+        if self.lexical:
+            await self.lexical.save(str(agent_id))
+
+    async def search(
+        self,
+        agent_id: str,
+        query: str,
+        top_k: Optional[int] = None,
+        score_threshold: Optional[float] = None
+    ) -> List[RetrievedChunk]:
+        """
+        Chunks most relevant to the query, best first. Scores are cosine
+        similarity for vector-only results, reciprocal rank fusion scores
+        for hybrid ones and BM25 for keyword-only answers
+        """
+        agent_id = str(agent_id)
+        top_k = top_k or self.top_k
+        if not query.strip() or await self.index.count(agent_id) == 0:
+            return []  # no knowledge base: skip embedding the query
+
+        lexical = await self.lexical.search(agent_id, query, top_k=self.candidates) if self.lexical else []
+        answer = self._lexical_answer(lexical, top_k)
+        if answer:
+            scores = {hit.id: hit.score for hit in answer}
+            return await self._retrieve(agent_id, [hit.id for hit in answer], scores)
+
+        vector = await self.embedder.embed_query(query)
+        hits = await self.index.search(
+            agent_id,
+            vector,
+            top_k=max(top_k, self.candidates) if lexical else top_k,
+            score_threshold=self.score_threshold if score_threshold is None else score_threshold
+        )
+        if not lexical:
+            return [self._chunk(hit, hit.score) for hit in hits[:top_k]]
+
+        fused: Dict[str, float] = {}
+        keyword = [hit.id for hit in lexical if hit.coverage >= _FUSE_COVERAGE]
+        for ranking in ([hit.id for hit in hits], keyword):
+            for rank, chunk_id in enumerate(ranking, 1):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (_RRF_K + rank)
+        best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+        return await self._retrieve(agent_id, best, fused, {hit.id: hit for hit in hits})
+
+    def _lexical_answer(self, hits: List[LexicalHit], top_k: int) -> List[LexicalHit]:
+        """Keyword hits to answer with when the best one matches (nearly) every query term and clearly leads"""
+        if not self.shortcircuit_margin or not hits or hits[0].coverage < _ANSWER_COVERAGE:
+            return []
+        if len(hits) > 1 and hits[0].score < self.shortcircuit_margin * hits[1].score:
+            return []
+        return [hit for hit in hits[:top_k] if hit.coverage >= _ANSWER_COVERAGE]
+
+    async def _retrieve(
+        self,
+        agent_id: str,
+        ids: List[str],
+        scores: Dict[str, float],
+        known: Optional[Dict[str, SearchHit]] = None
+    ) -> List[RetrievedChunk]:
+        """Chunks in the order of ids; payloads not already at hand come from the vector index"""
+        known = dict(known or {})
+        missing = [chunk_id for chunk_id in ids if chunk_id not in known]
+        if missing:
+            known.update({hit.id: hit for hit in await self.index.retrieve(agent_id, missing)})
+        return [self._chunk(known[chunk_id], scores[chunk_id]) for chunk_id in ids if chunk_id in known]
+
+    @staticmethod
+    def _chunk(hit: SearchHit, score: float) -> RetrievedChunk:
+        return RetrievedChunk(
+            id=hit.id,
+            text=hit.payload.get("text", ""),
+            score=score,
+            document_id=hit.payload.get("document_id"),
+            knowledge_base_id=hit.payload.get("knowledge_base_id")
+        )
+
+
+_rag_service: Optional[RAGService] = None
+
+
+def get_rag_service() -> RAGService:
+    """Process-wide service, so the index and embedding model are shared"""
+    global _rag_service
+    if _rag_service is None:
+        _rag_service = RAGService()
+    return _rag_service
@@ -0,0 +1,420 @@
+"""
+Vector Index Backends
+
+Chunk vectors stored per agent, searched by cosine similarity:
+
+- QdrantIndex: one Qdrant collection (settings.QDRANT_URL) shared by all
+  agents, filtered on an indexed agent_id payload field
+- EmbeddingStore (embedding_store.py): quantized, memory-mapped per-agent
+  files for many agents on one node
+- NumpyIndex: in-process exact search over one float32 matrix per agent,
+  for single-node deployments and tests. Searches run in a worker thread
+  on a snapshot of the matrix, so writers never block readers; deleted
+  rows are masked and compacted away once they pile up. Concurrent
+  queries for one agent are scored together in a single scan
+"""
+
+import asyncio
+import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_ROWS = 65536  # rows scored per step of a scan
+
+
+@dataclass
+class SearchHit:
+    id: str
+    score: float  # cosine similarity
+    payload: Dict
+
+
+class VectorIndex(ABC):
+    """Per-agent chunk vectors"""
+
+    @abstractmethod
+    async def upsert(self, agent_id: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        pass
+
+    @abstractmethod
+    async def delete(self, agent_id: str, ids: List[str]):
+        pass
+
+    @abstractmethod
+    async def search(
+        self,
+        agent_id: str,
+        vector: np.ndarray,
+        top_k: int = 3,
+        score_threshold: Optional[float] = None
+    ) -> List[SearchHit]:
+        """Best matches first; none scoring below score_threshold"""
+        pass
+
+    @abstractmethod
+    async def retrieve(self, agent_id: str, ids: List[str]) -> List[SearchHit]:
+        """Stored chunks by id (score 0.0), unknown ids skipped"""
+        pass
+
+    @abstractmethod
+    async def count(self, agent_id: str) -> int:
+        pass
+
+    async def close(self):
+        pass
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    vectors: np.ndarray  # capacity rows; only the first `size` are valid
+    alive: np.ndarray
+    ids: List[str]
+    payloads: List[Dict]
+    size: int
+    dead: int
+
+
+class _AgentVectors:
+    """One agent's matrix; writers serialize on a lock, readers use the latest snapshot"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.snapshot = _Snapshot(
+            np.empty((0, dimension), dtype=np.float32), np.empty(0, dtype=bool), [], [], 0, 0
+        )
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        with self._lock:
+            s = self.snapshot
+            dead = s.dead
+            for chunk_id in ids:
+                row = self.rows.pop(chunk_id, None)
+                if row is not None:
+                    s.alive[row] = False
+                    dead += 1
+
+            vectors_, alive = s.vectors, s.alive
+            size = s.size + len(ids)
+            if size > len(vectors_):
+                capacity = max(size, 2 * len(vectors_), 1024)
+                vectors_ = np.empty((capacity, self.dimension), dtype=np.float32)
+                vectors_[:s.size] = s.vectors[:s.size]
+                alive = np.zeros(capacity, dtype=bool)
+                alive[:s.size] = s.alive[:s.size]
+
+            # Rows past the published size are invisible to readers until the swap below
+            vectors_[s.size:size] = vectors
+            alive[s.size:size] = True
+            s.ids.extend(ids)
+            s.payloads.extend(payloads)
+            for row, chunk_id in enumerate(ids, s.size):
+                self.rows[chunk_id] = row
+            self.snapshot = _Snapshot(vectors_, alive, s.ids, s.payloads, size, dead)
+            self._maybe_compact()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            s = self.snapshot
+            dead = s.dead
+            for chunk_id in ids:
+                row = self.rows.pop(chunk_id, None)
+                if row is not None:
+                    s.alive[row] = False
+                    dead += 1
+            self.snapshot = _Snapshot(s.vectors, s.alive, s.ids, s.payloads, s.size, dead)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        s = self.snapshot
+        if s.dead < 1024 or s.dead * 4 < s.size:
+            return
+        keep = np.flatnonzero(s.alive[:s.size])
+        ids = [s.ids[row] for row in keep]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self.snapshot = _Snapshot(
+            s.vectors[keep],
+            np.ones(len(keep), dtype=bool),
+            ids,
+            [s.payloads[row] for row in keep],
+            len(keep),
+            0
+        )
+
+    @property
+    def count(self) -> int:
+        return self.snapshot.size - self.snapshot.dead
+
+    def retrieve(self, ids: List[str]) -> List[SearchHit]:
+        s = self.snapshot
+        hits = []
+        for chunk_id in ids:
+            row = self.rows.get(chunk_id)
+            # The row map may already belong to a newer snapshot: check it against this one
+            if row is not None and row < s.size and s.alive[row] and s.ids[row] == chunk_id:
+                hits.append(SearchHit(chunk_id, 0.0, s.payloads[row]))
+        return hits
+
+    def search_many(
+        self,
+        queries: np.ndarray,
+        top_ks: List[int],
+        thresholds: List[Optional[float]]
+    ) -> List[List[SearchHit]]:
+        """One pass over the matrix for a batch of queries, in row blocks to bound memory"""
+        s = self.snapshot
+        k = min(max(top_ks), s.size)
+        if s.size == s.dead or k <= 0:
+            return [[] for _ in top_ks]
+
+        block_rows, block_scores = [], []
+        for start in range(0, s.size, _BLOCK_ROWS):
+            stop = min(start + _BLOCK_ROWS, s.size)
+            scores = s.vectors[start:stop] @ queries.T  # (rows, queries)
+            if s.dead:
+                scores[~s.alive[start:stop]] = -np.inf
+            kk = min(k, stop - start)
+            top = np.argpartition(-scores, kk - 1, axis=0)[:kk]
+            block_rows.append(top + start)
+            block_scores.append(np.take_along_axis(scores, top, axis=0))
+        rows = np.concatenate(block_rows)
+        scores = np.concatenate(block_scores)
+        order = np.argsort(-scores, axis=0)
+
+        results = []
+        for q, (top_k, threshold) in enumerate(zip(top_ks, thresholds)):
+            hits = []
+            for candidate in order[:top_k, q]:
+                score = float(scores[candidate, q])
+                if score == -np.inf or (threshold is not None and score < threshold):
+                    break
+                row = rows[candidate, q]
+                hits.append(SearchHit(s.ids[row], score, s.payloads[row]))
+            results.append(hits)
+        return results
+
+
+class NumpyIndex(VectorIndex):
+    """
+    Exact in-process search, one matrix per agent. Queries arriving while
+    a scan of the same agent's matrix is running are answered together by
+    the next scan, so concurrent queries share the memory traffic
+    """
+
+    def __init__(self, max_batch: int = 32):
+        self.max_batch = max_batch
+        self._agents: Dict[str, _AgentVectors] = {}
+        self._pending: Dict[str, List[Tuple[np.ndarray, int, Optional[float], asyncio.Future]]] = {}
+        self._scans: Dict[str, asyncio.Task] = {}
+
+    async def upsert(self, agent_id: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        if not ids:
+            return
+        vectors = normalize(vectors)
+        agent = self._agents.get(agent_id)
+        if agent is None:
+            agent = self._agents[agent_id] = _AgentVectors(vectors.shape[1])
+        if vectors.shape[1] != agent.dimension:
+            raise ValueError(f"Expected {agent.dimension}-dimensional vectors, got {vectors.shape[1]}")
+        await asyncio.to_thread(agent.upsert, list(ids), vectors, list(payloads))
+
+    async def delete(self, agent_id: str, ids: List[str]):
+        agent = self._agents.get(agent_id)
+        if agent is not None and ids:
+            await asyncio.to_thread(agent.delete, list(ids))
+
+    async def search(
+        self,
+        agent_id: str,
+        vector: np.ndarray,
+        top_k: int = 3,
+        score_threshold: Optional[float] = None
+    ) -> List[SearchHit]:
+        agent = self._agents.get(agent_id)
+        if agent is None or agent.count == 0:
+            return []
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(agent_id, []).append((normalize(vector), top_k, score_threshold, future))
+        scan = self._scans.get(agent_id)
+        if scan is None or scan.done():
+            self._scans[agent_id] = asyncio.create_task(self._scan(agent_id, agent))
+        return await future
+
+    async def _scan(self, agent_id: str, agent: _AgentVectors):
+        pending = self._pending[agent_id]
+        while pending:
+            batch = pending[:self.max_batch]
+            del pending[:self.max_batch]
+            try:
+                results = await asyncio.to_thread(
+                    agent.search_many,
+                    np.stack([query for query, _, _, _ in batch]),
+                    [top_k for _, top_k, _, _ in batch],
+                    [threshold for _, _, threshold, _ in batch]
+                )
+                for (_, _, _, future), hits in zip(batch, results):
+                    if not future.done():
+                        future.set_result(hits)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def retrieve(self, agent_id: str, ids: List[str]) -> List[SearchHit]:
+        agent = self._agents.get(agent_id)
+        return agent.retrieve(ids) if agent else []
+
+    async def count(self, agent_id: str) -> int:
+        agent = self._agents.get(agent_id)
+        return agent.count if agent else 0
+
+
+_POINT_NAMESPACE = uuid.UUID("6f1c7d3e-2b8a-4f5e-9c1d-0a7b3e5f2d41")
+
+
+class QdrantIndex(VectorIndex):
+    """All agents in one collection, filtered by the agent_id payload field"""
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        collection: Optional[str] = None,
+        location: Optional[str] = None  # ":memory:" runs qdrant-client's local mode
+    ):
+        from qdrant_client import AsyncQdrantClient
+
+        self.collection = collection or settings.RAG_QDRANT_COLLECTION
+        self._client = AsyncQdrantClient(location=location) if location else AsyncQdrantClient(url=url or settings.QDRANT_URL)
+        self._ready = False
+        self._creating = asyncio.Lock()
+
+    async def upsert(self, agent_id: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict]):
+        from qdrant_client import models
+
+        if not ids:
+            return
+        vectors = normalize(vectors)
+        await self._ensure_collection(vectors.shape[1])
+        await self._client.upsert(
+            self.collection,
+            points=[
+                models.PointStruct(
+                    id=self._point_id(agent_id, chunk_id),
+                    vector=vector.tolist(),
+                    payload={**payload, "agent_id": agent_id, "chunk_id": chunk_id}
+                )
+                for chunk_id, vector, payload in zip(ids, vectors, payloads)
+            ]
+        )
+
+    async def delete(self, agent_id: str, ids: List[str]):
+        from qdrant_client import models
+
+        if not ids or not await self._exists():
+            return
+        await self._client.delete(
+            self.collection,
+            points_selector=models.PointIdsList(points=[self._point_id(agent_id, chunk_id) for chunk_id in ids])
+        )
+
+    async def search(
+        self,
+        agent_id: str,
+        vector: np.ndarray,
+        top_k: int = 3,
+        score_threshold: Optional[float] = None
+    ) -> List[SearchHit]:
+        if not await self._exists():
+            return []
+        results = await self._client.search(
+            self.collection,
+            query_vector=normalize(vector).tolist(),
+            query_filter=self._agent_filter(agent_id),
+            limit=top_k,
+            score_threshold=score_threshold,
+            with_payload=True
+        )
+        return [SearchHit(r.payload.get("chunk_id", str(r.id)), r.score, r.payload) for r in results]
+
+    async def retrieve(self, agent_id: str, ids: List[str]) -> List[SearchHit]:
+        if not ids or not await self._exists():
+            return []
+        records = await self._client.retrieve(
+            self.collection,
+            ids=[self._point_id(agent_id, chunk_id) for chunk_id in ids],
+            with_payload=True
+        )
+        return [SearchHit(r.payload.get("chunk_id", str(r.id)), 0.0, r.payload) for r in records]
+
+    async def count(self, agent_id: str) -> int:
+        if not await self._exists():
+            return 0
+        result = await self._client.count(self.collection, count_filter=self._agent_filter(agent_id), exact=True)
+        return result.count
+
+    async def close(self):
+        await self._client.close()
+
+    def _agent_filter(self, agent_id: str):
+        from qdrant_client import models
+        return models.Filter(must=[models.FieldCondition(key="agent_id", match=models.MatchValue(value=agent_id))])
+
+    def _point_id(self, agent_id: str, chunk_id: str) -> str:
+        # Qdrant point ids must be UUIDs or integers
+        return str(uuid.uuid5(_POINT_NAMESPACE, f"{agent_id}:{chunk_id}"))
+
+    async def _exists(self) -> bool:
+        if not self._ready:
+            try:
+                await self._client.get_collection(self.collection)
+                self._ready = True
+            except Exception:
+                return False
+        return True
+
+    async def _ensure_collection(self, dimension: int):
+        if self._ready:
+            return
+        from qdrant_client import models
+
+        async with self._creating:
+            if await self._exists():
+                return
+            await self._client.create_collection(
+                self.collection,
+                vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE)
+            )
+            await self._client.create_payload_index(
+                self.collection, "agent_id", field_schema=models.PayloadSchemaType.KEYWORD
+            )
+            self._ready = True
+
+
+def create_index(backend: Optional[str] = None) -> VectorIndex:
+    """settings.RAG_INDEX_BACKEND: "qdrant", "numpy" or "mmap" """
+    backend = (backend or settings.RAG_INDEX_BACKEND).lower()
+    if backend == "qdrant":
+        return QdrantIndex()
+    if backend == "numpy":
+        return NumpyIndex()
+    if backend == "mmap":
+        from app.services.embedding_store import EmbeddingStore
+        return EmbeddingStore()
+    raise ValueError(f"Unknown RAG index backend: {backend}")
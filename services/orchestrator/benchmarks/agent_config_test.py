@@ -0,0 +1,138 @@
+"""
+Agent config cache: database round-trips per chat turn
+
+Simulates --agents agents behind a stand-in for the agents/users query
+that answers after --db-ms and counts queries, and looks up the agent of
+each of --turns chat turns (skewed towards busy agents) as chat_service
+does:
+
+- no cache: one query per turn, the pre-cache baseline
+- steady state: preloaded cache, changes announced for --changes agents
+  while the turns run (each costs one refresh)
+- slow database: every entry expired and the database answering after
+  --slow-db-ms; turns are answered from the stale entries after the
+  refresh timeout instead of waiting
+
+    python benchmarks/agent_config_test.py --agents 10000 --turns 50000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.agent_config import AgentConfig, AgentConfigCache  # noqa: E402
+
+
+class FakeAgents:
+    """The agents JOIN users query: answers after a delay, counts queries"""
+
+    def __init__(self, agents: int, latency: float):
+        self.latency = latency
+        self.queries = 0
+        self.rows = {}
+        for _ in range(agents):
+            agent_id = str(uuid.uuid4())
+            self.rows[agent_id] = AgentConfig(
+                id=agent_id,
+                user_id=str(uuid.uuid4()),
+                name="Agent",
+                user_tier=random.choice(["free", "starter", "pro", "enterprise"]),
+                system_prompt="You are a helpful assistant."
+            )
+        self.ids = sorted(self.rows)
+
+    async def load(self, agent_ids, after, limit):
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        if agent_ids is not None:
+            return [self.rows[agent_id] for agent_id in agent_ids if agent_id in self.rows]
+        start = 0 if after is None else self.ids.index(after) + 1
+        return [self.rows[agent_id] for agent_id in self.ids[start:start + limit]]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+
+async def run_turns(lookup, agent_ids, args, rng, on_turn=None) -> dict:
+    latencies = []
+
+    async def turn(agent_id):
+        started = time.perf_counter()
+        await lookup(agent_id)
+        latencies.append(time.perf_counter() - started)
+
+    for i in range(args.turns // args.concurrency):
+        if on_turn:
+            on_turn(i)
+        await asyncio.gather(*(
+            turn(agent_ids[min(int(rng.paretovariate(1.1)) - 1, len(agent_ids) - 1)])
+            for _ in range(args.concurrency)
+        ))
+    return {"p50_ms": percentile(latencies, 0.5), "p99_ms": percentile(latencies, 0.99), "max_ms": percentile(latencies, 1.0)}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=50000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=100)
+    parser.add_argument("--db-ms", type=float, default=2.0)
+    parser.add_argument("--slow-db-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    random.seed(0)
+    database = FakeAgents(args.agents, args.db_ms / 1000)
+    agent_ids = list(database.rows)
+    rng = random.Random(0)
+    results = {}
+
+    latency = await run_turns(lambda agent_id: database.load([agent_id], None, 1), agent_ids, args, rng)
+    results["no_cache"] = {"queries_per_turn": round(database.queries / args.turns, 3), **latency}
+
+    cache = AgentConfigCache(ttl=300, refresh_timeout=0.1, invalidation="none", loader=database.load)
+    database.queries = 0
+    started = time.perf_counter()
+    await cache.start()
+    results["preload"] = {"agents": cache.stats()["agents"], "queries": database.queries,
+                          "seconds": round(time.perf_counter() - started, 2)}
+
+    database.queries = 0
+    rounds = args.turns // args.concurrency
+    changed = rng.sample(agent_ids[:args.changes * 2], args.changes)  # busy agents, so the change is seen
+    latency = await run_turns(
+        cache.get, agent_ids, args, rng,
+        on_turn=lambda i: i % max(1, rounds // args.changes) == 0 and changed and cache.invalidate(changed.pop())
+    )
+    results["steady_state"] = {
+        "queries_per_turn": round(database.queries / args.turns, 5),
+        "queries": database.queries,
+        "announced_changes": args.changes,
+        **latency
+    }
+
+    database.latency = args.slow_db_ms / 1000
+    database.queries = 0
+    cache.invalidate("*")
+    before = cache.stats()
+    latency = await run_turns(cache.get, agent_ids, args, rng)
+    results["slow_database"] = {
+        "stale_served": cache.stats()["stale_served"] - before["stale_served"],
+        "queries": database.queries,
+        **latency
+    }
+    await asyncio.sleep(args.slow_db_ms / 1000)  # let abandoned refreshes finish
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Conversation history: database reads per chat turn and window latency
+
+Replays --turns chat turns spread over --conversations concurrent
+conversations (a few busy ones, a long tail) through ConversationHistory,
+with a stand-in for the messages table that answers after --db-ms and
+counts reads and batched writes. Each turn reads its token-bounded window,
+then records the user message and the reply, as chat_service does.
+
+Compared:
+
+- no hot tier: every turn reads its history from the database
+- the in-process hot tier sized for every active conversation
+- a hot tier holding a tenth of them (least recently used evicted)
+
+    python benchmarks/conversation_history_test.py --conversations 2000 --turns 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.conversation_history import ConversationHistory, Turn  # noqa: E402
+
+AGENT = str(uuid.uuid4())
+WORDS = "order refund shipping invoice account password delivery warranty return billing card tracking".split()
+
+
+class FakeMessages:
+    """The messages table: answers after a delay, counts queries"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.rows = {}
+        self.reads = 0
+        self.write_batches = 0
+
+    async def load(self, conversation_id, limit):
+        self.reads += 1
+        await asyncio.sleep(self.latency)
+        return [Turn.of(role, content) for role, content in self.rows.get(conversation_id, [])[-limit:]]
+
+    async def write(self, rows):
+        self.write_batches += 1
+        await asyncio.sleep(self.latency)
+        for row in rows:
+            self.rows.setdefault(row["conversation_id"], []).append((row["role"], row["content"]))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+async def replay(args, max_conversations: int, read_through: bool = False) -> dict:
+    rng = random.Random(0)
+    table = FakeMessages(args.db_ms / 1000)
+    history = ConversationHistory(
+        backend="memory",
+        max_conversations=max_conversations,
+        context_tokens=args.context_tokens,
+        flush_interval=0.05,
+        loader=table.load,
+        writer=table.write
+    )
+    conversations = [str(uuid.uuid4()) for _ in range(args.conversations)]
+    started = set()
+    latencies, window_tokens = [], []
+
+    async def turn(conversation_id):
+        begin = time.perf_counter()
+        if conversation_id not in started:
+            started.add(conversation_id)
+            await history.start(conversation_id)
+        elif read_through:
+            # No hot tier: what chat() would do reading history straight from the database
+            await history.tier.put(conversation_id, await table.load(conversation_id, history.max_turns))
+        window = await history.window(conversation_id)
+        latencies.append(time.perf_counter() - begin)
+        window_tokens.append(window.tokens)
+        await history.append(conversation_id, AGENT, [
+            {"role": "user", "content": sentence(rng, rng.randint(5, 30))},
+            {"role": "assistant", "content": sentence(rng, rng.randint(20, 120))}
+        ])
+
+    # Busy conversations take most turns: Pareto-distributed choice
+    for _ in range(args.turns // args.concurrency):
+        batch = {
+            conversations[min(int(rng.paretovariate(1.2)) - 1, len(conversations) - 1) if rng.random() < 0.5
+                          else rng.randrange(len(conversations))]
+            for _ in range(args.concurrency)
+        }
+        await asyncio.gather(*(turn(conversation_id) for conversation_id in batch))
+    await history.close()
+
+    turns = len(latencies)
+    return {
+        "turns": turns,
+        "database_reads_per_turn": round(table.reads / turns, 3),
+        "database_write_batches": table.write_batches,
+        "rows_written": history.stats()["rows_written"],
+        "window_latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        "mean_window_tokens": round(sum(window_tokens) / turns, 1)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--db-ms", type=float, default=2.0)
+    parser.add_argument("--context-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "no_hot_tier": await replay(args, max_conversations=args.conversations, read_through=True),
+        "hot_tier_all": await replay(args, max_conversations=args.conversations),
+        "hot_tier_tenth": await replay(args, max_conversations=max(1, args.conversations // 10))
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
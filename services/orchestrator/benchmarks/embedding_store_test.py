@@ -0,0 +1,193 @@
+"""
+Quantized embedding store: many tenants, one large knowledge base
+
+Synthetic unit vectors drawn around random topic centers (embeddings of
+real text cluster; uniform noise would not), MiniLM's 384 dimensions:
+
+- tenants: --agents knowledge bases of --chunks-per-agent chunks, then
+  --queries searches on random agents with at most --max-loaded agents
+  open; reports the memory of the query phase next to what the same
+  vectors would take as float32 in RAM (mapped file pages are page cache
+  the kernel can drop; anonymous memory is what the store holds)
+- large: one agent with --large-chunks chunks (clustered into IVF lists
+  as it grows); query latency and recall@top_k against exact search
+
+    python benchmarks/embedding_store_test.py --agents 2000 --large-chunks 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embedding_store import EmbeddingStore  # noqa: E402
+from app.services.vector_index import normalize  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+
+def rss_mb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) // 1024 for line in f if line.startswith(field))
+
+
+def query_phase_memory(baseline: int) -> dict:
+    return {
+        "start_mb": baseline,
+        "peak_rss_mb": rss_mb("VmHWM"),
+        "anon_mb": rss_mb("RssAnon"),
+        "mapped_file_mb": rss_mb("RssFile")
+    }
+
+
+def reset_peak_rss():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def disk_mb(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files) // (1024 * 1024)
+
+
+class Corpus:
+    """Deterministic clustered vectors, regenerated block by block instead of kept in RAM"""
+
+    def __init__(self, dim: int, topics: int, seed: int):
+        self.dim = dim
+        self.seed = seed
+        self.centers = np.random.default_rng(seed).standard_normal((topics, dim), dtype=np.float32)
+
+    def block(self, index: int, rows: int) -> np.ndarray:
+        rng = np.random.default_rng((self.seed, index))
+        topics = rng.integers(0, len(self.centers), rows)
+        return normalize(self.centers[topics] + 0.6 * rng.standard_normal((rows, self.dim), dtype=np.float32))
+
+
+async def tenants(args, root: str) -> dict:
+    store = EmbeddingStore(root, max_loaded_agents=args.max_loaded, ivf_min_rows=args.ivf_min_rows)
+    corpus = Corpus(args.dim, 200, seed=1)
+    started = time.perf_counter()
+    for agent in range(args.agents):
+        vectors = corpus.block(agent, args.chunks_per_agent)
+        await store.upsert(
+            f"agent-{agent}",
+            [f"c{i}" for i in range(args.chunks_per_agent)],
+            vectors,
+            [{"text": f"agent {agent} chunk {i}"} for i in range(args.chunks_per_agent)]
+        )
+    ingest_s = time.perf_counter() - started
+    await store.close()
+
+    rng = np.random.default_rng(2)
+    reset_peak_rss()
+    baseline = rss_mb("VmRSS")
+    latencies = []
+    for _ in range(args.queries):
+        agent = int(rng.integers(0, args.agents))
+        query = corpus.block(agent, 1)[0]
+        started = time.perf_counter()
+        await store.search(f"agent-{agent}", query, top_k=args.top_k)
+        latencies.append(time.perf_counter() - started)
+
+    chunks = args.agents * args.chunks_per_agent
+    return {
+        "agents": args.agents,
+        "chunks": chunks,
+        "ingest_s": round(ingest_s, 1),
+        "disk_mb": disk_mb(root),
+        "float32_in_ram_mb": chunks * args.dim * 4 // (1024 * 1024),
+        "query_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        "agent_loads": store.loads,
+        "query_phase_memory": query_phase_memory(baseline)
+    }
+
+
+async def large(args, root: str) -> dict:
+    store = EmbeddingStore(root, ivf_min_rows=args.ivf_min_rows)
+    corpus = Corpus(args.dim, 2000, seed=3)
+    blocks = range(0, args.large_chunks, args.batch)
+    started = time.perf_counter()
+    for i, offset in enumerate(blocks):
+        n = min(args.batch, args.large_chunks - offset)
+        await store.upsert(
+            "large",
+            [str(offset + j) for j in range(n)],
+            corpus.block(i, n),
+            [{"text": f"chunk {offset + j}"} for j in range(n)]
+        )
+    ingest_s = time.perf_counter() - started
+
+    rng = np.random.default_rng(4)
+    queries = normalize(
+        corpus.centers[rng.integers(0, len(corpus.centers), args.large_queries)]
+        + 0.6 * rng.standard_normal((args.large_queries, args.dim), dtype=np.float32)
+    )
+
+    # Exact top_k by streaming over the regenerated corpus
+    best = [[] for _ in queries]
+    for i, offset in enumerate(blocks):
+        n = min(args.batch, args.large_chunks - offset)
+        scores = corpus.block(i, n) @ queries.T
+        for q in range(len(queries)):
+            top = np.argpartition(-scores[:, q], args.top_k - 1)[:args.top_k]
+            best[q] = sorted(best[q] + [(float(scores[t, q]), str(offset + t)) for t in top], reverse=True)[:args.top_k]
+
+    reset_peak_rss()
+    baseline = rss_mb("VmRSS")
+    latencies, found = [], 0
+    for q, query in enumerate(queries):
+        started = time.perf_counter()
+        hits = await store.search("large", query, top_k=args.top_k)
+        latencies.append(time.perf_counter() - started)
+        found += len({h.id for h in hits} & {chunk_id for _, chunk_id in best[q]})
+
+    return {
+        "chunks": await store.count("large"),
+        "ingest_s": round(ingest_s, 1),
+        "disk_mb": disk_mb(root),
+        "float32_in_ram_mb": args.large_chunks * args.dim * 4 // (1024 * 1024),
+        "query_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        f"recall_at_{args.top_k}": round(found / (len(queries) * args.top_k), 3),
+        "query_phase_memory": query_phase_memory(baseline)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--chunks-per-agent", type=int, default=250)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-loaded", type=int, default=256)
+    parser.add_argument("--large-chunks", type=int, default=1_000_000)
+    parser.add_argument("--large-queries", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--ivf-min-rows", type=int, default=50_000)
+    parser.add_argument("--dir", default=None, help="defaults to a temporary directory")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="embedding-store-")
+    try:
+        results = {"tenants": await tenants(args, os.path.join(root, "tenants"))}
+        if args.large_chunks:
+            results["large"] = await large(args, os.path.join(root, "large"))
+        print(json.dumps(results, indent=2))
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
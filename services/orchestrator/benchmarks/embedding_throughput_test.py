@@ -0,0 +1,131 @@
+"""
+Embedding throughput: micro-batching, caches and the worker process
+
+Runs settings.EMBEDDING_MODEL (sentence-transformers must be installed and
+the model downloadable or cached) and reports embeddings per second for:
+
+- sequential queries: one model call each, the pre-batching baseline
+- --concurrency concurrent queries, micro-batched into shared model calls
+- the same queries again, served from the query cache
+- ingestion of one knowledge base uploaded by --agents agents, where the
+  content-hash cache embeds the shared chunks once
+
+with the worst event loop delay while the model is busy, once with the
+dedicated worker process and once with a worker thread.
+
+    python benchmarks/embedding_throughput_test.py --concurrency 64 --agents 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embeddings import Embedder  # noqa: E402
+
+WORDS = (
+    "order refund shipping invoice account password reset delivery warranty return "
+    "subscription cancel upgrade billing address payment card tracking support hours "
+    "store location discount coupon size exchange damaged missing item email phone"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "?"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def timed_query(embedder: Embedder, text: str) -> float:
+    started = time.perf_counter()
+    await embedder.embed_query(text)
+    return time.perf_counter() - started
+
+
+async def run(args, worker_process: bool) -> dict:
+    rng = random.Random(0)
+    embedder = Embedder(worker_process=worker_process)
+    await embedder.dimension()  # load the model outside the measurements
+    results = {}
+
+    queries = [sentence(rng, 8) for _ in range(args.queries)]
+    started = time.perf_counter()
+    for text in queries[:args.concurrency]:
+        await embedder.embed_query(text)
+    elapsed = time.perf_counter() - started
+    results["sequential_queries_per_s"] = round(args.concurrency / elapsed, 1)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    batch = queries[args.concurrency:args.concurrency * 2]
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(timed_query(embedder, text) for text in batch))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    results["concurrent_queries"] = {
+        "per_s": round(len(batch) / elapsed, 1),
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        "max_event_loop_lag_ms": round(await ticker * 1000, 1)
+    }
+
+    latencies = [await timed_query(embedder, text.upper() + "  ") for text in batch]
+    results["cached_query_latency_ms"] = {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)}
+
+    # Every agent uploads the shared FAQ plus a few chunks of its own
+    shared = [" ".join(sentence(rng, 12) for _ in range(6)) for _ in range(args.chunks)]
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    for agent in range(args.agents):
+        own = [f"Agent {agent}: " + sentence(rng, 12) for _ in range(args.chunks // 20)]
+        texts = shared + own
+        for i in range(0, len(texts), 256):
+            await embedder.embed_documents(texts[i:i + 256])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    total = args.agents * (args.chunks + args.chunks // 20)
+    results["ingestion"] = {
+        "chunks": total,
+        "chunks_per_s": round(total / elapsed, 1),
+        "max_event_loop_lag_ms": round(await ticker * 1000, 1)
+    }
+
+    results["embedder"] = embedder.stats()
+    await embedder.close()
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--chunks", type=int, default=500)
+    args = parser.parse_args()
+    args.queries = max(args.queries, args.concurrency * 2)
+
+    print(json.dumps({
+        "worker_process": await run(args, worker_process=True),
+        "worker_thread": await run(args, worker_process=False)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Hybrid (BM25 + vector) retrieval on a synthetic FAQ corpus
+
+--entries FAQ entries in --topics topics, one chunk each. Each entry is
+topic words plus, for a third of them, an identifier (SKU, order number
+or error code). Vectors are generated rather than embedded, so the
+benchmark runs without the model, and mimic how sentence embeddings
+behave:
+
+- an entry's vector is its topic center plus an entry-specific part
+- paraphrase queries share at most one word with their entry, but their
+  vector is close to the entry's (embeddings capture the meaning)
+- identifier queries ("status of order 4821-337") contain the exact
+  identifier, but their vector only lands near the topic (embeddings do
+  not tell one number from another)
+
+Reports recall@top_k and latency for vector-only, keyword-only, hybrid
+(reciprocal rank fusion) and hybrid with the keyword short-circuit,
+plus the share of queries answered without embedding.
+
+    python benchmarks/hybrid_search_test.py --entries 5000 --queries 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.lexical_index import LexicalIndex  # noqa: E402
+from app.services.rag_service import Document, RAGService, document_chunks  # noqa: E402
+from app.services.vector_index import NumpyIndex, normalize  # noqa: E402
+
+AGENT = "faq-agent"
+KB = {"id": "kb", "agent_id": AGENT, "chunk_size": 1000, "chunk_overlap": 0}
+
+
+class LookupEmbedder:
+    """Vectors generated with the corpus, looked up by text; counts query embeddings"""
+
+    model_name = "synthetic"
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+        self.queries = 0
+
+    async def embed_documents(self, texts):
+        return np.stack([self.vectors[text] for text in texts])
+
+    async def embed_query(self, text):
+        self.queries += 1
+        return self.vectors[text]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+
+def build_corpus(args, rng: random.Random, np_rng):
+    def near(vector, spread):
+        """Unit vector around `vector`; spread 1.0 is as much noise as signal"""
+        noise = np_rng.standard_normal(args.dim).astype(np.float32) / np.sqrt(args.dim)
+        return normalize(normalize(vector) + spread * noise)
+
+    syllables = ["ka", "lo", "mi", "ren", "sa", "tu", "vel", "no", "pri", "das", "el", "fo", "gur", "ix"]
+    word = lambda: "".join(rng.choice(syllables) for _ in range(3))  # noqa: E731
+    vocab = [[word() for _ in range(60)] for _ in range(args.topics)]
+    centers = np_rng.standard_normal((args.topics, args.dim)).astype(np.float32)
+
+    entries, vectors = [], {}
+    for i in range(args.entries):
+        topic = i % args.topics
+        words = rng.sample(vocab[topic], 12)
+        identifier = None
+        if i % 3 == 0:
+            identifier = rng.choice([
+                f"SKU-{rng.randint(10000, 99999)}",
+                f"order {rng.randint(1000, 9999)}-{rng.randint(100, 999)}",
+                f"error E{rng.randint(100, 999)}"
+            ])
+            words.insert(rng.randint(0, len(words)), identifier)
+        text = f"Q{i}: " + " ".join(words) + "."
+        vectors[text] = near(centers[topic], 1.0)
+        entries.append({"id": str(i), "topic": topic, "text": text, "words": words, "identifier": identifier})
+
+    queries = []
+    while len(queries) < args.queries:
+        entry = entries[rng.randrange(len(entries))]
+        topic = entry["topic"]
+        if len(queries) % 2 and entry["identifier"]:
+            text = f"what about {entry['identifier']} {rng.choice(vocab[topic])}"
+            vector = near(centers[topic], 1.0)
+            kind = "identifier"
+        else:
+            others = [w for w in vocab[topic] if w not in entry["words"]]
+            text = " ".join(rng.sample(others, 4) + [rng.choice(entry["words"])])
+            vector = near(vectors[entry["text"]], 0.7)
+            kind = "paraphrase"
+        if text in vectors:
+            continue  # each query text needs its own vector
+        vectors[text] = vector
+        target = document_chunks(KB, Document(id=entry["id"], text=entry["text"]))[0].id
+        queries.append({"text": text, "target": target, "kind": kind})
+    return entries, queries, vectors
+
+
+async def measure(search, queries, top_k) -> dict:
+    latencies = []
+    found = {"paraphrase": [0, 0], "identifier": [0, 0]}
+    for query in queries:
+        started = time.perf_counter()
+        ids = await search(query["text"], top_k)
+        latencies.append(time.perf_counter() - started)
+        found[query["kind"]][0] += query["target"] in ids
+        found[query["kind"]][1] += 1
+    return {
+        f"recall_at_{top_k}": {kind: round(hit / max(total, 1), 3) for kind, (hit, total) in found.items()},
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)}
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    entries, queries, vectors = build_corpus(args, random.Random(0), np.random.default_rng(0))
+    embedder = LookupEmbedder(vectors)
+    index, lexical = NumpyIndex(), LexicalIndex(directory="")
+    documents = [Document(id=e["id"], text=e["text"]) for e in entries]
+
+    started = time.perf_counter()
+    await RAGService(index=index, embedder=embedder, lexical=lexical, hybrid=True).ingest(KB, documents)
+    ingest_s = time.perf_counter() - started
+
+    def service(**kwargs) -> RAGService:
+        return RAGService(index=index, embedder=embedder, lexical=lexical, score_threshold=0.0, **kwargs)
+
+    async def lexical_only(text, top_k):
+        return [hit.id for hit in await lexical.search(AGENT, text, top_k)]
+
+    results = {"entries": len(entries), "queries": len(queries), "ingest_s": round(ingest_s, 2)}
+    modes = {
+        "vector": service(hybrid=False),
+        "hybrid": service(hybrid=True, shortcircuit_margin=0),
+        "hybrid_shortcircuit": service(hybrid=True)
+    }
+    results["keyword"] = await measure(lexical_only, queries, args.top_k)
+    for name, rag in modes.items():
+        async def search(text, top_k, rag=rag):
+            return [chunk.id for chunk in await rag.search(AGENT, text, top_k=top_k)]
+        embedded = embedder.queries
+        results[name] = await measure(search, queries, args.top_k)
+        results[name]["embedded_share"] = round((embedder.queries - embedded) / len(queries), 3)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,204 @@
+"""
+Incremental knowledge base sync: chunks embedded, time and memory
+
+Syncs a synthetic knowledge base of --documents documents (a few chunks
+each) through KnowledgeBaseSync, with the in-process index and a hashing
+stand-in for the embedding model (so it runs without it), then:
+
+- re-syncs the same export: nothing should be embedded
+- re-syncs after editing --change-percent of the documents (one sentence
+  each), deleting and adding a few: only the chunks around the edits are
+  embedded, the deleted documents' chunks are removed
+- starts a sync of another edit, stops it halfway (as a shutdown would),
+  and resumes it with a new manager from the manifest: the resumed sync
+  only embeds what the first attempt had not checkpointed
+
+After each step the indexed chunk ids are checked against a fresh
+chunking of the current documents. Peak traced Python memory of the first
+sync (the growing in-process indexes included) is reported next to the
+export size.
+
+    python benchmarks/kb_sync_test.py --documents 5000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.kb_sync import KnowledgeBaseSync  # noqa: E402
+from app.services.lexical_index import LexicalIndex  # noqa: E402
+from app.services.rag_service import Document, RAGService, document_chunks  # noqa: E402
+from app.services.vector_index import NumpyIndex, normalize  # noqa: E402
+
+AGENT = "sync-agent"
+KB = {"id": "kb-1", "agent_id": AGENT, "chunk_size": 512, "chunk_overlap": 50}
+WORDS = (
+    "order refund shipping invoice account password reset delivery warranty return "
+    "subscription cancel upgrade billing address payment card tracking support hours "
+    "store location discount coupon size exchange damaged missing item email phone"
+).split()
+
+
+class HashEmbedder:
+    """Deterministic vectors from the text hash; counts texts embedded"""
+
+    model_name = "hash"
+    dim = 64
+
+    def __init__(self):
+        self.embedded = 0
+
+    async def embed_documents(self, texts):
+        self.embedded += len(texts)
+        rows = [
+            np.random.default_rng(int.from_bytes(hashlib.sha256(t.encode()).digest()[:8], "little"))
+            .standard_normal(self.dim) for t in texts
+        ]
+        return normalize(np.array(rows, dtype=np.float32))
+
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+
+
+def write_export(path: str, documents: dict):
+    with open(path, "w") as f:
+        for document_id, sentences in documents.items():
+            f.write(json.dumps({"id": document_id, "text": " ".join(sentences)}) + "\n")
+
+
+async def indexed_ids(rag: RAGService, documents: dict) -> bool:
+    """Whether the index holds exactly the chunks of the current documents"""
+    expected = {
+        chunk.id for document_id, sentences in documents.items()
+        for chunk in document_chunks(KB, Document(id=document_id, text=" ".join(sentences)))
+    }
+    hits = await rag.index.retrieve(AGENT, list(expected))
+    count = await rag.index.count(AGENT)
+    return len(hits) == len(expected) == count == await rag.lexical.count(AGENT)
+
+
+async def wait(job):
+    while job.status in ("queued", "processing"):
+        await asyncio.sleep(0.01)
+    return job
+
+
+async def step(sync: KnowledgeBaseSync, rag: RAGService, documents: dict) -> dict:
+    embedder = rag.embedder
+    before = embedder.embedded
+    path = sync.spool_path()
+    write_export(path, documents)
+    started = time.perf_counter()
+    job = await wait(await sync.start(KB, path))
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "status": job.status,
+        "chunks_embedded": embedder.embedded - before,
+        "chunks_deleted": job.chunks_deleted,
+        "documents_changed": job.documents_changed,
+        "documents_deleted": job.documents_deleted,
+        "index_matches_documents": await indexed_ids(rag, documents)
+    }
+
+
+def edit(documents: dict, rng: random.Random, percent: float, prefix: str):
+    ids = list(documents)
+    for document_id in rng.sample(ids, max(1, int(len(ids) * percent / 100))):
+        sentences = documents[document_id]
+        sentences[rng.randrange(len(sentences))] = sentence(rng)
+    for document_id in rng.sample(ids, max(1, len(ids) // 200)):
+        del documents[document_id]
+    for i in range(max(1, len(ids) // 200)):
+        documents[f"{prefix}-{i}"] = [sentence(rng) for _ in range(rng.randint(10, 30))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--change-percent", type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    documents = {f"doc-{i}": [sentence(rng) for _ in range(rng.randint(10, 30))] for i in range(args.documents)}
+    directory = tempfile.mkdtemp(prefix="kb-sync-")
+    try:
+        rag = RAGService(
+            index=NumpyIndex(),
+            embedder=HashEmbedder(),
+            lexical=LexicalIndex(directory=os.path.join(directory, "lexical")),
+            hybrid=True
+        )
+        recorded = {}
+
+        async def record(knowledge_base_id, documents_count):
+            recorded[knowledge_base_id] = documents_count  # the knowledge_bases row update
+
+        sync = KnowledgeBaseSync(
+            rag=rag, directory=os.path.join(directory, "sync"), checkpoint_interval=0, recorder=record
+        )
+        results = {}
+
+        tracemalloc.start()
+        results["initial"] = await step(sync, rag, documents)
+        results["initial"]["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+        results["initial"]["export_mb"] = round(
+            sum(len(json.dumps({"id": k, "text": " ".join(v)})) + 1 for k, v in documents.items()) / 2 ** 20, 1
+        )
+        results["unchanged"] = await step(sync, rag, documents)
+
+        edit(documents, rng, args.change_percent, "added")
+        results["edited"] = await step(sync, rag, documents)
+        results["edited"]["full_reingest_chunks"] = results["initial"]["chunks_embedded"]
+
+        # Interrupted and resumed: stop the sync halfway through the export
+        edit(documents, rng, args.change_percent * 5, "added-again")
+        path = sync.spool_path()
+        write_export(path, documents)
+        before = rag.embedder.embedded
+        job = await sync.start(KB, path)
+        while job.bytes_read < os.path.getsize(path) / 2:
+            await asyncio.sleep(0)
+        await sync.close()
+        interrupted = rag.embedder.embedded - before
+
+        restarted = KnowledgeBaseSync(
+            rag=rag, directory=os.path.join(directory, "sync"), checkpoint_interval=0, recorder=record
+        )
+        [resumed] = await restarted.resume_pending()
+        await wait(resumed)
+        total = rag.embedder.embedded - before
+
+        before = rag.embedder.embedded
+        results["interrupted"] = {
+            "stopped_at_progress": round(job.bytes_read / job.bytes_total, 2),
+            "chunks_embedded_before_stop": interrupted,
+            "chunks_embedded_after_resume": total - interrupted,
+            "resumed_status": resumed.status,
+            "same_job_id": resumed.id == job.id,
+            "index_matches_documents": await indexed_ids(rag, documents)
+        }
+        check = await step(restarted, rag, documents)
+        results["interrupted"]["chunks_embedded_on_resync"] = rag.embedder.embedded - before
+        results["interrupted"]["resync_status"] = check["status"]
+        results["recorded_documents_count"] = recorded.get(KB["id"])
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+RAG search latency at scale (in-process NumPy index)
+
+Fills one agent's index with --chunks random unit vectors (MiniLM's 384
+dimensions by default), then measures:
+
+- sequential query latency (p50/p95), with top-1 recall for queries that
+  are noisy copies of stored chunks
+- --concurrency queries at once, while a ticker measures how late the
+  event loop runs (searches happen in worker threads)
+
+No embedding model is involved; query vectors are generated directly.
+
+    python benchmarks/rag_search_test.py --chunks 1000000 --queries 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.vector_index import NumpyIndex, normalize  # noqa: E402
+
+AGENT = "bench-agent"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+def peak_rss_mb() -> int:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) // 1024 for line in f if line.startswith("VmHWM"))
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = NumpyIndex()
+    started = time.perf_counter()
+    samples = {}
+    for offset in range(0, args.chunks, args.batch):
+        n = min(args.batch, args.chunks - offset)
+        vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+        for row in rng.integers(0, n, size=max(1, args.queries // (args.chunks // args.batch or 1))):
+            samples[str(offset + row)] = vectors[row].copy()
+        await index.upsert(
+            AGENT,
+            [str(offset + i) for i in range(n)],
+            vectors,
+            [{"text": f"chunk {offset + i}"} for i in range(n)]
+        )
+    ingest_s = time.perf_counter() - started
+
+    # Sequential: noisy copies of stored vectors, so the stored one should come back first
+    targets = list(samples.items())[:args.queries]
+    latencies, found = [], 0
+    for chunk_id, vector in targets:
+        query = normalize(vector) + rng.standard_normal(args.dim, dtype=np.float32) * 0.02
+        started = time.perf_counter()
+        hits = await index.search(AGENT, query, top_k=args.top_k)
+        latencies.append(time.perf_counter() - started)
+        found += bool(hits) and hits[0].id == chunk_id
+
+    # Concurrent, with the event loop ticking alongside
+    queries = [rng.standard_normal(args.dim, dtype=np.float32) for _ in range(args.concurrency)]
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(index.search(AGENT, q, top_k=args.top_k) for q in queries))
+    concurrent_s = time.perf_counter() - started
+    stop.set()
+    worst_lag = await ticker
+
+    print(json.dumps({
+        "chunks": await index.count(AGENT),
+        "dimension": args.dim,
+        "ingest_s": round(ingest_s, 1),
+        "query_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+        "top1_recall": round(found / len(targets), 3),
+        "concurrent": {
+            "queries": args.concurrency,
+            "wall_ms": round(concurrent_s * 1000, 1),
+            "max_event_loop_lag_ms": round(worst_lag * 1000, 1)
+        },
+        "peak_rss_mb": peak_rss_mb()
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())